@@ -0,0 +1,179 @@
+"""Data usage accounting from ^DSFLOWRPT reports.
+
+The modem reports cumulative byte counters for the current session. The
+TrafficAccountant turns them into deltas, starts a new session whenever
+the counters go backwards (a reconnect), and aggregates usage per
+session, hour and day (UTC) in a small sqlite database. The last seen
+counters are stored with the aggregates, so restarting the process in the
+middle of a session does not count the session twice.
+"""
+
+import sqlite3
+import threading
+import time
+from humod import actions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    account TEXT NOT NULL,
+    period TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    tx INTEGER NOT NULL,
+    rx INTEGER NOT NULL,
+    PRIMARY KEY (account, period, start));
+CREATE TABLE IF NOT EXISTS counters (
+    account TEXT PRIMARY KEY,
+    session INTEGER NOT NULL,
+    uptime INTEGER NOT NULL,
+    tx INTEGER NOT NULL,
+    rx INTEGER NOT NULL);
+"""
+
+UPSERT_USAGE = """
+INSERT INTO usage (account, period, start, tx, rx) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (account, period, start)
+DO UPDATE SET tx = tx + excluded.tx, rx = rx + excluded.rx
+"""
+
+PERIODS = {'hour': 3600, 'day': 86400}
+# Seconds of disagreement tolerated between the stored and the reported
+# session start before the report is taken for a new session.
+SESSION_SLACK = 10
+# Smoothing factor of the throughput moving average.
+RATE_ALPHA = .3
+
+
+class TrafficAccountant(object):
+    """Accumulate per-session, hourly and daily traffic of one SIM."""
+
+    def __init__(self, path=':memory:', account='default', flush_interval=30):
+        """Constructor for TrafficAccountant class.
+
+        Arguments:
+            path -- sqlite database file, may be shared by many accounts,
+            account -- name to account traffic under, e.g. the IMSI,
+            flush_interval -- seconds between writes to the database.
+        """
+        self.account = account
+        self.flush_interval = flush_interval
+        self.tx_rate = 0.0
+        self.rx_rate = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._pending = {}
+        self._last = self._load_counters()
+        self._last_time = None
+        self._last_flush = time.time()
+
+    def _load_counters(self):
+        """Read the last seen session counters from the database."""
+        row = self._db.execute(
+            'SELECT session, uptime, tx, rx FROM counters WHERE account = ?',
+            (self.account,)).fetchone()
+        return row and tuple(row)
+
+    def flow_report(self, modem, message):
+        """Handle ^DSFLOWRPT, use in place of actions.flow_report_update."""
+        actions.flow_report_update(modem, message)
+        sts = modem.status
+        self.update(sts.link_uptime, sts.bytes_tx, sts.bytes_rx)
+
+    def update(self, uptime, byte_tx, byte_rx, now=None):
+        """Account cumulative session counters.
+
+        Returns:
+            (tx, rx) tuple of bytes transferred since the last update.
+        """
+        if now is None:
+            now = time.time()
+        session = int(now - uptime)
+        with self._lock:
+            last = self._last
+            if (last and abs(session - last[0]) <= SESSION_SLACK and
+                    uptime >= last[1] and byte_tx >= last[2] and
+                    byte_rx >= last[3]):
+                session = last[0]
+                delta_tx, delta_rx = byte_tx - last[2], byte_rx - last[3]
+            else:
+                # Counters were reset, this is a new session.
+                delta_tx, delta_rx = byte_tx, byte_rx
+            self._last = (session, uptime, byte_tx, byte_rx)
+            self._add('session', session, delta_tx, delta_rx)
+            for period, length in PERIODS.items():
+                self._add(period, int(now) // length * length,
+                          delta_tx, delta_rx)
+            self._update_rates(now, delta_tx, delta_rx)
+            if now - self._last_flush >= self.flush_interval:
+                self._flush(now)
+        return delta_tx, delta_rx
+
+    def _add(self, period, start, delta_tx, delta_rx):
+        """Add deltas to a pending aggregate."""
+        totals = self._pending.setdefault((period, start), [0, 0])
+        totals[0] += delta_tx
+        totals[1] += delta_rx
+
+    def _update_rates(self, now, delta_tx, delta_rx):
+        """Update the smoothed throughput."""
+        last_time, self._last_time = self._last_time, now
+        if last_time is None or now <= last_time:
+            return
+        elapsed = now - last_time
+        self.tx_rate += RATE_ALPHA * (delta_tx / elapsed - self.tx_rate)
+        self.rx_rate += RATE_ALPHA * (delta_rx / elapsed - self.rx_rate)
+
+    def _flush(self, now):
+        """Write pending aggregates and counters in one transaction."""
+        rows = [(self.account, period, start, tx, rx)
+                for (period, start), (tx, rx) in self._pending.items()]
+        with self._db:
+            self._db.executemany(UPSERT_USAGE, rows)
+            if self._last:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?, ?)',
+                    (self.account,) + self._last)
+        self._pending = {}
+        self._last_flush = now
+
+    def flush(self):
+        """Write pending aggregates to the database."""
+        with self._lock:
+            self._flush(time.time())
+
+    def close(self):
+        """Flush and close the database."""
+        self.flush()
+        self._db.close()
+
+    def throughput(self):
+        """Return current (tx, rx) throughput in bytes per second."""
+        return self.tx_rate, self.rx_rate
+
+    def usage(self, period='day', when=None):
+        """Return (tx, rx) bytes used in a period.
+
+        Arguments:
+            period -- 'session', 'hour' or 'day',
+            when -- timestamp within the period, now by default. For
+                    'session' it's the session start, the current session
+                    by default.
+        """
+        if when is None:
+            when = time.time()
+        with self._lock:
+            if period == 'session':
+                start = self._last[0] if self._last else int(when)
+            else:
+                length = PERIODS[period]
+                start = int(when) // length * length
+            row = self._db.execute(
+                'SELECT tx, rx FROM usage WHERE account = ? AND period = ? '
+                'AND start = ?', (self.account, period, start)).fetchone()
+            tx, rx = row or (0, 0)
+            pending_tx, pending_rx = self._pending.get((period, start), (0, 0))
+        return tx + pending_tx, rx + pending_rx
+
+    def over_cap(self, cap, period='day'):
+        """Check if tx + rx usage in the current period exceeds cap bytes."""
+        return sum(self.usage(period)) > cap
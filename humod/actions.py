@@ -1,6 +1,7 @@
 """Action functions to be taken in response to events."""
 
 import re
+from humod.at_commands import safe_int
 
 # pylint: disable-msg=W0613
 def call_notification(modem, message):
@@ -12,17 +13,20 @@ def null_action(modem, message):
     pass
 
 def rssi_update(modem, message):
-    """Handle RSSI level change."""
-    modem.status.rssi = modem.get_rssi()
+    """Handle RSSI level change, ignoring malformed reports."""
+    rssi = safe_int(message[6:].strip())
+    if isinstance(rssi, int):
+        modem.status.rssi = rssi
 
 def flow_report_update(modem, message):
     """Update connection report."""
     hex2dec = lambda h: int(h, 16)
     flow_rpt = message[11:].rstrip()
     values = [hex2dec(item) for item in flow_rpt.split(',', 7)]
-    sts = modem.status
-    (sts.link_uptime, sts.uplink, sts.downlink, sts.byte_tx, 
-     sts.byte_rx) = values[0:5]
+    link_uptime, uplink, downlink, bytes_tx, bytes_rx = values[0:5]
+    modem.status.update(link_uptime=link_uptime, uplink=uplink,
+                        downlink=downlink, bytes_tx=bytes_tx,
+                        bytes_rx=bytes_rx)
 
 def mode_update(modem, message):
     """Update connection mode."""
@@ -41,7 +45,11 @@ def new_message(modem, message):
     print('New message arrived.')
 
 PATTERN = {'incoming call': re.compile(r'^RING\r\n'),
+           'caller id': re.compile(r'^\+CLIP:'),
            'new sms': re.compile(r'^\+CMTI:.*'),
+           'ussd': re.compile(r'^\+CUSD:'),
+           'status report': re.compile(r'^\+CDS:'),
+           'stored status report': re.compile(r'^\+CDSI:'),
 	   'rssi update': re.compile(r'^\^RSSI:.*'),
 	   'flow report': re.compile(r'^\^DSFLOWRPT:'),
 	   'mode update': re.compile(r'^\^MODE:.*'),
@@ -124,6 +124,62 @@ class InteractiveCommands(object):
         finally:
             self.ctrl_lock.release()
 
+    def sms_iter(self, message_type='ALL'):
+        """Iterate over messages with their bodies, as they're listed.
+
+        Reads the +CMGL output line by line, so memory use doesn't grow
+        with the number of messages and no +CMGR is needed per message.
+        The control lock is held until the iteration ends, exhaust or
+        close() the iterator.
+
+        Arguments:
+            message_type -- see sms_list().
+        Yields:
+            (header, body) tuples, header as returned by sms_list().
+        """
+        self.ctrl_lock.acquire()
+        port = self.ctrl_port
+        finished = False
+        try:
+            port.read_waiting()
+            port.write(('AT+CMGL="%s"\r' % message_type).encode())
+            # Read in the echoed text.
+            input_line = port.readline().decode()
+            finished = errors.classify(input_line) is not None
+            errors.check_for_errors(input_line)
+            header, body = None, []
+            while not finished:
+                input_line = port.readline()
+                if not input_line:
+                    continue
+                input_line = input_line.decode().rstrip('\r\n')
+                # A message body reading 'OK' or an error result is neither
+                # the first line after its header nor the last line waiting.
+                final = port.inWaiting() == 0 and (header is None or body)
+                error = errors.classify(input_line) if final else None
+                finished = bool(final) and input_line == 'OK' or \
+                    error is not None
+                if error is not None:
+                    raise error
+                if finished or input_line.startswith('+CMGL: '):
+                    if header is not None:
+                        while body and not body[-1]:
+                            body.pop()
+                        yield header, '\n'.join(body)
+                    if not finished:
+                        header, body = _enlist_data([input_line[7:]])[0], []
+                elif header is not None:
+                    body.append(input_line)
+        finally:
+            try:
+                if not finished:
+                    # Iteration stopped early, skip the rest of the list.
+                    port.return_data()
+            except errors.Error:
+                pass
+            finally:
+                self.ctrl_lock.release()
+
     def sms_read(self, message_num):
         """Read one message from the SIM.
         
@@ -141,9 +197,20 @@ class InteractiveCommands(object):
         finally:
             self.ctrl_lock.release()
 
-    def sms_del(self, message_num):
-        """Delete message from the SIM."""
+    def sms_del(self, message_num, delflag=None):
+        """Delete message from the SIM.
+
+        Arguments:
+            message_num -- number of a message to delete,
+            delflag -- bulk delete, message_num is ignored:
+                1 -- all read messages,
+                2 -- all read and sent messages,
+                3 -- all read, sent and unsent messages,
+                4 -- all messages.
+        """
         msg_num_str = '%d' % message_num
+        if delflag:
+            msg_num_str += ',%d' % delflag
         _common_set(self, '+CMGD', msg_num_str)
 
     def hangup(self):
@@ -251,6 +318,48 @@ class SetCommands(object):
         sca_str = '"%s",%i' % (sca, tosca)
         _common_set(self, '+CSCA', sca_str)
 
+    def set_message_storage(self, mem1, mem2=None, mem3=None):
+        """Select message storages.
+
+        Arguments:
+            mem1 -- storage to read and delete messages from,
+            mem2 -- storage to write and send messages from,
+            mem3 -- storage to receive messages to,
+            e.g. 'SM' (SIM) or 'ME' (device memory).
+        Returns:
+            list of [used, total] lists, one for each selected storage.
+        """
+        mems = [mem for mem in (mem1, mem2, mem3) if mem]
+        result = _common_set(self, '+CPMS', ','.join('"%s"' % mem
+                                                      for mem in mems))
+        usage = _enlist_data(result)[0]
+        return [usage[i:i + 2] for i in range(0, len(usage), 2)]
+
+# Settings of the enable_* methods: command, status read when active and
+# inactive, and values to set if they differ from the status read.
+ENABLE_SETTINGS = {
+    'nmi': ('+CNMI', '2,1,0,2,1', '0,0,0,0,0', None, None),
+    'clip': ('+CLIP', '1,1', '0,1', '1', '0'),
+    'textmode': ('+CMGF', '1', '0', None, None),
+    'curc': ('^CURC', '1', '0', None, None),
+}
+
+# Bit of the +CSMP first octet requesting status reports (TP-SRR).
+STATUS_REPORT_BIT = 0x20
+
+def _status_reports(parameters):
+    """Return True if +CSMP parameters request status reports."""
+    return bool(int(parameters[0]) & STATUS_REPORT_BIT)
+
+def _with_status_reports(parameters, status):
+    """Return +CSMP parameters with only the status report bit changed."""
+    first = int(parameters[0])
+    if status:
+        first |= STATUS_REPORT_BIT
+    else:
+        first &= ~STATUS_REPORT_BIT
+    return ','.join(['%d' % first] + list(parameters[1:]))
+
 class EnterCommands(object):
     """Enter methods write user settings that are kept until modem restarts."""
 
@@ -279,17 +388,39 @@ class EnterCommands(object):
         else:
             _common_set(self, command, inactive_set)
 
+    def _enable_setting(self, name, status):
+        """Enable, disable or check status of a setting in ENABLE_SETTINGS."""
+        command, active, inactive, active_set, inactive_set = \
+            ENABLE_SETTINGS[name]
+        return self._common_enable(command, active, inactive, status,
+                                   active_set, inactive_set)
+
     def enable_nmi(self, status=None):
         """Enable, disable or check status on new message indications."""
-        return self._common_enable('+CNMI', '2,1,0,2,1', '0,0,0,0,0', status)
+        return self._enable_setting('nmi', status)
 
     def enable_clip(self, status=None):
         """Enable, disable or check status of calling line identification."""
-        return self._common_enable('+CLIP', '1,1', '0,1', status, '1', '0')
+        return self._enable_setting('clip', status)
 
     def enable_textmode(self, status=None):
         """Enable, disable or find out about current mode."""
-        return self._common_enable('+CMGF', '1', '0', status)
+        return self._enable_setting('textmode', status)
+
+    def enable_curc(self, status=None):
+        """Enable, disable or check status of periodic Huawei reports."""
+        return self._enable_setting('curc', status)
+
+    def enable_status_reports(self, status=None):
+        """Enable, disable or check status of delivery reports.
+
+        Only the status report bit of the +CSMP first octet is changed,
+        the validity period, protocol and coding settings are kept.
+        """
+        parameters = _common_get(self, '+CSMP')[0].split(',')
+        if status is None:
+            return _status_reports(parameters)
+        _common_set(self, '+CSMP', _with_status_reports(parameters, status))
 
 class GetCommands(object):
     """Get methods read dynamic or user-set data."""
@@ -297,17 +428,8 @@ class GetCommands(object):
     def get_networks(self):
         """Scan for networks."""
         active_ops = _common_dsc(self, '+COPS')
-        bracket_group = re.compile('\(.+?\)')
         if active_ops:
-            data = []
-            network_data_list = bracket_group.findall(active_ops[0])
-            for network_data_set in network_data_list:
-                unbracketed_set = network_data_set[1:-1]
-                items = csv_ls(unbracketed_set)
-                if len(items) == 5:
-                    transformed_set = [safe_int(ni) for ni in items]
-                    data.append(transformed_set)
-            return data
+            return parse_networks(active_ops[0])
 
     def get_clock(self):
         """Return internal modem clock."""
@@ -336,6 +458,21 @@ class GetCommands(object):
             'SIM PUK': 'PUK required'
         }[pin_info]
 
+    def get_message_storage(self):
+        """Show selected message storages and their usage.
+
+        Returns:
+            list of [storage, used, total] lists for mem1, mem2 and mem3.
+        """
+        storage = _enlist_data(_common_get(self, '+CPMS'))[0]
+        return [storage[i:i + 3] for i in range(0, len(storage), 3)]
+
+    def get_message_storage_options(self):
+        """List storages supported for mem1, mem2 and mem3."""
+        options = _common_dsc(self, '+CPMS')[0]
+        return [csv_ls(group[1:-1])
+                for group in BRACKET_GROUP.findall(options)]
+
     def get_pdp_context(self):
         """Read PDP context entries."""
         pdp_context_data = _common_get(self, '+CGDCONT')
@@ -350,6 +487,8 @@ class GetCommands(object):
             1: 'Text mode'
         }[int(current_mode)]
 
+BRACKET_GROUP = re.compile(r'\(.+?\)')
+
 def safe_int(x):
     if x=='0':
         return 0
@@ -361,6 +500,17 @@ def safe_int(x):
     except ValueError:
         return x
 
+def parse_networks(line):
+    """Parse operator list returned by the +COPS=? command."""
+    data = []
+    for network_data_set in BRACKET_GROUP.findall(line):
+        unbracketed_set = network_data_set[1:-1]
+        items = csv_ls(unbracketed_set)
+        if len(items) == 5:
+            transformed_set = [safe_int(ni) for ni in items]
+            data.append(transformed_set)
+    return data
+
 def csv_ls(s):
     return [x for x in csv.reader([s])][0]
 
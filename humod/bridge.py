@@ -0,0 +1,404 @@
+"""Serial to TCP bridge sharing modems across hosts.
+
+A Bridge exports local modem ports by name over TCP. A TcpPort connects
+to one exported port and implements the ModemPort interface, so a Modem
+can run on a different host than its USB stick:
+
+    modem = Modem(TcpPort('gateway', name='data'),
+                  TcpPort('gateway', name='ctrl'))
+
+or, with the same effect:
+
+    modem = Modem('tcp://gateway:7070/data', 'tcp://gateway:7070/ctrl')
+
+Traffic is framed as a one byte frame type and a two byte length followed
+by the payload. A client opens a port with a HELLO frame carrying its name
+and then exchanges DATA frames with it. The bridge forwards everything the
+modem has sent in one frame, and Nagle's algorithm is disabled at both
+ends, so replies arrive with close to serial latency.
+
+Run the bridge from the command line:
+    python -m humod.bridge --export data=/dev/ttyUSB0 --export ctrl=/dev/ttyUSB1
+"""
+
+import argparse
+import socket
+import struct
+import threading
+import time
+import serial
+from humod import defaults
+from humod import errors
+from humod.humodem import BaseModemPort
+
+HEADER = struct.Struct('!BH')
+MAX_PAYLOAD = 0xFFFF
+
+# Frame types.
+HELLO = 1
+READY = 2
+DATA = 3
+ERROR = 4
+
+
+def pack_frame(kind, payload=b''):
+    """Return a frame of the given type."""
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def _recv_exactly(sock, size):
+    """Read size bytes from a socket, return None on a closed socket."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_frame(sock):
+    """Read one frame, return (type, payload) or None when closed."""
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    kind, length = HEADER.unpack(header)
+    payload = _recv_exactly(sock, length) if length else b''
+    if payload is None:
+        return None
+    return kind, payload
+
+
+def _connect(address, timeout):
+    """Open a TCP connection with Nagle's algorithm disabled."""
+    sock = socket.create_connection(address, timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class TcpPort(BaseModemPort):
+    """Modem port exported by a Bridge on another host.
+
+    The port attribute holds the tcp:// URL of the port, not a device
+    path, so a TcpPort can't be handed to pppd as the data port: run
+    pppd on the bridge host.
+    """
+
+    def __init__(self, host, port=defaults.BRIDGE_PORT, name='ctrl',
+                 timeout=defaults.PROBER_TIMEOUT):
+        """Constructor for TcpPort class, connects to the bridge.
+
+        Arguments:
+            host, port -- address of the bridge,
+            name -- name of the exported port,
+            timeout -- seconds read() and readline() wait for data.
+        """
+        self.address = (host, port)
+        self.name = name
+        # Names the port like serial.Serial.port, but as a URL (see
+        # from_url()), never a device path.
+        self.port = 'tcp://%s:%d/%s' % (host, port, name)
+        self.timeout = timeout
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._sock = None
+        self._error = None
+        self.open()
+
+    @classmethod
+    def from_url(cls, url, timeout=defaults.PROBER_TIMEOUT):
+        """Connect to a tcp://host:port/name URL."""
+        location = url[len('tcp://'):]
+        address, _, name = location.partition('/')
+        host, _, port = address.rpartition(':')
+        if not (host and port.isdigit() and name):
+            raise errors.HumodUsageError('Invalid bridge URL: %s.' % url)
+        return cls(host, int(port), name, timeout)
+
+    def open(self):
+        """Connect to the bridge and open the exported port."""
+        if self.isOpen():
+            return
+        sock = _connect(self.address, defaults.BRIDGE_CONNECT_TIMEOUT)
+        try:
+            sock.sendall(pack_frame(HELLO, self.name.encode()))
+            reply = read_frame(sock)
+        except socket.timeout:
+            reply = None
+        if not reply or reply[0] != READY:
+            sock.close()
+            message = reply[1].decode() if reply else 'no reply'
+            raise errors.BridgeError('Cannot open %s: %s.' %
+                                     (self.name, message))
+        sock.settimeout(None)
+        self._sock = sock
+        self._error = None
+        thread = threading.Thread(target=self._receive, args=(sock,))
+        thread.daemon = True
+        thread.start()
+
+    def _receive(self, sock):
+        """Buffer data frames until the connection closes."""
+        try:
+            while True:
+                frame = read_frame(sock)
+                if frame is None:
+                    error = 'Connection closed by the bridge.'
+                    break
+                kind, payload = frame
+                if kind == ERROR:
+                    error = payload.decode()
+                    break
+                if kind == DATA:
+                    with self._cond:
+                        self._buffer.extend(payload)
+                        self._cond.notify_all()
+        except OSError as exc:
+            error = str(exc)
+        with self._cond:
+            if self._sock is sock:
+                self._error = error
+            self._cond.notify_all()
+
+    def _wait(self, ready):
+        """Wait until ready() or the timeout expires."""
+        deadline = time.time() + self.timeout
+        while not ready():
+            if self._error:
+                raise errors.BridgeError(self._error)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+    def write(self, data):
+        """Send data to the modem."""
+        if not self.isOpen():
+            raise errors.BridgeError('Port %s is not open.' % self.name)
+        data = bytes(data)
+        for start in range(0, len(data), MAX_PAYLOAD):
+            self._sock.sendall(
+                pack_frame(DATA, data[start:start + MAX_PAYLOAD]))
+        return len(data)
+
+    def read(self, size=1):
+        """Read up to size bytes, waiting no longer than timeout."""
+        with self._cond:
+            self._wait(lambda: len(self._buffer) >= size)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readline(self):
+        """Read a line, or whatever arrived before the timeout."""
+        with self._cond:
+            self._wait(lambda: b'\n' in self._buffer)
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def inWaiting(self):
+        """Return the number of bytes received from the modem."""
+        return len(self._buffer)
+
+    def isOpen(self):
+        """True while connected to the bridge."""
+        return self._sock is not None and not self._error
+
+    def close(self):
+        """Close the connection, releasing the port for other clients."""
+        sock, self._sock = self._sock, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class Bridge(object):
+    """Export local modem ports over TCP, one client per port."""
+
+    def __init__(self, ports, host=defaults.BRIDGE_HOST,
+                 port=defaults.BRIDGE_PORT, baudrate=defaults.BAUDRATE):
+        """Constructor for Bridge class.
+
+        Arguments:
+            ports -- dict mapping names to device paths or open ports,
+            host, port -- address to listen on,
+            baudrate -- baudrate of ports opened from paths.
+        """
+        self.ports = {}
+        for name, device in ports.items():
+            if isinstance(device, str):
+                device = serial.Serial(device, baudrate,
+                                       timeout=defaults.PROBER_TIMEOUT)
+            self.ports[name] = device
+        self.address = (host, port)
+        self.active = False
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Start accepting clients in the background."""
+        if self.active:
+            raise errors.HumodUsageError('Bridge already running.')
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(self.address)
+        server.listen(len(self.ports) + 4)
+        self.address = server.getsockname()
+        self._server = server
+        self.active = True
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stop accepting clients and disconnect the connected ones."""
+        self.active = False
+        if self._server:
+            self._server.close()
+            self._server = None
+        with self._lock:
+            clients = list(self._clients.values())
+        for conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _accept(self):
+        """Accept clients until stopped."""
+        while self.active:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._session, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _claim(self, conn):
+        """Read the HELLO frame and reserve the requested port."""
+        conn.settimeout(defaults.BRIDGE_CONNECT_TIMEOUT)
+        try:
+            frame = read_frame(conn)
+        except OSError:
+            return None
+        conn.settimeout(None)
+        if not frame or frame[0] != HELLO:
+            return None
+        name = frame[1].decode()
+        with self._lock:
+            if name not in self.ports:
+                error = 'unknown port'
+            elif name in self._clients:
+                error = 'port busy'
+            else:
+                self._clients[name] = conn
+                return name
+        conn.sendall(pack_frame(ERROR, error.encode()))
+        return None
+
+    def _session(self, conn):
+        """Forward traffic between a client and its port."""
+        try:
+            name = self._claim(conn)
+            if name is None:
+                return
+            try:
+                self._forward(conn, self.ports[name])
+            finally:
+                with self._lock:
+                    del self._clients[name]
+        finally:
+            conn.close()
+
+    def _forward(self, conn, port):
+        """Write client frames to the port while pumping its output."""
+        # Drop replies nobody is waiting for anymore.
+        port.read(port.inWaiting())
+        conn.sendall(pack_frame(READY))
+        connected = [True]
+        pump = threading.Thread(target=self._pump,
+                                args=(conn, port, connected))
+        pump.daemon = True
+        pump.start()
+        try:
+            while self.active:
+                frame = read_frame(conn)
+                if frame is None:
+                    break
+                if frame[0] == DATA:
+                    port.write(frame[1])
+        except (OSError, serial.SerialException):
+            pass
+        finally:
+            connected[0] = False
+            pump.join()
+
+    def _pump(self, conn, port, connected):
+        """Send all output of the port to the client, in bulk."""
+        try:
+            while connected[0]:
+                data = port.read(min(port.inWaiting(), MAX_PAYLOAD) or 1)
+                if not data:
+                    continue
+                data += port.read(min(port.inWaiting(),
+                                      MAX_PAYLOAD - len(data)))
+                conn.sendall(pack_frame(DATA, data))
+        except serial.SerialException as error:
+            try:
+                conn.sendall(pack_frame(ERROR, str(error).encode()))
+            except OSError:
+                pass
+        except OSError:
+            pass
+        finally:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _parse_export(value):
+    """Parse a NAME=DEVICE command line argument."""
+    name, _, device = value.partition('=')
+    if not (name and device):
+        raise argparse.ArgumentTypeError('expected NAME=DEVICE')
+    return name, device
+
+
+def main(argv=None):
+    """Run the bridge from the command line."""
+    parser = argparse.ArgumentParser(prog='python -m humod.bridge',
+                                     description='Export modem ports '
+                                                 'over TCP.')
+    parser.add_argument('--export', action='append', type=_parse_export,
+                        metavar='NAME=DEVICE',
+                        help='port to export, may be repeated')
+    parser.add_argument('--host', default=defaults.BRIDGE_HOST)
+    parser.add_argument('--port', type=int, default=defaults.BRIDGE_PORT)
+    parser.add_argument('--baudrate', default=defaults.BAUDRATE)
+    args = parser.parse_args(argv)
+    exports = dict(args.export or [('data', defaults.DATA_PORT),
+                                   ('ctrl', defaults.CONTROL_PORT)])
+    bridge = Bridge(exports, args.host, args.port, args.baudrate)
+    bridge.start()
+    print('Exporting %s on %s:%d.' % (', '.join(sorted(exports)),
+                                      bridge.address[0], bridge.address[1]))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.stop()
+
+
+if __name__ == '__main__':
+    main()
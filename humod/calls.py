@@ -0,0 +1,150 @@
+"""Screening of incoming calls.
+
+A CallScreener reads the caller ID from +CLIP messages, which the modem
+sends with every RING once enable_clip(True) is set, and decides at the
+first of them whether to let the call ring on. Rejected calls are hung up
+with a single +CHUP, through a CommandScheduler at urgent priority when
+one is given, so the rejection doesn't queue behind other commands.
+
+Numbers are compared by their digits, with a leading 00 dropped, so
+'+353861234567' and '00353861234567' are the same number.
+
+Usage:
+    screener = CallScreener(modem, deny={'+353861234567'}, scheduler=sched)
+    modem.subscriptions.start()
+"""
+
+import collections
+import threading
+import time
+from humod import at_commands as atc
+from humod import errors
+from humod.scheduler import URGENT
+from humod.siminfo import digits_only
+
+# Seconds without +CLIP after which the next one belongs to a new call,
+# rings come about every 5 seconds.
+CALL_GAP = 8.0
+
+# CLI validity values of +CLIP.
+CLI_VALID = 0
+CLI_WITHHELD = 1
+CLI_UNAVAILABLE = 2
+
+
+def normalize(number):
+    """Return the digits of a number without the 00 prefix."""
+    digits = digits_only(number or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits
+
+
+def parse_clip(message):
+    """Parse a +CLIP message.
+
+    Returns:
+        (number, type, validity) tuple; number is None if withheld. None
+        if the message is malformed.
+    """
+    items = atc.csv_ls(message.strip()[6:].strip())
+    number = items[0] or None
+    numtype = atc.safe_int(items[1]) if len(items) > 1 and items[1] else None
+    validity = CLI_VALID
+    if len(items) > 5 and items[5]:
+        validity = atc.safe_int(items[5])
+    if not isinstance(validity, int) or \
+            (numtype is not None and not isinstance(numtype, int)):
+        return None
+    if validity != CLI_VALID:
+        number = None
+    return number, numtype, validity
+
+
+class CallScreener(object):
+    """Let wanted calls ring and hang up on the others."""
+
+    # pylint: disable-msg=R0913
+    def __init__(self, modem, allow=None, deny=(), decide=None,
+                 scheduler=None, reject_withheld=False):
+        """Constructor for CallScreener class.
+
+        Subscribes to +CLIP messages, the prober has to be running (see
+        modem.subscriptions.start()) for calls to be screened.
+
+        Arguments:
+            modem -- Modem instance to screen calls of,
+            allow -- numbers allowed to call, any number if None,
+            deny -- numbers never allowed to call,
+            decide -- optional function called with the number (None if
+                      withheld), returning True to accept the call; it
+                      replaces the allow and deny sets,
+            scheduler -- optional CommandScheduler to hang up through,
+            reject_withheld -- hang up on calls without a caller ID.
+        """
+        self.modem = modem
+        self.allow = None if allow is None else set(map(normalize, allow))
+        self.deny = set(map(normalize, deny))
+        self.decide = decide
+        self.scheduler = scheduler
+        self.reject_withheld = reject_withheld
+        self.accepted = 0
+        self.rejected = 0
+        self.malformed = 0
+        self.history = collections.deque(maxlen=100)
+        self._last_clip = 0
+        self._lock = threading.Lock()
+        modem.subscriptions.subscribe('caller id', self.clip_update)
+
+    def accepts(self, number):
+        """Return True if a call from number may ring."""
+        if self.decide:
+            return bool(self.decide(number))
+        if number is None:
+            return not self.reject_withheld
+        number = normalize(number)
+        if number in self.deny:
+            return False
+        return self.allow is None or number in self.allow
+
+    def clip_update(self, modem, message):
+        """Handle the +CLIP message, screening each call once."""
+        clip = parse_clip(message)
+        if clip is None:
+            # Runs on the interpreter thread, drop the message and go on.
+            self.malformed += 1
+            return
+        now = time.time()
+        with self._lock:
+            new_call = now - self._last_clip > CALL_GAP
+            self._last_clip = now
+        if not new_call:
+            return
+        number = clip[0]
+        accepted = self.accepts(number)
+        self.history.append((now, number, accepted))
+        if accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+            self.reject()
+
+    def reject(self):
+        """Hang up without blocking the prober."""
+        if self.scheduler:
+            self.scheduler.submit(self._hangup, priority=URGENT,
+                                  caller=self)
+        else:
+            thread = threading.Thread(target=self._hangup)
+            thread.daemon = True
+            thread.start()
+
+    def _hangup(self):
+        """Send +CHUP and end the call for the screener."""
+        try:
+            self.modem.hangup()
+        except errors.Error:
+            pass
+        with self._lock:
+            # The next +CLIP comes from a new call.
+            self._last_clip = 0
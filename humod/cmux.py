@@ -0,0 +1,368 @@
+"""GSM 07.10 (CMUX) multiplexer running virtual channels over one port.
+
+Modems exposing a single serial port can be switched to basic mode
+multiplexing with AT+CMUX=0. One Multiplexer instance then frames traffic
+of several virtual channels (DLCIs) over that port. Each channel is
+available either as a VirtualPort, which implements the ModemPort
+interface, or as a pseudo terminal that pppd can run on.
+
+Usage:
+    modem = humod.cmux.open_modem('/dev/ttyUSB0')
+"""
+
+import os
+import pty
+import struct
+import threading
+import time
+import tty
+from humod import defaults
+from humod import errors
+from humod.humodem import BaseModemPort, Modem, ModemPort
+
+FLAG = 0xF9
+EA = 0x01
+CR = 0x02
+PF = 0x10
+
+# Frame types (control field without the P/F bit).
+SABM = 0x2F
+UA = 0x63
+DM = 0x0F
+DISC = 0x43
+UIH = 0xEF
+
+# Control channel message types (with EA set, C/R cleared).
+MSC = 0xE1
+CLD = 0xC1
+
+CONTROL_DLCI = 0
+DATA_DLCI = 1
+AT_DLCI = 2
+URC_DLCI = 3
+
+FRAME_SIZE = 127
+ESTABLISH_TIMEOUT = 3.0
+
+
+def _crc_table():
+    """Build the reversed CRC-8 table used by the frame check sequence."""
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xE0
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+CRC_TABLE = _crc_table()
+
+
+def fcs(data):
+    """Return the frame check sequence of data."""
+    crc = 0xFF
+    for byte in bytearray(data):
+        crc = CRC_TABLE[crc ^ byte]
+    return 0xFF - crc
+
+
+def encode_frame(dlci, control, info=b'', command=True):
+    """Encode a basic mode frame.
+
+    Arguments:
+        dlci -- channel number,
+        control -- frame type, optionally or-ed with PF,
+        info -- frame payload,
+        command -- set the C/R bit of the address field.
+    """
+    address = dlci << 2 | EA
+    if command:
+        address |= CR
+    length = len(info)
+    if length < 128:
+        header = struct.pack('BBB', address, control, length << 1 | EA)
+    else:
+        header = struct.pack('BBBB', address, control, (length & 0x7F) << 1,
+                             length >> 7)
+    return (struct.pack('B', FLAG) + header + bytes(info) +
+            struct.pack('BB', fcs(header), FLAG))
+
+
+class FrameDecoder(object):
+    """Incremental decoder of basic mode frames."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Feed raw bytes, return a list of (dlci, control, info) tuples."""
+        buf = self._buffer
+        buf.extend(data)
+        frames = []
+        while True:
+            start = buf.find(FLAG)
+            if start < 0:
+                del buf[:]
+                break
+            # Skip the opening flag and any repeated flags.
+            while start < len(buf) and buf[start] == FLAG:
+                start += 1
+            del buf[:start - 1]
+            if len(buf) < 4:
+                break
+            address, control, length = buf[1], buf[2], buf[3]
+            header_end = 4
+            if not length & EA:
+                if len(buf) < 5:
+                    break
+                length = length >> 1 | buf[4] << 7
+                header_end = 5
+            else:
+                length >>= 1
+            end = header_end + length
+            if len(buf) < end + 2:
+                break
+            if (buf[end + 1] != FLAG or
+                    fcs(buf[1:header_end]) != buf[end]):
+                # Corrupt frame, resynchronise on the next flag.
+                del buf[:1]
+                continue
+            frames.append((address >> 2, control,
+                           bytes(buf[header_end:end])))
+            # Keep the closing flag, it may open the next frame.
+            del buf[:end + 1]
+        return frames
+
+
+class VirtualPort(BaseModemPort):
+    """Virtual channel implementing the ModemPort interface."""
+
+    def __init__(self, mux, dlci, timeout=defaults.PROBER_TIMEOUT):
+        self.mux = mux
+        self.dlci = dlci
+        self.timeout = timeout
+        self.port = 'cmux:%d' % dlci
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+
+    def feed(self, data):
+        """Append data received on the channel."""
+        with self._cond:
+            self._buffer.extend(data)
+            self._cond.notify_all()
+
+    def _wait(self, ready):
+        """Wait until ready() or the timeout expires."""
+        deadline = time.time() + self.timeout
+        while not ready():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+    def write(self, data):
+        """Send data over the channel."""
+        self.mux.write(self.dlci, data)
+        return len(data)
+
+    def read(self, size=1):
+        """Read up to size bytes, waiting no longer than timeout."""
+        with self._cond:
+            self._wait(lambda: len(self._buffer) >= size)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readline(self):
+        """Read a line, or whatever arrived before the timeout."""
+        with self._cond:
+            self._wait(lambda: b'\n' in self._buffer)
+            end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+        return data
+
+    def inWaiting(self):
+        """Return the number of bytes waiting in the channel."""
+        return len(self._buffer)
+
+    def isOpen(self):
+        """Virtual channels are open while the multiplexer runs."""
+        return self.mux.active
+
+    def open(self):
+        """Channels are opened by the multiplexer."""
+        pass
+
+    def close(self):
+        """Channels are closed by the multiplexer."""
+        pass
+
+
+class PtyChannel(object):
+    """Virtual channel exposed as a pseudo terminal, e.g. for pppd."""
+
+    def __init__(self, mux, dlci):
+        self.mux = mux
+        self.dlci = dlci
+        self.master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        # The slave end is kept open, so that the master doesn't fail
+        # with EIO whenever pppd closes the terminal.
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._forward)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def feed(self, data):
+        """Pass data received on the channel to the terminal."""
+        os.write(self.master, data)
+
+    def _forward(self):
+        """Send everything written to the terminal over the channel."""
+        while self.mux.active:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if data:
+                self.mux.write(self.dlci, data)
+
+    def close(self):
+        """Close the pseudo terminal."""
+        os.close(self._slave)
+        os.close(self.master)
+
+
+class Multiplexer(object):
+    """Basic mode GSM 07.10 multiplexer over one physical port."""
+
+    def __init__(self, port, frame_size=FRAME_SIZE):
+        self.port = port
+        self.frame_size = frame_size
+        self.active = False
+        self._channels = {}
+        self._acks = {}
+        self._write_lock = threading.Lock()
+        self._decoder = FrameDecoder()
+        self._reader = None
+
+    def start(self, dlcis=(DATA_DLCI, AT_DLCI, URC_DLCI), mode_command=True):
+        """Enter multiplexer mode and establish channels.
+
+        Arguments:
+            dlcis -- channels to establish,
+            mode_command -- send AT+CMUX=0 first.
+        """
+        if self.active:
+            raise errors.HumodUsageError('Multiplexer already started.')
+        if mode_command:
+            self.port.send_at('+CMUX', '=0', prefixed=False)
+        self.active = True
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+        self._establish(CONTROL_DLCI)
+        for dlci in dlcis:
+            self._establish(dlci)
+            # Raise RTC and RTR, some modems hold data back until then.
+            self._control(struct.pack('BBBB', MSC | CR, 2 << 1 | EA,
+                                      dlci << 2 | CR | EA, 0x8D))
+
+    def stop(self):
+        """Close all channels and leave multiplexer mode."""
+        if not self.active:
+            raise errors.HumodUsageError('Multiplexer not started.')
+        for dlci in list(self._channels):
+            self._send(encode_frame(dlci, DISC | PF))
+        self._control(struct.pack('BB', CLD | CR, EA))
+        self.active = False
+        self._reader.join()
+        for channel in self._channels.values():
+            if isinstance(channel, PtyChannel):
+                channel.close()
+        self._channels = {}
+
+    def channel(self, dlci):
+        """Return a VirtualPort for an established channel."""
+        channel = VirtualPort(self, dlci)
+        self._channels[dlci] = channel
+        return channel
+
+    def pty_channel(self, dlci):
+        """Return a PtyChannel for an established channel."""
+        channel = PtyChannel(self, dlci)
+        self._channels[dlci] = channel
+        return channel
+
+    def write(self, dlci, data):
+        """Send data over a channel, split into UIH frames."""
+        size = self.frame_size
+        frames = [encode_frame(dlci, UIH, data[i:i + size])
+                  for i in range(0, len(data), size)]
+        self._send(b''.join(frames))
+
+    def _send(self, raw):
+        """Write raw frames to the physical port."""
+        with self._write_lock:
+            self.port.write(raw)
+
+    def _control(self, message):
+        """Send a control channel message."""
+        self._send(encode_frame(CONTROL_DLCI, UIH, message))
+
+    def _establish(self, dlci):
+        """Open a channel with SABM and wait for UA."""
+        ack = self._acks[dlci] = [threading.Event(), False]
+        self._send(encode_frame(dlci, SABM | PF))
+        if not ack[0].wait(ESTABLISH_TIMEOUT) or not ack[1]:
+            raise errors.MultiplexerError('DLCI %d not established.' % dlci)
+
+    def _read(self):
+        """Read the physical port and dispatch received frames."""
+        while self.active:
+            data = self.port.read(self.port.inWaiting() or 1)
+            if not data:
+                continue
+            for dlci, control, info in self._decoder.feed(data):
+                self._dispatch(dlci, control & ~PF, info)
+
+    def _dispatch(self, dlci, control, info):
+        """Handle a single received frame."""
+        if control in (UA, DM):
+            ack = self._acks.pop(dlci, None)
+            if ack:
+                ack[1] = control == UA
+                ack[0].set()
+        elif control == UIH and dlci == CONTROL_DLCI:
+            # Acknowledge control commands by echoing them as responses.
+            if info and bytearray(info)[0] & CR:
+                reply = bytearray(info)
+                reply[0] &= ~CR
+                self._control(bytes(reply))
+        elif control == UIH and dlci in self._channels:
+            self._channels[dlci].feed(info)
+
+
+def open_modem(device, baudrate=defaults.BAUDRATE, urc_channel=True):
+    """Return a Modem running over CMUX channels of a single port.
+
+    The data channel is exposed as a pseudo terminal for pppd, AT commands
+    run on their own channel. With urc_channel set, unsolicited messages
+    are read from a third channel; modems need a vendor specific command
+    to route them there, otherwise they stay on the AT channel.
+    """
+    port = ModemPort(device, baudrate, timeout=defaults.PROBER_TIMEOUT)
+    mux = Multiplexer(port)
+    dlcis = (DATA_DLCI, AT_DLCI)
+    if urc_channel:
+        dlcis += (URC_DLCI,)
+    mux.start(dlcis)
+    modem = Modem(mux.pty_channel(DATA_DLCI).port, mux.channel(AT_DLCI))
+    if urc_channel:
+        modem.urc_port = mux.channel(URC_DLCI)
+    modem.multiplexer = mux
+    return modem
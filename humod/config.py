@@ -0,0 +1,168 @@
+"""Declarative modem configuration.
+
+Instead of setting everything at each start, describe the wanted settings
+and let apply() change only what differs. The current state is read with
+one batched command line, and the changes are sent batched as well, so a
+modem that is already configured costs one round trip and no writes to
+its non-volatile memory.
+
+Settings:
+    textmode, nmi, clip, curc, status_reports -- booleans, see the
+        enable_* methods,
+    service_center -- number, or a (number, type) tuple,
+    pdp_context -- list of set_pdp_context() argument tuples, e.g.
+                   [(1, 'IP', 'internet')].
+
+Usage:
+    changed = humod.config.apply(modem, {'textmode': True, 'nmi': True,
+                                         'service_center': '+353868002000',
+                                         'pdp_context': [(1, 'IP', 'live')]})
+"""
+
+from humod import at_commands as atc
+from humod import errors
+
+SERVICE_CENTER_TYPE = 145
+
+# Order in which changes are sent, text mode first as it changes how other
+# message settings are interpreted.
+SETTINGS = ('textmode', 'service_center', 'pdp_context', 'nmi', 'clip',
+            'curc', 'status_reports')
+COMMANDS = dict((name, setting[0])
+                for name, setting in atc.ENABLE_SETTINGS.items())
+COMMANDS.update({'service_center': '+CSCA', 'pdp_context': '+CGDCONT',
+                 'status_reports': '+CSMP'})
+
+# Longest command line sent to the modem; longer batches are split.
+COMMAND_LINE_MAX = 200
+
+
+def _batch(modem, commands):
+    """Send commands joined into as few command lines as possible."""
+    lines = []
+    result = []
+    for command in commands:
+        if lines and len(lines[-1]) + len(command) + 1 <= COMMAND_LINE_MAX:
+            lines[-1] += ';' + command
+        else:
+            lines.append(command)
+    for line in lines:
+        result.extend(atc._common_run(modem, line, prefixed=False))
+    return result
+
+
+def read_state(modem, names=SETTINGS):
+    """Read the current value of settings with one command line.
+
+    Returns:
+        dict mapping setting names to their current values; PDP contexts
+        are returned as a dict mapping context numbers to field lists,
+        with status_reports the +CSMP values are returned as well, as
+        sms_parameters.
+    """
+    names = [name for name in SETTINGS if name in names]
+    replies = {}
+    for line in _batch(modem, [COMMANDS[name] + '?' for name in names]):
+        prefix, _, value = line.partition(': ')
+        replies.setdefault(prefix, []).append(value)
+    state = {}
+    for name in names:
+        values = replies.get(COMMANDS[name], [])
+        if name == 'pdp_context':
+            state[name] = dict((int(items[0]), items[1:]) for items in
+                               map(atc.csv_ls, values))
+        elif name == 'service_center':
+            items = atc.csv_ls(values[0]) if values else ['', '']
+            state[name] = (items[0], atc.safe_int(items[-1]))
+        elif name == 'status_reports' and values:
+            state['sms_parameters'] = values[0].split(',')
+            state[name] = atc._status_reports(state['sms_parameters'])
+        elif values:
+            state[name] = values[0] == atc.ENABLE_SETTINGS[name][1]
+        else:
+            raise errors.AtCommandError('No status returned for %s.' %
+                                        COMMANDS[name])
+    return state
+
+
+def _pdp_context_matches(context, known):
+    """Compare set_pdp_context() arguments with a +CGDCONT? entry."""
+    for i, value in enumerate(context[1:]):
+        if i == 2 and not value:
+            # Any address assigned to a dynamic one.
+            continue
+        if i >= len(known) or known[i] != str(value):
+            return False
+    return True
+
+
+def _pdp_context_command(context):
+    """Format set_pdp_context() arguments as a +CGDCONT command."""
+    values = ['"%s"' % value if i < 3 else '%d' % value
+              for i, value in enumerate(context[1:])]
+    return '+CGDCONT=%d,%s' % (context[0], ','.join(values))
+
+
+def diff(state, desired):
+    """Return the commands changing state into desired.
+
+    Returns:
+        list of (setting name, command) tuples.
+    """
+    unknown = set(desired) - set(SETTINGS)
+    if unknown:
+        raise errors.HumodUsageError('Unknown settings: %s.' %
+                                     ', '.join(sorted(unknown)))
+    changes = []
+    for name in SETTINGS:
+        if name not in desired:
+            continue
+        wanted = desired[name]
+        current = state.get(name)
+        if name == 'pdp_context':
+            for context in wanted:
+                if not _pdp_context_matches(context,
+                                            current.get(context[0], [])):
+                    changes.append((name, _pdp_context_command(context)))
+        elif name == 'service_center':
+            if isinstance(wanted, str):
+                wanted = (wanted, SERVICE_CENTER_TYPE)
+            if tuple(current) != tuple(wanted):
+                changes.append((name, '+CSCA="%s",%d' % wanted))
+        elif bool(wanted) == current:
+            continue
+        elif name == 'status_reports':
+            if 'sms_parameters' not in state:
+                raise errors.AtCommandError('No status returned for %s.' %
+                                            COMMANDS[name])
+            changes.append((name, '+CSMP=%s' % atc._with_status_reports(
+                state['sms_parameters'], wanted)))
+        else:
+            command, active, inactive, active_set, inactive_set = \
+                atc.ENABLE_SETTINGS[name]
+            if wanted:
+                changes.append((name, '%s=%s' % (command,
+                                                 active_set or active)))
+            else:
+                changes.append((name, '%s=%s' % (command,
+                                                 inactive_set or inactive)))
+    return changes
+
+
+def apply(modem, desired):
+    """Change the settings that differ from desired.
+
+    Arguments:
+        modem -- Modem instance to configure,
+        desired -- dict of settings, see the module documentation.
+    Returns:
+        list of names of the changed settings.
+    """
+    changes = diff(read_state(modem, desired), desired)
+    if changes:
+        _batch(modem, [command for _, command in changes])
+    names = []
+    for name, _ in changes:
+        if name not in names:
+            names.append(name)
+    return names
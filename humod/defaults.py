@@ -9,11 +9,47 @@ CONTROL_PORT = '/dev/ttyUSB1'
 # (called the peer) and to negotiate...
 PPPD_PATH = '/usr/sbin/pppd'
 PROBER_TIMEOUT = 0.5
+# Number of unsolicited messages the prober queues for the interpreter.
+EVENT_QUEUE_SIZE = 1000
 BAUDRATE = '115200'
 DIALNUM = '*99#'
 PPPD_PARAMS = ['modem', 'crtscts', 'defaultroute', 'usehostname', '-detach',
                'noipdefault', 'call', 'humod', 'user', 'ppp', 'usepeerdns',
                'idle', '0', 'logfd', '8']
+# Connection supervisor: redial backoff bounds (seconds), the longest
+# silence tolerated between ^DSFLOWRPT reports before the link is
+# considered dead (Huawei sticks report every 2 seconds), and how long a
+# link has to stay up for the backoff to start over.
+RECONNECT_BACKOFF = 1.0
+RECONNECT_BACKOFF_MAX = 60.0
+FLOW_REPORT_TIMEOUT = 10.0
+RECONNECT_STABLE = 30.0
+# Network scans: seconds a cached operator list stays fresh, and the
+# initial estimate of a scan's duration used for progress reporting.
+NETWORK_SCAN_TTL = 600
+NETWORK_SCAN_DURATION = 60.0
+# Seconds to wait for a USSD reply, and for the next step of a menu.
+USSD_TIMEOUT = 30.0
+# HTTP gateway: listening address and the number of messages queued per
+# modem before requests are turned away.
+GATEWAY_HOST = '127.0.0.1'
+GATEWAY_PORT = 8080
+GATEWAY_MAX_PENDING = 100
+# Serial to TCP bridge: listening address and seconds to wait for a
+# connection to be set up.
+BRIDGE_HOST = '127.0.0.1'
+BRIDGE_PORT = 7070
+BRIDGE_CONNECT_TIMEOUT = 10.0
+# Heartbeat: seconds between checks and to wait for an answer; failed
+# checks opening the circuit breaker and seconds before it's half-open.
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 2.0
+BREAKER_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 30.0
+# Outbound journal: bytes the file grows by, and finished messages after
+# which it is rewritten without them.
+JOURNAL_CHUNK = 1 << 20
+JOURNAL_COMPACT_EVERY = 10000
 if os.name == 'posix':
     # Posix systems.
     if 'linux' in os.sys.platform:
@@ -0,0 +1,198 @@
+"""Delivery tracking of sent messages.
+
+With status reports enabled (enable_status_reports(True)) the network
+confirms the delivery of each sent message with a status report naming
+the message reference +CMGS returned. Reports come either directly as a
++CDS message or, with the default new message indication settings,
+stored on the SIM and announced by +CDSI. A DeliveryTracker keeps the
+sent messages in a bounded index keyed by (modem, reference), matches
+reports of both kinds to them and keeps delivery latency statistics.
+
+Usage:
+    tracker = DeliveryTracker()
+    tracker.track(modem)
+    modem.subscriptions.start()
+    job = tracker.send(modem, '+353861234567', 'Hello')
+    tracker.stats()
+"""
+
+import collections
+import threading
+import time
+from humod import at_commands as atc
+from humod import errors
+
+PENDING = 'pending'
+DELIVERED = 'delivered'
+FAILED = 'failed'
+
+# Status report <st> ranges: below 32 the message is delivered, below
+# 64 the service center keeps trying, above it gave up.
+TEMPORARY_ERROR = 32
+PERMANENT_ERROR = 64
+
+
+class DeliveryJob(object):
+    """Sent message waiting for its status report."""
+
+    def __init__(self, modem, reference, number, data=None):
+        self.modem = modem
+        self.reference = reference
+        self.number = number
+        self.data = data
+        self.sent_at = time.time()
+        self.reported_at = None
+        self.status = PENDING
+        self.report_code = None
+
+    @property
+    def latency(self):
+        """Seconds from sending to the final report, or None."""
+        if self.reported_at is None:
+            return None
+        return self.reported_at - self.sent_at
+
+    def __repr__(self):
+        return '<DeliveryJob %s %d %s>' % (self.number, self.reference,
+                                           self.status)
+
+
+def parse_status_report(fields):
+    """Parse fields of a text mode +CDS message.
+
+    Arguments:
+        fields -- list of <fo>,<mr>,<ra>,<tora>,<scts>,<dt>,<st> values.
+    Returns:
+        (reference, status code) tuple, None if the fields are malformed.
+    """
+    if len(fields) < 2:
+        return None
+    reference, code = atc.safe_int(fields[1]), atc.safe_int(fields[-1])
+    if not isinstance(reference, int) or not isinstance(code, int):
+        return None
+    return reference, code
+
+
+class DeliveryTracker(object):
+    """Match status reports to sent messages."""
+
+    def __init__(self, maxlen=10000, on_report=None, latency_samples=1000):
+        """Constructor for DeliveryTracker class.
+
+        Arguments:
+            maxlen -- number of jobs kept, the oldest are dropped first,
+            on_report -- optional function called with each job reaching
+                         a final state,
+            latency_samples -- number of latencies kept for statistics.
+        """
+        self.maxlen = maxlen
+        self.on_report = on_report
+        self.jobs = collections.OrderedDict()
+        self.latencies = collections.deque(maxlen=latency_samples)
+        self.counts = {DELIVERED: 0, FAILED: 0, 'unmatched': 0,
+                       'dropped': 0, 'malformed': 0}
+        self._lock = threading.Lock()
+
+    def track(self, modem, enable=True):
+        """Subscribe to status reports of a modem and enable them."""
+        modem.subscriptions.subscribe('status report', self.cds_update)
+        modem.subscriptions.subscribe('stored status report',
+                                      self.cdsi_update)
+        if enable:
+            modem.enable_status_reports(True)
+
+    def add(self, modem, reference, number, data=None):
+        """Index a sent message by its reference, return its job."""
+        job = DeliveryJob(modem, reference, number, data)
+        with self._lock:
+            key = (modem, reference)
+            # Message references wrap around at 256, the newest wins.
+            self.jobs.pop(key, None)
+            self.jobs[key] = job
+            while len(self.jobs) > self.maxlen:
+                self.jobs.popitem(last=False)
+                self.counts['dropped'] += 1
+        return job
+
+    def send(self, modem, number, contents, data=None):
+        """Send a text message and track its delivery."""
+        return self.add(modem, modem.sms_send(number, contents), number,
+                        data)
+
+    def report(self, modem, reference, code):
+        """Apply a status report, return the matched job or None."""
+        with self._lock:
+            job = self.jobs.get((modem, reference))
+            if job is None:
+                self.counts['unmatched'] += 1
+                return None
+            job.report_code = code
+            if TEMPORARY_ERROR <= code < PERMANENT_ERROR:
+                # Still trying, wait for the final report.
+                return job
+            del self.jobs[(modem, reference)]
+            job.reported_at = time.time()
+            job.status = DELIVERED if code < TEMPORARY_ERROR else FAILED
+            self.counts[job.status] += 1
+            if job.status == DELIVERED:
+                self.latencies.append(job.latency)
+        if self.on_report:
+            self.on_report(job)
+        return job
+
+    def cds_update(self, modem, message):
+        """Handle the +CDS message."""
+        fields = atc.csv_ls(message.strip()[5:].strip())
+        self._report_fields(modem, fields)
+
+    def cdsi_update(self, modem, message):
+        """Handle the +CDSI message, reading the report off the prober."""
+        index = atc.safe_int(message.rsplit(',', 1)[-1].strip())
+        if not isinstance(index, int):
+            # Runs on the interpreter thread, drop the report and go on.
+            self._malformed()
+            return
+        thread = threading.Thread(target=self._read_stored,
+                                  args=(modem, index))
+        thread.daemon = True
+        thread.start()
+
+    def _read_stored(self, modem, index):
+        """Read and delete a status report stored by the modem."""
+        try:
+            fields = atc.csv_ls(atc._common_set(modem, '+CMGR', index)[0])
+            modem.sms_del(index)
+        except (errors.Error, IndexError):
+            return
+        # Drop the message status preceding the report fields.
+        self._report_fields(modem, fields[1:])
+
+    def _report_fields(self, modem, fields):
+        """Apply the fields of a status report, dropping malformed ones."""
+        parsed = parse_status_report(fields)
+        if parsed is None:
+            self._malformed()
+            return
+        self.report(modem, *parsed)
+
+    def _malformed(self):
+        """Count a dropped malformed report."""
+        with self._lock:
+            self.counts['malformed'] += 1
+
+    def pending(self):
+        """Return the number of messages waiting for a report."""
+        return len(self.jobs)
+
+    def stats(self):
+        """Return delivery counts and latency statistics in seconds."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counts, pending=len(self.jobs))
+        if latencies:
+            stats.update(
+                latency_mean=sum(latencies) / len(latencies),
+                latency_median=latencies[len(latencies) // 2],
+                latency_p95=latencies[int(len(latencies) * .95)],
+                latency_max=latencies[-1])
+        return stats
@@ -1,13 +1,141 @@
 """Exceptions and error-handling methods."""
 
-ERROR_CODES = ['COMMAND NOT SUPPORT', 'ERR', 'NO CARRIER', 'BUSY']
+# Final result codes reporting a failure, mapped to whether retrying the
+# command may succeed.
+FINAL_ERRORS = {'ERROR': False,
+                'ERR': False,
+                'COMMAND NOT SUPPORT': False,
+                'TOO MANY PARAMETERS': False,
+                'NO CARRIER': True,
+                'NO ANSWER': True,
+                'NO DIALTONE': True,
+                'BUSY': True}
+ERROR_CODES = list(FINAL_ERRORS)
+
+# +CME ERROR codes (3GPP TS 27.007): (description, retryable).
+CME_ERRORS = {
+    0: ('phone failure', False),
+    1: ('no connection to phone', False),
+    2: ('phone-adaptor link reserved', False),
+    3: ('operation not allowed', False),
+    4: ('operation not supported', False),
+    5: ('PH-SIM PIN required', False),
+    6: ('PH-FSIM PIN required', False),
+    7: ('PH-FSIM PUK required', False),
+    10: ('SIM not inserted', False),
+    11: ('SIM PIN required', False),
+    12: ('SIM PUK required', False),
+    13: ('SIM failure', False),
+    14: ('SIM busy', True),
+    15: ('SIM wrong', False),
+    16: ('incorrect password', False),
+    17: ('SIM PIN2 required', False),
+    18: ('SIM PUK2 required', False),
+    20: ('memory full', False),
+    21: ('invalid index', False),
+    22: ('not found', False),
+    23: ('memory failure', False),
+    24: ('text string too long', False),
+    25: ('invalid characters in text string', False),
+    26: ('dial string too long', False),
+    27: ('invalid characters in dial string', False),
+    30: ('no network service', True),
+    31: ('network timeout', True),
+    32: ('network not allowed - emergency calls only', True),
+    40: ('network personalization PIN required', False),
+    100: ('unknown', True),
+    103: ('illegal MS', False),
+    106: ('illegal ME', False),
+    107: ('GPRS services not allowed', False),
+    111: ('PLMN not allowed', False),
+    112: ('location area not allowed', True),
+    113: ('roaming not allowed in this location area', True),
+    132: ('service option not supported', False),
+    133: ('requested service option not subscribed', False),
+    134: ('service option temporarily out of order', True),
+    148: ('unspecified GPRS error', True),
+    149: ('PDP authentication failure', False),
+    150: ('invalid mobile class', False),
+}
+
+# +CMS ERROR codes (3GPP TS 27.005 and network causes of TS 24.011).
+CMS_ERRORS = {
+    1: ('unassigned number', False),
+    8: ('operator determined barring', False),
+    10: ('call barred', False),
+    21: ('short message transfer rejected', False),
+    27: ('destination out of service', True),
+    28: ('unidentified subscriber', False),
+    38: ('network out of order', True),
+    41: ('temporary failure', True),
+    42: ('congestion', True),
+    47: ('resources unavailable', True),
+    50: ('requested facility not subscribed', False),
+    69: ('requested facility not implemented', False),
+    96: ('invalid mandatory information', False),
+    300: ('ME failure', True),
+    301: ('SMS service of ME reserved', False),
+    302: ('operation not allowed', False),
+    303: ('operation not supported', False),
+    304: ('invalid PDU mode parameter', False),
+    305: ('invalid text mode parameter', False),
+    310: ('SIM not inserted', False),
+    311: ('SIM PIN required', False),
+    312: ('PH-SIM PIN required', False),
+    313: ('SIM failure', False),
+    314: ('SIM busy', True),
+    315: ('SIM wrong', False),
+    316: ('SIM PUK required', False),
+    317: ('SIM PIN2 required', False),
+    318: ('SIM PUK2 required', False),
+    320: ('memory failure', False),
+    321: ('invalid memory index', False),
+    322: ('memory full', False),
+    330: ('SMSC address unknown', False),
+    331: ('no network service', True),
+    332: ('network timeout', True),
+    340: ('no +CNMA acknowledgement expected', False),
+    500: ('unknown error', True),
+}
+
+# Reverse lookups for verbose error reports (AT+CMEE=2).
+_CME_CODES = dict((text.lower(), code)
+                  for code, (text, _) in CME_ERRORS.items())
+_CMS_CODES = dict((text.lower(), code)
+                  for code, (text, _) in CMS_ERRORS.items())
 
 class Error(Exception):
     """Generic Exception."""
     pass
 
 class AtCommandError(Error):
-    """AT Command exception."""
+    """AT Command exception.
+
+    Attributes:
+        code -- numeric error code or None,
+        description -- description of the error code or None,
+        retryable -- True if repeating the command may succeed.
+    """
+    code = None
+    description = None
+    retryable = False
+
+    def __init__(self, message, code=None, description=None,
+                 retryable=None):
+        Error.__init__(self, message)
+        if code is not None:
+            self.code = code
+        if description is not None:
+            self.description = description
+        if retryable is not None:
+            self.retryable = retryable
+
+class CmeError(AtCommandError):
+    """Mobile equipment error (+CME ERROR) exception."""
+    pass
+
+class CmsError(AtCommandError):
+    """Message service error (+CMS ERROR) exception."""
     pass
 
 class PppdError(Error):
@@ -18,7 +146,59 @@ class HumodUsageError(Error):
     """Humod usage error exception."""
     pass
 
+class MultiplexerError(Error):
+    """CMUX multiplexer exception."""
+    pass
+
+class ReplayError(Error):
+    """Traffic replay exception."""
+    pass
+
+class UssdError(Error):
+    """USSD request exception."""
+    pass
+
+class BridgeError(Error):
+    """Serial to TCP bridge exception."""
+    pass
+
+class CircuitOpenError(Error):
+    """Modem skipped because its circuit breaker is open."""
+    pass
+
+class JournalError(Error):
+    """Outbound journal exception."""
+    pass
+
+class WorkerError(Error):
+    """Modem worker process exception."""
+    pass
+
+def _coded_error(error_class, table, codes, line):
+    """Build a CmeError or CmsError from a result line."""
+    value = line[11:].strip()
+    if value.isdigit():
+        code = int(value)
+    else:
+        code = codes.get(value.lower())
+    description, retryable = table.get(code, (value or None, False))
+    return error_class(line, code, description, retryable)
+
+def classify(input_line):
+    """Return an exception for a final error result, None otherwise."""
+    line = input_line.strip()
+    retryable = FINAL_ERRORS.get(line)
+    if retryable is not None:
+        return AtCommandError(line, retryable=retryable)
+    prefix = line[:11]
+    if prefix == '+CME ERROR:':
+        return _coded_error(CmeError, CME_ERRORS, _CME_CODES, line)
+    if prefix == '+CMS ERROR:':
+        return _coded_error(CmsError, CMS_ERRORS, _CMS_CODES, line)
+    return None
+
 def check_for_errors(input_line):
-    """Check if input line contains error code."""
-    if ('ERROR' in input_line) or (input_line in ERROR_CODES):
-        raise AtCommandError(input_line)
+    """Raise an exception if input line is a final error result."""
+    error = classify(input_line)
+    if error:
+        raise error
@@ -0,0 +1,113 @@
+"""Bounded, coalescing queue of messages read from the control port.
+
+Status reports that are superseded by the next report of the same kind
+(^RSSI, ^MODE, ^DSFLOWRPT) are merged: a new report replaces the one
+still waiting in the queue, which keeps its place in line. When the
+queue is full, the oldest message that may be dropped makes room for the
+new one. Messages announcing calls, SMS and other one-off events are
+never dropped, even if that takes the queue over its size.
+"""
+
+import collections
+import threading
+from humod import defaults
+
+# Kinds of messages where only the newest one matters.
+COALESCED = frozenset([b'^RSSI', b'^MODE', b'^DSFLOWRPT'])
+# Kinds of messages that are never dropped.
+CRITICAL = frozenset([b'RING', b'+CMTI', b'+CLIP', b'+CDS', b'+CDSI',
+                      b'+CUSD'])
+
+
+def message_kind(line):
+    """Return the prefix identifying the kind of a message."""
+    colon = line.find(b':', 0, 16)
+    if colon > 0:
+        return line[:colon]
+    return line.rstrip()
+
+
+class EventQueue(object):
+    """Bounded FIFO queue merging superseded status reports.
+
+    Attributes:
+        merged -- number of messages merged into a waiting one,
+        dropped -- number of messages dropped for lack of room,
+        overflows -- number of times a message arrived at a full queue.
+    """
+
+    def __init__(self, maxsize=defaults.EVENT_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.merged = 0
+        self.dropped = 0
+        self.overflows = 0
+        self._entries = collections.deque()
+        self._latest = {}
+        self._cond = threading.Condition()
+
+    def put(self, line):
+        """Queue a message read from the port."""
+        kind = message_kind(line)
+        with self._cond:
+            entry = self._latest.get(kind)
+            if entry is not None:
+                entry[1] = line
+                self.merged += 1
+                return
+            if len(self._entries) >= self.maxsize:
+                self.overflows += 1
+                if not self._make_room(kind in CRITICAL):
+                    self.dropped += 1
+                    return
+            entry = [kind, line]
+            self._entries.append(entry)
+            if kind in COALESCED:
+                self._latest[kind] = entry
+            self._cond.notify()
+
+    def _make_room(self, critical):
+        """Drop the oldest droppable message.
+
+        Returns:
+            True if the new message may be queued.
+        """
+        for index, entry in enumerate(self._entries):
+            if entry[0] not in CRITICAL:
+                del self._entries[index]
+                self._forget(entry)
+                self.dropped += 1
+                return True
+        return critical
+
+    def _forget(self, entry):
+        """Remove entry from the merge index."""
+        if self._latest.get(entry[0]) is entry:
+            del self._latest[entry[0]]
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the oldest message.
+
+        Returns None if block is False or timeout expires on an empty
+        queue.
+        """
+        with self._cond:
+            if block and not self._entries:
+                self._cond.wait_for(lambda: self._entries, timeout)
+            if not self._entries:
+                return None
+            entry = self._entries.popleft()
+            self._forget(entry)
+            return entry[1]
+
+    def qsize(self):
+        """Return the number of waiting messages."""
+        return len(self._entries)
+
+    def empty(self):
+        """Check if the queue is empty."""
+        return not self._entries
+
+    def stats(self):
+        """Return a dict of queue counters."""
+        return {'size': len(self._entries), 'merged': self.merged,
+                'dropped': self.dropped, 'overflows': self.overflows}
@@ -0,0 +1,295 @@
+"""Streaming export of SIM contents.
+
+Device information, messages and phonebook entries are written record by
+record to JSON Lines or CSV, so memory use stays flat however full the
+SIM is. Messages come from a single +CMGL listing (Modem.sms_iter()) and
+phonebook entries are read in small ranges.
+
+With a checkpoint file only records not exported by an earlier run are
+written. The checkpoint is saved every few records, so an interrupted
+run picks up where it stopped.
+
+Usage:
+    python -m humod.export --modem /dev/ttyUSB0,/dev/ttyUSB1 \\
+        --format jsonl --output backup.jsonl --checkpoint backup.state
+
+or from Python:
+    with open('backup.jsonl', 'w') as out:
+        humod.export.export(modem, JsonlWriter(out))
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import zlib
+from humod import at_commands as atc
+from humod import errors
+from humod import siminfo
+
+KINDS = ('device', 'messages', 'phonebook')
+
+# Columns of CSV exports; device information is written as name/text pairs.
+CSV_FIELDS = ('kind', 'sim', 'index', 'status', 'number', 'type', 'name',
+              'time', 'text')
+# Fields left out of checkpoint fingerprints: +CMGL marks the unread
+# messages it lists as read.
+VOLATILE_FIELDS = ('status',)
+
+# Modem methods and siminfo functions read for the device record.
+DEVICE_INFO = (('imei', 'show_imei'), ('manufacturer', 'show_manufacturer'),
+               ('model', 'show_model'), ('revision', 'show_revision'))
+
+PHONEBOOK_BATCH = 50
+CHECKPOINT_EVERY = 100
+
+
+def iso_time(stamp):
+    """Turn a 'yy/MM/dd,hh:mm:ss+zz' timestamp into ISO 8601.
+
+    See siminfo.parse_dtime(). Timestamps in any other format are
+    returned unchanged.
+    """
+    try:
+        return siminfo.parse_dtime(stamp).isoformat()
+    except ValueError:
+        return stamp
+
+
+class JsonlWriter(object):
+    """Write records as JSON Lines."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, record):
+        """Write one record."""
+        self.out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        """Flush the output."""
+        self.out.flush()
+
+
+class CsvWriter(object):
+    """Write records as CSV rows with the CSV_FIELDS columns."""
+
+    def __init__(self, out, header=True):
+        self.out = out
+        self.writer = csv.DictWriter(out, CSV_FIELDS, extrasaction='ignore')
+        if header:
+            self.writer.writeheader()
+
+    def write(self, record):
+        """Write one record, a device record as one row per value."""
+        if record['kind'] != 'device':
+            self.writer.writerow(record)
+            return
+        for name, value in sorted(record.items()):
+            if name not in ('kind', 'sim'):
+                self.writer.writerow({'kind': 'device', 'sim': record['sim'],
+                                      'name': name, 'text': value})
+
+    def flush(self):
+        """Flush the output."""
+        self.out.flush()
+
+
+class Checkpoint(object):
+    """Fingerprints of exported records, per SIM, kept in a JSON file."""
+
+    def __init__(self, path, every=CHECKPOINT_EVERY):
+        self.path = path
+        self.every = every
+        self.state = {}
+        self._current = {}
+        self._unsaved = 0
+        if os.path.exists(path):
+            with open(path) as state_file:
+                self.state = json.load(state_file)
+
+    @staticmethod
+    def fingerprint(record):
+        """Return a short fingerprint of a record.
+
+        Fields the export itself changes, like the status of a message
+        listed unread, are left out.
+        """
+        record = dict((key, value) for key, value in record.items()
+                      if key not in VOLATILE_FIELDS)
+        data = json.dumps(record, sort_keys=True).encode('utf-8')
+        return '%08x' % zlib.crc32(data)
+
+    def seen(self, sim, kind, record):
+        """Check a record, remembering it for the next run.
+
+        Returns:
+            True if the record was exported before.
+        """
+        fingerprint = self.fingerprint(record)
+        self._current.setdefault((sim, kind), set()).add(fingerprint)
+        return fingerprint in self.state.get(sim, {}).get(kind, ())
+
+    def written(self):
+        """Count a written record, return True when a save is due."""
+        self._unsaved += 1
+        return self._unsaved >= self.every
+
+    def finish(self, sim, kind):
+        """Forget records of a kind that are no longer on the SIM."""
+        current = self._current.pop((sim, kind), set())
+        self.state.setdefault(sim, {})[kind] = sorted(current)
+        self.save()
+
+    def save(self):
+        """Write the checkpoint file atomically."""
+        state = dict((sim, dict(kinds)) for sim, kinds in self.state.items())
+        for (sim, kind), current in self._current.items():
+            kinds = state.setdefault(sim, {})
+            kinds[kind] = sorted(current.union(kinds.get(kind, ())))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+
+def device_info(modem):
+    """Yield the device record."""
+    record = {'kind': 'device'}
+    for name, method in DEVICE_INFO:
+        try:
+            record[name] = getattr(modem, method)()
+        except errors.Error:
+            record[name] = None
+    try:
+        record['imsi'] = siminfo.show_imsi(modem)
+    except errors.Error:
+        record['imsi'] = None
+    yield record
+
+
+def messages(modem, message_type='ALL'):
+    """Yield message records in constant memory."""
+    for header, text in modem.sms_iter(message_type):
+        index, status, number, stamp = siminfo.sms_header(header)
+        yield {'kind': 'message', 'index': index, 'status': status,
+               'number': str(number), 'time': iso_time(str(stamp)),
+               'text': text}
+
+
+def phonebook(modem, batch=PHONEBOOK_BATCH):
+    """Yield phonebook records, reading batch entries at a time."""
+    first, last = phonebook_range(modem)
+    for start in range(first, last + 1, batch):
+        try:
+            entries = modem.pbent_read(start, min(start + batch - 1, last))
+        except errors.CmeError:
+            # No entries in the range.
+            continue
+        for index, number, numtype, name in entries:
+            yield {'kind': 'phonebook', 'index': index,
+                   'number': str(number), 'type': numtype, 'name': name}
+
+
+def phonebook_range(modem):
+    """Return the first and last phonebook index."""
+    info = atc._common_dsc(modem, '+CPBR')[0]
+    first, last = atc.BRACKET_GROUP.findall(info)[0][1:-1].split('-')
+    return int(first), int(last)
+
+
+SOURCES = {'device': device_info, 'messages': messages,
+           'phonebook': phonebook}
+
+
+def export(modem, writer, kinds=KINDS, checkpoint=None, sim=None):
+    """Export SIM contents record by record.
+
+    Arguments:
+        modem -- Modem instance to export from,
+        writer -- JsonlWriter, CsvWriter or any object with write(record),
+        kinds -- sections to export, a subset of KINDS,
+        checkpoint -- optional Checkpoint to skip exported records,
+        sim -- name of the SIM in records and the checkpoint, the IMSI
+               by default.
+    Returns:
+        dict mapping kinds to the number of records written.
+    """
+    if sim is None:
+        sim = siminfo.show_imsi(modem)
+    counts = {}
+    for kind in kinds:
+        counts[kind] = 0
+        for record in SOURCES[kind](modem):
+            record['sim'] = sim
+            if checkpoint and checkpoint.seen(sim, kind, record):
+                continue
+            writer.write(record)
+            counts[kind] += 1
+            if checkpoint and checkpoint.written():
+                # Records must be out before the checkpoint names them.
+                writer.flush()
+                checkpoint.save()
+        if checkpoint:
+            writer.flush()
+            checkpoint.finish(sim, kind)
+    return counts
+
+
+def _parse_modem(value):
+    """Parse a DATA,CTRL command line argument."""
+    data, _, ctrl = value.partition(',')
+    if not (data and ctrl):
+        raise argparse.ArgumentTypeError('expected DATA,CTRL')
+    return data, ctrl
+
+
+def main(argv=None):
+    """Run an export from the command line."""
+    from humod.humodem import Modem
+    parser = argparse.ArgumentParser(prog='python -m humod.export',
+                                     description='Export SIM contents.')
+    parser.add_argument('--modem', action='append', type=_parse_modem,
+                        metavar='DATA,CTRL',
+                        help='modem to export, may be repeated')
+    parser.add_argument('--format', choices=('csv', 'jsonl'),
+                        default='jsonl')
+    parser.add_argument('--output', default='-',
+                        help='file to write, - for stdout')
+    parser.add_argument('--kinds', default=','.join(KINDS),
+                        help='comma separated sections to export')
+    parser.add_argument('--checkpoint',
+                        help='state file for incremental exports')
+    args = parser.parse_args(argv)
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error('unknown kinds: %s' % ', '.join(sorted(unknown)))
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    if args.output == '-':
+        out, appending = sys.stdout, False
+    else:
+        # Incremental exports add to the previous output.
+        appending = bool(checkpoint and os.path.exists(args.output) and
+                         os.path.getsize(args.output))
+        out = open(args.output, 'a' if checkpoint else 'w', newline='')
+    try:
+        if args.format == 'csv':
+            writer = CsvWriter(out, header=not appending)
+        else:
+            writer = JsonlWriter(out)
+        for data, ctrl in args.modem or [(None, None)]:
+            modem = Modem(data, ctrl) if data else Modem()
+            modem.enable_textmode(True)
+            counts = export(modem, writer, kinds, checkpoint)
+            sys.stderr.write('%s\n' % ', '.join(
+                '%s: %d' % (kind, counts[kind]) for kind in kinds))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
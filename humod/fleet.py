@@ -0,0 +1,165 @@
+"""Concurrent bring-up of many modems.
+
+Opening, identifying and unlocking modems one after another takes
+seconds per stick. bring_up() does it for all of them in parallel, so a
+cold start of a fleet takes about as long as the slowest modem.
+
+Usage:
+    reports = humod.fleet.bring_up([('/dev/ttyUSB0', '/dev/ttyUSB1'),
+                                    ('/dev/ttyUSB3', '/dev/ttyUSB4')],
+                                   pins={'353456789012345': 1234})
+    modems = [r.modem for r in reports.values() if r.ready]
+"""
+
+import time
+from concurrent import futures
+from humod import config
+from humod import errors
+from humod import siminfo
+
+# Answers of get_pin_status().
+PIN_READY = 'Sim card ready to use'
+PIN_REQUIRED = 'PIN required'
+
+SIM_VALID = 'Valid'
+
+
+class ModemReport(object):
+    """Outcome of bringing up one modem.
+
+    Attributes:
+        ports -- (data, ctrl) ports the modem was opened with,
+        imei -- IMEI of the modem or None if it couldn't be read,
+        modem -- Modem instance, None unless the bring-up succeeded; the
+                 ports of failed modems are closed,
+        ready -- True if the modem is unlocked and its SIM card is valid,
+        error -- description of the failure or None,
+        info -- system_info() of the modem,
+        elapsed -- seconds the bring-up took.
+    """
+
+    def __init__(self, ports):
+        self.ports = ports
+        self.imei = None
+        self.modem = None
+        self.ready = False
+        self.error = None
+        self.info = {}
+        self.elapsed = None
+
+    @property
+    def key(self):
+        """Key of the report, the IMEI or the control port if unknown."""
+        return self.imei or str(self.ports[1])
+
+    def __repr__(self):
+        return '<ModemReport %s %s>' % (
+            self.key, 'ready' if self.ready else 'failed: %s' % self.error)
+
+
+def _pin_for(pins, imei):
+    """Return the PIN of a modem, pins is a dict by IMEI or one PIN."""
+    if isinstance(pins, dict):
+        return pins.get(imei)
+    return pins
+
+
+def close(modem):
+    """Close the ports of a modem, ignoring errors."""
+    for name in ('data_port', 'ctrl_port', 'urc_port'):
+        port = getattr(modem, name, None)
+        if port is None or not hasattr(port, 'close'):
+            continue
+        try:
+            port.close()
+        except (EnvironmentError, errors.Error):
+            pass
+
+
+def bring_up_one(ports, pins=None, settings=None, modem_class=None):
+    """Open, identify, unlock and check one modem.
+
+    Arguments:
+        ports -- (data, ctrl) tuple of paths or port objects,
+        pins -- PIN for all modems, or a dict mapping IMEIs to PINs,
+        settings -- optional settings to apply, see humod.config,
+        modem_class -- class to instantiate, Modem by default.
+    Returns:
+        ModemReport instance.
+    """
+    if modem_class is None:
+        from humod.humodem import Modem as modem_class
+    report = ModemReport(ports)
+    started = time.time()
+    try:
+        report.modem = modem_class(*ports)
+        report.imei = report.modem.show_imei()
+        if report.modem.get_pin_status() == PIN_REQUIRED:
+            pin = _pin_for(pins, report.imei)
+            if pin is None:
+                raise errors.HumodUsageError('PIN required.')
+            report.modem.enter_pin(pin)
+        pin_status = report.modem.get_pin_status()
+        if pin_status != PIN_READY:
+            raise errors.HumodUsageError(pin_status + '.')
+        report.info = siminfo.system_info(report.modem)
+        if report.info.get('SIM card state') != SIM_VALID:
+            raise errors.HumodUsageError('SIM card state: %s.' %
+                                         report.info.get('SIM card state'))
+        if settings:
+            config.apply(report.modem, settings)
+        report.ready = True
+    except (errors.Error, EnvironmentError, KeyError, IndexError,
+            ValueError) as error:
+        report.error = str(error) or error.__class__.__name__
+        if report.modem is not None:
+            close(report.modem)
+            report.modem = None
+    report.elapsed = time.time() - started
+    return report
+
+
+def bring_up(port_pairs, pins=None, settings=None, timeout=None,
+             max_workers=None, modem_class=None):
+    """Bring up many modems concurrently.
+
+    Arguments:
+        port_pairs -- iterable of (data, ctrl) tuples,
+        pins, settings, modem_class -- see bring_up_one(),
+        timeout -- seconds to wait for all modems; those not done in time
+                   are reported as failed,
+        max_workers -- threads to use, one per modem by default.
+    Returns:
+        dict mapping IMEIs (control ports of modems that couldn't be
+        identified) to ModemReport instances.
+    """
+    port_pairs = list(port_pairs)
+    reports = {}
+    if not port_pairs:
+        return reports
+    executor = futures.ThreadPoolExecutor(max_workers or len(port_pairs))
+    try:
+        jobs = dict((executor.submit(bring_up_one, ports, pins, settings,
+                                     modem_class), ports)
+                    for ports in port_pairs)
+        done, not_done = futures.wait(jobs, timeout)
+        for job in done:
+            report = job.result()
+            reports[report.key] = report
+        for job in not_done:
+            report = ModemReport(jobs[job])
+            report.error = 'Timed out.'
+            reports[report.key] = report
+            # Nobody gets the modem, close it once it's open.
+            if not job.cancel():
+                job.add_done_callback(_close_late)
+    finally:
+        executor.shutdown(wait=False)
+    return reports
+
+
+def _close_late(job):
+    """Close the modem of a bring-up finishing after the timeout."""
+    modem = job.result().modem
+    if modem is not None:
+        close(modem)
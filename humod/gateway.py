@@ -0,0 +1,448 @@
+"""HTTP/JSON SMS gateway serving one or many modems.
+
+Endpoints:
+    POST /send -- send a message, {"number": ..., "text": ...}, or a list
+                  of them in one batch; "modem" picks a modem by name,
+    GET /inbox -- list messages of a modem (?modem=name&box=inbox),
+    GET /status -- state of all modems,
+    GET /metrics -- counters in Prometheus text format,
+    GET /events -- inbound messages as Server-Sent Events.
+
+Connections are kept alive between requests. Each modem runs its commands
+on a single worker thread; when a modem has max_pending messages queued
+further sends are answered with 503 and a Retry-After header.
+
+Run from the command line:
+    python -m humod.gateway --modem usb0=/dev/ttyUSB0,/dev/ttyUSB1
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent import futures
+from humod import at_commands as atc
+from humod import defaults
+from humod import errors
+from humod import siminfo
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           502: 'Bad Gateway', 503: 'Service Unavailable'}
+MAX_BODY = 1024 * 1024
+# Seconds close() waits for the event loop to close the server.
+CLOSE_TIMEOUT = 5
+# Inbound events buffered per Server-Sent Events client.
+EVENT_BUFFER = 100
+EVENT_KEEPALIVE = 15
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status code."""
+
+    def __init__(self, status, message, headers=()):
+        Exception.__init__(self, message)
+        self.status = status
+        self.headers = headers
+
+
+def _running_loop():
+    """Return the event loop running in this thread, or None."""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class ModemHandle(object):
+    """Modem served by the gateway, with its command worker and counters."""
+
+    def __init__(self, name, modem):
+        self.name = name
+        self.modem = modem
+        self.executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.pending = 0
+        self.sent = 0
+        self.failed = 0
+        self.received = 0
+
+    def read_message(self, index):
+        """Read a message with its header."""
+        self.modem.ctrl_lock.acquire()
+        try:
+            lines = atc.Command(self.modem, '+CMGR', prefixed=False).set(index)
+        finally:
+            self.modem.ctrl_lock.release()
+        header = atc.csv_ls(lines[0].split(': ', 1)[-1])
+        return {'modem': self.name, 'index': index, 'number': header[1],
+                'at': header[-1], 'text': '\n'.join(lines[1:])}
+
+    def status(self):
+        """Return a dict describing the modem state."""
+        sts = self.modem.status
+        return {'modem': self.name, 'pending': self.pending,
+                'sent': self.sent, 'failed': self.failed,
+                'received': self.received, 'rssi': sts.rssi,
+                'mode': sts.mode, 'bytes_tx': sts.bytes_tx,
+                'bytes_rx': sts.bytes_rx}
+
+
+class Gateway(object):
+    """Asyncio HTTP server exposing modems."""
+
+    def __init__(self, modems, max_pending=defaults.GATEWAY_MAX_PENDING):
+        """Constructor for Gateway class.
+
+        Arguments:
+            modems -- dict mapping names to Modem instances,
+            max_pending -- messages queued per modem before sends are
+                           refused with 503.
+        """
+        self.handles = dict((name, ModemHandle(name, modem))
+                            for name, modem in modems.items())
+        self.max_pending = max_pending
+        self.events_dropped = 0
+        self.server = None
+        self._loop = None
+        self._clients = set()
+        self._routes = {('POST', '/send'): self._send,
+                        ('GET', '/inbox'): self._inbox,
+                        ('GET', '/status'): self._status,
+                        ('GET', '/metrics'): self._metrics}
+
+    async def start(self, host=defaults.GATEWAY_HOST,
+                    port=defaults.GATEWAY_PORT):
+        """Subscribe to new messages and start listening."""
+        self._loop = asyncio.get_event_loop()
+        for handle in self.handles.values():
+            handle.modem.subscriptions.subscribe(
+                'new sms', self._new_message_action(handle))
+        self.server = await asyncio.start_server(self._serve, host, port)
+        return self.server
+
+    async def serve_forever(self, host=defaults.GATEWAY_HOST,
+                            port=defaults.GATEWAY_PORT):
+        """Start and serve until cancelled."""
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """Stop listening and shut the modem workers down.
+
+        May be called from any thread, the server is closed by its event
+        loop if that is running elsewhere.
+        """
+        loop = self._loop
+        if (self.server and loop is not None and loop.is_running() and
+                _running_loop() is not loop):
+            asyncio.run_coroutine_threadsafe(
+                self._close_server(), loop).result(CLOSE_TIMEOUT)
+        elif self.server:
+            self.server.close()
+        for handle in self.handles.values():
+            handle.executor.shutdown(wait=False)
+
+    async def _close_server(self):
+        """Stop listening, on the event loop."""
+        self.server.close()
+
+    # Inbound messages.
+
+    def _new_message_action(self, handle):
+        """Return an action fetching messages announced by +CMTI."""
+        def new_message(modem, message):
+            """Read the new message and publish it."""
+            index = atc.safe_int(message.rsplit(',', 1)[-1].strip())
+            if not isinstance(index, int):
+                # Malformed report, nothing to fetch.
+                return
+            future = handle.executor.submit(handle.read_message, index)
+            future.add_done_callback(
+                lambda done: self._publish(handle, done))
+        return new_message
+
+    def _publish(self, handle, future):
+        """Pass a fetched message to the event loop."""
+        if future.exception() is None:
+            handle.received += 1
+            self._loop.call_soon_threadsafe(self._broadcast, future.result())
+
+    def _broadcast(self, event):
+        """Queue an event for every Server-Sent Events client."""
+        for queue in self._clients:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.events_dropped += 1
+
+    # HTTP.
+
+    async def _serve(self, reader, writer):
+        """Serve requests of one connection until it's closed."""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as error:
+                    await self._respond(writer, error.status,
+                                        {'error': str(error)}, False)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if (method, path) == ('GET', '/events'):
+                    await self._events(writer)
+                    break
+                await self._dispatch(writer, method, path, query, body,
+                                     keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Read one request, return None on a closed connection."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, 'Malformed request line.')
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length.')
+        if length < 0:
+            raise HttpError(400, 'Invalid Content-Length.')
+        if length > MAX_BODY:
+            raise HttpError(413, 'Request body too large.')
+        body = await reader.readexactly(length) if length else b''
+        path, _, query_string = target.partition('?')
+        query = dict(item.partition('=')[::2]
+                     for item in query_string.split('&') if item)
+        return method, path, query, headers, body
+
+    async def _dispatch(self, writer, method, path, query, body, keep_alive):
+        """Route a request and write the response."""
+        route = self._routes.get((method, path))
+        headers = ()
+        try:
+            if route is None:
+                if any(path == known for _, known in self._routes):
+                    raise HttpError(405, 'Method not allowed.')
+                raise HttpError(404, 'Not found.')
+            status, payload = await route(query, body)
+        except HttpError as error:
+            status, payload = error.status, {'error': str(error)}
+            headers = error.headers
+        await self._respond(writer, status, payload, keep_alive, headers)
+
+    async def _respond(self, writer, status, payload, keep_alive,
+                       headers=()):
+        """Write a response, JSON encoding non-string payloads."""
+        if isinstance(payload, str):
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            content_type = 'application/json'
+            payload = json.dumps(payload, default=str)
+        body = payload.encode('utf-8')
+        head = ['HTTP/1.1 %d %s' % (status, REASONS[status]),
+                'Content-Type: %s' % content_type,
+                'Content-Length: %d' % len(body),
+                'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+        head.extend('%s: %s' % header for header in headers)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') +
+                     body)
+        await writer.drain()
+
+    # Endpoints.
+
+    def _handle(self, name):
+        """Return a modem handle by name."""
+        try:
+            return self.handles[name]
+        except KeyError:
+            raise HttpError(404, 'Unknown modem: %s.' % name)
+
+    def _pick(self, name, count):
+        """Pick the modem to queue count messages on."""
+        if name:
+            handle = self._handle(name)
+        else:
+            handle = min(self.handles.values(), key=lambda h: h.pending)
+        if handle.pending + count > self.max_pending:
+            raise HttpError(503, 'Modem queue full.', [('Retry-After', '1')])
+        return handle
+
+    async def _send_one(self, handle, message):
+        """Send one message on a modem worker."""
+        loop = asyncio.get_event_loop()
+        try:
+            reference = await loop.run_in_executor(
+                handle.executor, handle.modem.sms_send,
+                message['number'], message['text'])
+        except (errors.Error, IOError, ValueError, IndexError) as error:
+            handle.failed += 1
+            return {'modem': handle.name, 'error': str(error)}
+        finally:
+            handle.pending -= 1
+        handle.sent += 1
+        return {'modem': handle.name, 'reference': reference}
+
+    async def _send(self, query, body):
+        """Send a message or a batch of messages."""
+        try:
+            messages = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise HttpError(400, 'Invalid JSON.')
+        batch = isinstance(messages, list)
+        if not batch:
+            messages = [messages]
+        if not all(isinstance(message, dict) and
+                   isinstance(message.get('number'), str) and
+                   isinstance(message.get('text'), str)
+                   for message in messages):
+            raise HttpError(400, 'Messages need a number and a text.')
+        if not all(isinstance(message.get('modem'), (str, type(None)))
+                   for message in messages):
+            raise HttpError(400, 'Modem names must be strings.')
+        # Queue the whole batch on the modems before sending anything.
+        handles = []
+        try:
+            for message in messages:
+                handle = self._pick(message.get('modem'), 1)
+                handle.pending += 1
+                handles.append(handle)
+        except HttpError:
+            # Refuse the whole batch, releasing what was queued of it.
+            for handle in handles:
+                handle.pending -= 1
+            raise
+        results = await asyncio.gather(*[
+            self._send_one(handle, message)
+            for handle, message in zip(handles, messages)])
+        if batch:
+            return 200, results
+        return (502 if 'error' in results[0] else 200), results[0]
+
+    async def _inbox(self, query, body):
+        """List messages of a modem."""
+        handle = self._handle(query.get('modem') or sorted(self.handles)[0])
+        box = query.get('box', 'inbox')
+        if box not in siminfo.BOXES:
+            raise HttpError(400, 'Unknown box: %s.' % box)
+        loop = asyncio.get_event_loop()
+        try:
+            messages = await loop.run_in_executor(
+                handle.executor, siminfo.full_sms_list, handle.modem, box)
+        except errors.Error as error:
+            raise HttpError(502, str(error))
+        return 200, messages
+
+    async def _status(self, query, body):
+        """Return the state of all modems."""
+        return 200, [self.handles[name].status()
+                     for name in sorted(self.handles)]
+
+    async def _metrics(self, query, body):
+        """Return counters in Prometheus text format."""
+        lines = []
+        for metric, kind, field in (
+                ('humod_sms_sent_total', 'counter', 'sent'),
+                ('humod_sms_failed_total', 'counter', 'failed'),
+                ('humod_sms_received_total', 'counter', 'received'),
+                ('humod_queue_pending', 'gauge', 'pending'),
+                ('humod_rssi', 'gauge', 'rssi'),
+                ('humod_bytes_tx', 'gauge', 'bytes_tx'),
+                ('humod_bytes_rx', 'gauge', 'bytes_rx')):
+            lines.append('# TYPE %s %s' % (metric, kind))
+            for name in sorted(self.handles):
+                lines.append('%s{modem="%s"} %s' % (
+                    metric, name, self.handles[name].status()[field]))
+        lines.append('# TYPE humod_events_clients gauge')
+        lines.append('humod_events_clients %d' % len(self._clients))
+        lines.append('# TYPE humod_events_dropped_total counter')
+        lines.append('humod_events_dropped_total %d' % self.events_dropped)
+        return 200, '\n'.join(lines) + '\n'
+
+    async def _events(self, writer):
+        """Stream inbound messages as Server-Sent Events."""
+        queue = asyncio.Queue(EVENT_BUFFER)
+        self._clients.add(queue)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Connection: close\r\n\r\n')
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(),
+                                                   EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    writer.write(b': keepalive\n\n')
+                else:
+                    writer.write(('event: sms\ndata: %s\n\n' %
+                                  json.dumps(event)).encode('utf-8'))
+                await writer.drain()
+        finally:
+            self._clients.discard(queue)
+
+
+def _parse_modem(value):
+    """Parse a NAME=DATA,CTRL command line argument."""
+    name, _, ports = value.partition('=')
+    data, _, ctrl = ports.partition(',')
+    if not (name and data and ctrl):
+        raise argparse.ArgumentTypeError('expected NAME=DATA,CTRL')
+    return name, data, ctrl
+
+
+def main(argv=None):
+    """Run the gateway from the command line."""
+    from humod.humodem import Modem
+    parser = argparse.ArgumentParser(prog='python -m humod.gateway',
+                                     description='HTTP/JSON SMS gateway.')
+    parser.add_argument('--modem', action='append', type=_parse_modem,
+                        metavar='NAME=DATA,CTRL',
+                        help='modem to serve, may be repeated')
+    parser.add_argument('--host', default=defaults.GATEWAY_HOST)
+    parser.add_argument('--port', type=int, default=defaults.GATEWAY_PORT)
+    parser.add_argument('--max-pending', type=int,
+                        default=defaults.GATEWAY_MAX_PENDING)
+    args = parser.parse_args(argv)
+    specs = args.modem or [('modem0', defaults.DATA_PORT,
+                            defaults.CONTROL_PORT)]
+    modems = {}
+    for name, data, ctrl in specs:
+        modem = modems[name] = Modem(data, ctrl)
+        modem.enable_textmode(True)
+    gateway = Gateway(modems, args.max_pending)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(gateway.start(args.host, args.port))
+    for modem in modems.values():
+        modem.subscriptions.start()
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.close()
+        for modem in modems.values():
+            modem.subscriptions.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Modem heartbeat and circuit breaker.
+
+A modem that died usually shows up as a command hanging forever in
+return_data(). The Heartbeat thread checks each modem on a schedule,
+either passively, when the prober has read something from the modem
+recently, or with a bare AT command bounded by a timeout. Its outcomes
+drive a CircuitBreaker, whose state callers check before talking to the
+modem, so they skip a dead modem at once instead of waiting it out.
+
+Breaker states:
+    CLOSED -- the modem answers, commands go through,
+    OPEN -- the modem failed repeatedly, commands are refused,
+    HALF_OPEN -- the modem was given time to recover, a single trial
+                 command is let through and its outcome closes or opens
+                 the breaker again.
+
+Callers admitted by allow() report how their command went with
+record_outcome(), the CommandScheduler does so for every command it runs.
+
+Usage:
+    heartbeat = Heartbeat(modem)
+    heartbeat.start()
+    if heartbeat.breaker.allow():
+        try:
+            modem.sms_send(number, text)
+        except Exception as error:
+            heartbeat.breaker.record_outcome(error)
+            raise
+        heartbeat.breaker.record_outcome()
+"""
+
+import threading
+import time
+import serial
+from humod import defaults
+from humod import errors
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Errors meaning the modem didn't answer, as opposed to answering with an
+# error result.
+TRANSPORT_ERRORS = (EnvironmentError, serial.SerialException)
+
+
+class CircuitBreaker(object):
+    """Circuit breaker tracking the health of one modem."""
+
+    def __init__(self, failure_threshold=defaults.BREAKER_THRESHOLD,
+                 reset_timeout=defaults.BREAKER_RESET_TIMEOUT):
+        """Constructor for CircuitBreaker class.
+
+        Arguments:
+            failure_threshold -- consecutive failures opening the breaker,
+            reset_timeout -- seconds an open breaker waits before going
+                             half-open.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = CLOSED
+        # Start of the trial call admitted while half-open.
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Current state, CLOSED, OPEN or HALF_OPEN."""
+        if (self._state == OPEN and
+                time.time() - self.opened_at >= self.reset_timeout):
+            with self._lock:
+                if self._state == OPEN:
+                    self._state = HALF_OPEN
+        return self._state
+
+    def allow(self):
+        """True if a call may go to the modem.
+
+        While half-open only one trial call is admitted until its outcome
+        is recorded; a trial without an outcome after reset_timeout is
+        taken as lost and another one is admitted.
+        """
+        state = self.state
+        if state != HALF_OPEN:
+            return state == CLOSED
+        now = time.time()
+        with self._lock:
+            if (self._trial_at is not None and
+                    now - self._trial_at < self.reset_timeout):
+                return False
+            self._trial_at = now
+            return True
+
+    def record_success(self):
+        """Note that the modem answered."""
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+            self._trial_at = None
+
+    def record_failure(self):
+        """Note that the modem failed to answer."""
+        state = self.state
+        with self._lock:
+            self.failures += 1
+            if state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = OPEN
+                self.opened_at = time.time()
+            self._trial_at = None
+
+    def record_outcome(self, error=None):
+        """Note how a call went, failed if error is a transport error."""
+        if isinstance(error, TRANSPORT_ERRORS):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def __repr__(self):
+        return '<CircuitBreaker %s>' % self.state
+
+
+def ping(modem, timeout=defaults.HEARTBEAT_TIMEOUT):
+    """Send a bare AT command, return True if the modem answered in time.
+
+    Unlike the AT command methods, ping() doesn't wait for the control
+    lock or for the answer longer than timeout.
+    """
+    deadline = time.time() + timeout
+    if not modem.ctrl_lock.acquire(True, timeout):
+        return False
+    try:
+        port = modem.ctrl_port
+        port.read_waiting()
+        port.write(b'AT\r')
+        while time.time() < deadline:
+            line = port.readline().decode('ascii', 'replace').strip()
+            if line == 'OK' or errors.classify(line):
+                # An error is an answer too.
+                return True
+        return False
+    except (EnvironmentError, serial.SerialException, errors.Error):
+        return False
+    finally:
+        modem.ctrl_lock.release()
+
+
+class Heartbeat(threading.Thread):
+    """Thread checking a modem on a schedule and driving its breaker."""
+
+    def __init__(self, modem, breaker=None,
+                 interval=defaults.HEARTBEAT_INTERVAL,
+                 timeout=defaults.HEARTBEAT_TIMEOUT):
+        """Constructor for Heartbeat class.
+
+        Arguments:
+            modem -- Modem instance to check,
+            breaker -- CircuitBreaker to drive, a new one by default,
+            interval -- seconds between checks; traffic read by the
+                        prober within the last interval counts as a
+                        successful check,
+            timeout -- seconds to wait for the control lock and answer.
+        """
+        self.active = True
+        self.modem = modem
+        self.breaker = breaker or CircuitBreaker()
+        self.interval = interval
+        self.timeout = timeout
+        self.checks = 0
+        self.pings = 0
+        self._wakeup = threading.Event()
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def alive_passively(self):
+        """True if the prober read from the modem within the interval."""
+        last = self.modem.prober.last_activity
+        return last is not None and time.time() - last < self.interval
+
+    def check(self):
+        """Check the modem once and update the breaker.
+
+        Returns:
+            True if the modem is alive.
+        """
+        self.checks += 1
+        alive = self.alive_passively()
+        if not alive:
+            self.pings += 1
+            alive = ping(self.modem, self.timeout)
+        if alive:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return alive
+
+    def run(self):
+        """Check the modem every interval until stopped."""
+        while self.active:
+            self.check()
+            self._wakeup.wait(self.interval)
+
+    def stop(self):
+        """Stop the heartbeat thread."""
+        self.active = False
+        self._wakeup.set()
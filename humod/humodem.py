@@ -2,16 +2,17 @@
 
 import serial
 import threading
-try:
-    import Queue as queue
-except ImportError:
-    import queue
 import time
 import os
 from humod import errors
 from humod import actions
 from humod import defaults
 from humod import at_commands as atc
+from humod.eventqueue import EventQueue
+from humod.subscriptions import SubscriptionManager
+
+# Lines followed by message text, which is never a result code.
+MESSAGE_HEADERS = ('+CMGR:', '+CMGL:')
 
 
 class Interpreter(threading.Thread):
@@ -50,6 +51,8 @@ class QueueFeeder(threading.Thread):
         self.queue = queue
         self.ctrl_port = ctrl_port
         self.ctrl_lock = ctrl_lock
+        # Time of the last line read from the modem.
+        self.last_activity = None
         threading.Thread.__init__(self)
 
     def run(self):
@@ -58,8 +61,11 @@ class QueueFeeder(threading.Thread):
             self.ctrl_lock.acquire()
             try:
                 # set timeout
-                input_line = self.ctrl_port.readline() 
-                self.queue.put(input_line)
+                input_line = self.ctrl_port.readline()
+                # Read timeouts return nothing, skip them.
+                if input_line:
+                    self.last_activity = time.time()
+                    self.queue.put(input_line)
             finally:
                 self.ctrl_lock.release()
                 # Putting the thread on idle between releasing
@@ -76,7 +82,7 @@ class Prober(object):
     """Class responsible for reading in and queueing of control data."""
 
     def __init__(self, modem):
-        self.queue = queue.Queue()
+        self.queue = EventQueue()
         self._interpreter = None
         self._feeder = None
         self.modem = modem
@@ -85,13 +91,24 @@ class Prober(object):
     def _stop_interpreter(self):
         """Stop the interpreter."""
         self._interpreter.active = False
-        self._interpreter.queue.put('')
+        self._interpreter.queue.put(b'')
 
     def _start_interpreter(self):
         """Instanciate and start a new interpreter."""
         self._interpreter = Interpreter(self.modem, self.queue, self.patterns)
         self._interpreter.start()
 
+    @property
+    def last_activity(self):
+        """Time the modem was last heard from, None if not running."""
+        return self._feeder.last_activity if self._feeder else None
+
+    def set_patterns(self, patterns):
+        """Replace the pattern-action list, also while running."""
+        self.patterns = patterns
+        if self._interpreter:
+            self._interpreter.patterns = patterns
+
     def start(self, patterns=None):
         """Start the prober.
 
@@ -103,8 +120,12 @@ class Prober(object):
         if self._feeder:
             raise errors.HumodUsageError('Prober already started.')
         else:
-            self._feeder = QueueFeeder(self.queue, self.modem.ctrl_port, 
-                                       self.modem.ctrl_lock)
+            if self.modem.urc_port:
+                # Unsolicited messages have a channel of their own.
+                port, lock = self.modem.urc_port, threading.Lock()
+            else:
+                port, lock = self.modem.ctrl_port, self.modem.ctrl_lock
+            self._feeder = QueueFeeder(self.queue, port, lock)
             self._feeder.start()
             self._start_interpreter()
 
@@ -118,12 +139,12 @@ class Prober(object):
             raise errors.HumodUsageError('Prober not started.')
 
 
-# pylint: disable-msg=R0904
-# pylint: disable-msg=R0903
-# pylint: disable-msg=R0902
-# pylint: disable-msg=R0901
-class ModemPort(serial.Serial):
-    """Class extending serial.Serial by humod specific methods."""
+class BaseModemPort(object):
+    """Humod specific methods shared by all port transports.
+
+    Subclasses provide the pyserial style write(), read(), readline()
+    and inWaiting() methods.
+    """
 
     def send_at(self, cmd, suffix, prefixed=True):
         """Send serial text to the modem.
@@ -141,7 +162,7 @@ class ModemPort(serial.Serial):
         # Read in the echoed text.
         # Check for errors and raise exception with specific error code.
         input_line = self.readline().decode()
-        errors.check_for_errors(input_line)
+        self._check_final(input_line)
         # Return the result.
         if prefixed:
             # If the text being sent is an AT command, only relevant context
@@ -151,6 +172,12 @@ class ModemPort(serial.Serial):
         else:
             return self.return_data()
 
+    def _check_final(self, input_line):
+        """Raise the error of a final result line."""
+        error = errors.classify(input_line)
+        if error is not None:
+            raise error
+
     def read_waiting(self):
         """Clear the serial port by reading all data waiting in it."""
         return self.read(self.inWaiting())
@@ -166,6 +193,7 @@ class ModemPort(serial.Serial):
             AtCommandError: If an error is returned by the modem.
         """
         data = []
+        text = False
         while 1:
             # Read in one line of input.
             try:
@@ -174,9 +202,20 @@ class ModemPort(serial.Serial):
                 time.sleep(.2)
                 continue
                 
+            if text and input_line and \
+                    not input_line.startswith(MESSAGE_HEADERS) and \
+                    (self.inWaiting() or input_line != 'OK' and
+                     errors.classify(input_line) is None):
+                # Message text up to a blank line, even if it reads 'OK'
+                # or 'ERROR', unless that's the last line waiting.
+                if not command:
+                    data.append(input_line)
+                continue
+            text = input_line.startswith(MESSAGE_HEADERS)
             # Check for errors and raise exception with specific error code.
-            errors.check_for_errors(input_line)
-            if input_line == 'OK' and self.inWaiting() == 0:  # Final 'OK\r\n'
+            # Result codes are final even if unsolicited reports follow.
+            self._check_final(input_line)
+            if input_line == 'OK':  # Final 'OK\r\n'
                 return data
             # Append only related data (starting with "command" contents).
             if command:
@@ -189,6 +228,27 @@ class ModemPort(serial.Serial):
                     data.append(input_line)
 
 
+# pylint: disable-msg=R0904
+# pylint: disable-msg=R0903
+# pylint: disable-msg=R0902
+# pylint: disable-msg=R0901
+class ModemPort(BaseModemPort, serial.Serial):
+    """Class extending serial.Serial by humod specific methods."""
+
+
+def _open_port(port, baudrate):
+    """Return port if it is a port object, open it if it's a path.
+
+    Paths starting with tcp:// name ports exported by humod.bridge.
+    """
+    if hasattr(port, 'send_at'):
+        return port
+    if port.startswith('tcp://'):
+        from humod.bridge import TcpPort
+        return TcpPort.from_url(port, defaults.PROBER_TIMEOUT)
+    return ModemPort(port, baudrate, timeout=defaults.PROBER_TIMEOUT)
+
+
 class ConnectionStatus(object):
     """Data structure representing current state of the modem."""
 
@@ -201,6 +261,11 @@ class ConnectionStatus(object):
         self.bytes_rx = 0
         self.link_uptime = 0
         self.mode = None
+
+    def update(self, **fields):
+        """Set several fields at once."""
+        for name, value in fields.items():
+            setattr(self, name, value)
  
     def report(self):
         """Print connection status report."""
@@ -223,7 +288,7 @@ class Modem(atc.SetCommands, atc.GetCommands, atc.ShowCommands,
 
     # pylint: disable-msg=R0901
     # pylint: disable-msg=R0904
-    status = ConnectionStatus()
+    status = None
     baudrate = defaults.BAUDRATE
     pppd_params = defaults.PPPD_PARAMS
     _pppd_pid = None
@@ -231,36 +296,61 @@ class Modem(atc.SetCommands, atc.GetCommands, atc.ShowCommands,
 
     def __init__(self, data=defaults.DATA_PORT,
                  ctrl=defaults.CONTROL_PORT):
-        """Open a serial connection to the modem."""
-        self.data_port = ModemPort(data, defaults.BAUDRATE,
-                timeout=defaults.PROBER_TIMEOUT)
-        self.ctrl_port = ModemPort(ctrl, 9600,
-                timeout=defaults.PROBER_TIMEOUT)
+        """Open a serial connection to the modem.
+
+        Arguments:
+            data, ctrl -- device paths, or already open port objects
+                          implementing the BaseModemPort interface.
+        """
+        self.data_port = _open_port(data, defaults.BAUDRATE)
+        self.ctrl_port = _open_port(ctrl, 9600)
+        # Optional dedicated port for unsolicited messages, read by the
+        # prober instead of the control port when set.
+        self.urc_port = None
         self.ctrl_lock = threading.Lock()
+        self.status = ConnectionStatus()
         self.prober = Prober(self)
+        self.subscriptions = SubscriptionManager(self)
         atc.SetCommands.__init__(self)
         atc.GetCommands.__init__(self)
         atc.EnterCommands.__init__(self)
         atc.InteractiveCommands.__init__(self)
         atc.ShowCommands.__init__(self)
 
+    def _dial(self, dialtone_check=True):
+        """Dial out on the data port.
+
+        Returns:
+            True if the modem answered with CONNECT, False otherwise.
+        """
+        data_port = self.data_port
+        if not data_port.isOpen():
+            data_port.open()
+        data_port.write(b'ATZ\r\n')
+        data_port.return_data()
+        if not dialtone_check:
+            data_port.write(b'ATX3\r\n')
+            data_port.return_data()
+        data_port.write(('ATDT%s\r\n' % self._dial_num).encode())
+        data_port.readline()
+        status = data_port.readline().decode()
+        return status.startswith('CONNECT')
+
+    def _pppd_args(self):
+        """Return pppd argument vector for the data port.
+
+        The data port has to be a local serial device, the port of a
+        TcpPort is a URL pppd can't open.
+        """
+        return [defaults.PPPD_PATH, self.baudrate,
+                self.data_port.port] + self.pppd_params
+
     def connect(self, dialtone_check=True):
         """Use pppd to connect to the network."""
         # Modem is not connected if _pppd_pid is set to None.
         if not self._pppd_pid:
-            data_port = self.data_port
-            data_port.open()
-            data_port.write(b'ATZ\r\n')
-            data_port.return_data()
-            if not dialtone_check:
-                data_port.write(b'ATX3\r\n')
-                data_port.return_data()
-            data_port.write(('ATDT%s\r\n' % self._dial_num).encode())
-            data_port.readline()
-            status = data_port.readline()
-            if status.startswith('CONNECT'):
-                pppd_args = [defaults.PPPD_PATH, self.baudrate,
-                             self.data_port.port] + self.pppd_params
+            if self._dial(dialtone_check):
+                pppd_args = self._pppd_args()
                 pid = os.fork()
                 if pid:
                     self._pppd_pid = pid
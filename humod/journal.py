@@ -0,0 +1,440 @@
+"""Crash-safe outbound message queue.
+
+Messages put into an OutboundQueue are appended to a memory-mapped
+journal before put() returns. A commit thread flushes the journal to
+disk for all writers at once (group commit), so many messages share one
+msync instead of paying one each.
+
+Every change of a message is a journal record: ENQUEUE when queued,
+SENDING right before +CMGS, SENT with the message reference once the
+modem accepted it, FAILED or RETRY otherwise. On start the journal is
+replayed: queued messages are queued again, while messages that were
+being sent when the process died are "in doubt", as the modem may or may
+not have sent them. They are never resent automatically; resolve() them
+once you know, e.g. from delivery reports. Each message is thus sent at
+most once, and exactly once unless the process dies mid-send.
+
+Records are framed as length, CRC32, type and message ID followed by a
+JSON body; replay stops at the first torn or corrupt record.
+
+Usage:
+    queue = OutboundQueue('/var/lib/humod/outbox.journal')
+    queue.put('+353861234567', 'Hello')
+    # In a worker per modem:
+    queue.drain(modem)
+"""
+
+import collections
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from humod import defaults
+from humod import errors
+
+MAGIC = b'HUMODJ\x00\x01'
+RECORD = struct.Struct('<IIBQ')
+
+# Record types.
+ENQUEUE = 1
+SENDING = 2
+SENT = 3
+FAILED = 4
+RETRY = 5
+
+# Message states.
+QUEUED = 'queued'
+IN_FLIGHT = 'in flight'
+IN_DOUBT = 'in doubt'
+DONE = 'done'
+
+
+def _pack(kind, job_id, body):
+    """Return a framed record."""
+    checked = RECORD.pack(len(body), 0, kind, job_id)[8:] + body
+    return struct.pack('<II', len(body), zlib.crc32(checked)) + checked
+
+
+def _encode(value):
+    """Encode a record body."""
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _sync_dir(path):
+    """Flush the directory entry of a file, making a rename durable."""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Job(object):
+    """Message of the outbound queue."""
+
+    def __init__(self, job_id, number, text, data=None):
+        self.id = job_id
+        self.number = number
+        self.text = text
+        self.data = data
+        self.state = QUEUED
+        self.modem = None
+        self.reference = None
+        self.error = None
+
+    def __repr__(self):
+        return '<Job %d %s %s>' % (self.id, self.number, self.state)
+
+
+class Journal(object):
+    """Append-only memory-mapped record log with group commit."""
+
+    def __init__(self, path, chunk_size=defaults.JOURNAL_CHUNK):
+        """Open or create a journal file.
+
+        Arguments:
+            path -- journal file,
+            chunk_size -- bytes the file grows by, a multiple of the
+                          memory page size.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.commits = 0
+        self._file = None
+        self._map = None
+        self._written = 0
+        self._committed = 0
+        self._synced = 0
+        # Bumped by replace(), offsets of older files are all durable.
+        self._generation = 0
+        self._active = True
+        self._lock = threading.Lock()
+        self._map_lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._open()
+        self._committer = threading.Thread(target=self._commit_loop)
+        self._committer.daemon = True
+        self._committer.start()
+
+    def _open(self):
+        """Map the file, creating it if it's new."""
+        new = not os.path.exists(self.path) or not os.path.getsize(self.path)
+        self._file = open(self.path, 'a+b')
+        if new:
+            self._file.truncate(self.chunk_size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        if new:
+            self._map[:len(MAGIC)] = MAGIC
+            self._map.flush()
+        elif self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            self._file.close()
+            raise errors.JournalError('Not a journal: %s.' % self.path)
+        self._written = self._committed = self._synced = len(MAGIC)
+
+    def records(self):
+        """Yield (type, id, body) of valid records, up to a torn one.
+
+        Only to be called before records are appended.
+        """
+        offset = len(MAGIC)
+        size = len(self._map)
+        while offset + RECORD.size <= size:
+            length, crc, kind, job_id = RECORD.unpack_from(self._map, offset)
+            end = offset + RECORD.size + length
+            if not kind or end > size:
+                break
+            if zlib.crc32(self._map[offset + 8:end]) != crc:
+                break
+            yield kind, job_id, self._map[offset + RECORD.size:end]
+            offset = end
+        self._written = self._committed = self._synced = offset
+
+    def append(self, kind, job_id, body=b''):
+        """Append a record, return the position durability waits for."""
+        record = _pack(kind, job_id, body)
+        with self._cond:
+            if not self._active:
+                raise errors.JournalError('Journal closed.')
+            if self._written + len(record) > len(self._map):
+                self._grow(len(record))
+            self._map[self._written:self._written + len(record)] = record
+            self._written += len(record)
+            self._cond.notify_all()
+            return self._generation, self._written
+
+    def wait(self, position):
+        """Wait until everything up to a position is on disk."""
+        generation, offset = position
+        with self._cond:
+            while (self._generation == generation and
+                   self._committed < offset):
+                if not self._active:
+                    raise errors.JournalError('Journal closed.')
+                self._cond.wait()
+
+    def _grow(self, needed):
+        """Extend the file and the map by whole chunks."""
+        with self._map_lock:
+            self._map.flush()
+            self._synced = self._written
+            size = len(self._map) + max(self.chunk_size, needed)
+            size += -size % self.chunk_size
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _commit_loop(self):
+        """Flush appended records for all waiting writers at once."""
+        while True:
+            with self._cond:
+                while self._active and self._written == self._committed:
+                    self._cond.wait()
+                if self._written == self._committed:
+                    return
+                target = self._written
+            with self._map_lock:
+                # Growing the file may have flushed the records already.
+                if target > self._synced:
+                    # msync() takes page aligned offsets.
+                    start = self._synced - self._synced % mmap.PAGESIZE
+                    self._map.flush(start, target - start)
+                    self._synced = target
+            with self._cond:
+                self._committed = target
+                self.commits += 1
+                self._cond.notify_all()
+
+    def replace(self, records):
+        """Atomically replace the journal with (type, id, body) records."""
+        with self._cond:
+            # Let the commit thread finish with the old file.
+            while self._committed < self._written:
+                self._cond.wait()
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as tmp:
+                tmp.write(MAGIC)
+                for kind, job_id, body in records:
+                    tmp.write(_pack(kind, job_id, body))
+                size = tmp.tell()
+                tmp.truncate(size + self.chunk_size - size % self.chunk_size)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            with self._map_lock:
+                self._map.close()
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                _sync_dir(self.path)
+                self._file = open(self.path, 'a+b')
+                self._map = mmap.mmap(self._file.fileno(), 0)
+            self._written = self._committed = self._synced = size
+            self._generation += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Flush and close the journal."""
+        with self._cond:
+            if not self._active:
+                return
+            self._active = False
+            self._cond.notify_all()
+        self._committer.join()
+        with self._map_lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+
+class OutboundQueue(object):
+    """Durable queue of messages to send."""
+
+    def __init__(self, path, chunk_size=defaults.JOURNAL_CHUNK,
+                 compact_every=defaults.JOURNAL_COMPACT_EVERY):
+        """Open the queue and recover its journal.
+
+        Arguments:
+            path -- journal file,
+            chunk_size -- see Journal,
+            compact_every -- finished jobs after which the journal is
+                             rewritten without them.
+        """
+        self.journal = Journal(path, chunk_size)
+        self.compact_every = compact_every
+        self._finished = 0
+        self.jobs = {}
+        self.in_doubt = {}
+        self._queue = collections.deque()
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._recover()
+
+    def _recover(self):
+        """Replay the journal and compact it to the unfinished jobs."""
+        jobs = collections.OrderedDict()
+        for kind, job_id, body in self.journal.records():
+            self._next_id = max(self._next_id, job_id + 1)
+            if kind == ENQUEUE:
+                jobs[job_id] = Job(job_id, *json.loads(body.decode('utf-8')))
+                continue
+            job = jobs.get(job_id)
+            if job is None:
+                continue
+            if kind == SENDING:
+                job.state = IN_DOUBT
+                job.modem = json.loads(body.decode('utf-8'))
+            elif kind == RETRY:
+                job.state = QUEUED
+            else:
+                del jobs[job_id]
+        for job in jobs.values():
+            self.jobs[job.id] = job
+            if job.state == IN_DOUBT:
+                self.in_doubt[job.id] = job
+            else:
+                self._queue.append(job)
+        self.compact()
+
+    def compact(self):
+        """Rewrite the journal with records of unfinished jobs only."""
+        with self._cond:
+            self._finished = 0
+            records = []
+            for job in sorted(self.jobs.values(), key=lambda job: job.id):
+                records.append((ENQUEUE, job.id, _encode(
+                    [job.number, job.text, job.data])))
+                if job.state in (IN_FLIGHT, IN_DOUBT) and job.modem is not None:
+                    records.append((SENDING, job.id, _encode(job.modem)))
+            self.journal.replace(records)
+
+    def put(self, number, text, data=None, durable=True):
+        """Queue a message.
+
+        Arguments:
+            number, text -- recipient and body,
+            data -- any JSON serializable value kept with the job,
+            durable -- wait until the message is on disk.
+        Returns:
+            ID of the job.
+        """
+        with self._cond:
+            job = Job(self._next_id, number, text, data)
+            self._next_id += 1
+            position = self.journal.append(ENQUEUE, job.id,
+                                         _encode([number, text, data]))
+            self.jobs[job.id] = job
+            self._queue.append(job)
+            self._cond.notify()
+        if durable:
+            self.journal.wait(position)
+        return job.id
+
+    def get(self, timeout=None):
+        """Take the next queued job, or None after timeout."""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            if not self._queue:
+                return None
+            job = self._queue.popleft()
+            job.state = IN_FLIGHT
+            return job
+
+    def pending(self):
+        """Return the number of queued jobs."""
+        return len(self._queue)
+
+    def sending(self, job, modem_name=''):
+        """Record that a job is about to be sent, durably."""
+        with self._cond:
+            job.modem = modem_name
+            position = self.journal.append(SENDING, job.id,
+                                           _encode(modem_name))
+        self.journal.wait(position)
+
+    def sent(self, job, reference):
+        """Record the +CMGS reference of a sent job."""
+        job.reference = reference
+        self._finish(job, SENT, reference)
+
+    def failed(self, job, error, retry=False):
+        """Record a failed job, queueing it again if retry is set."""
+        job.error = str(error)
+        if not retry:
+            self._finish(job, FAILED, job.error)
+            return
+        with self._cond:
+            self.journal.append(RETRY, job.id)
+            job.state = QUEUED
+            self.in_doubt.pop(job.id, None)
+            self._queue.appendleft(job)
+            self._cond.notify()
+
+    def _finish(self, job, kind, value):
+        """Record the final state of a job."""
+        with self._cond:
+            self.journal.append(kind, job.id, _encode(value))
+            job.state = DONE
+            self.jobs.pop(job.id, None)
+            self.in_doubt.pop(job.id, None)
+            self._finished += 1
+            if self._finished >= self.compact_every:
+                self._finished = 0
+                self.compact()
+
+    def resolve(self, job_id, sent, reference=None):
+        """Settle an in doubt job.
+
+        Arguments:
+            job_id -- ID of the job,
+            sent -- True if it was sent, False to queue it again, None
+                    to give up on it,
+            reference -- +CMGS reference of a sent job, if known.
+        """
+        job = self.in_doubt[job_id]
+        if sent:
+            self.sent(job, reference)
+        elif sent is None:
+            self.failed(job, 'In doubt.')
+        else:
+            self.failed(job, 'Not sent.', retry=True)
+
+    def send(self, modem, job, modem_name=''):
+        """Send a job with a modem, journaling each step.
+
+        Returns:
+            +CMGS reference of the message.
+        """
+        self.sending(job, modem_name)
+        try:
+            reference = modem.sms_send(job.number, job.text)
+        except errors.AtCommandError as error:
+            # The modem refused the message, it's safe to try again.
+            self.failed(job, error, retry=error.retryable)
+            raise
+        except BaseException:
+            # No answer, the message may have been sent.
+            with self._cond:
+                job.state = IN_DOUBT
+                self.in_doubt[job.id] = job
+            raise
+        self.sent(job, reference)
+        return reference
+
+    def drain(self, modem, modem_name='', stop=None, timeout=1.0):
+        """Send queued jobs with a modem until stop (an Event) is set."""
+        while stop is None or not stop.is_set():
+            job = self.get(timeout)
+            if job is None:
+                if stop is None:
+                    return
+                continue
+            try:
+                self.send(modem, job, modem_name)
+            except errors.AtCommandError:
+                pass
+
+    def close(self):
+        """Flush and close the journal."""
+        self.journal.close()
@@ -0,0 +1,128 @@
+"""Background network scans with cached results.
+
+A +COPS=? scan takes 30 to 120 seconds, during which most modems don't
+accept other commands. The NetworkScanner runs scans in the background,
+through a CommandScheduler at background priority when one is given, and
+caches the operator lists per location, so callers get an answer from
+the cache immediately.
+
+Usage:
+    scanner = NetworkScanner(modem, scheduler=scheduler)
+    scanner.networks('cell-1234')  # None at first, starts a scan.
+    scanner.progress('cell-1234')
+    0.42
+"""
+
+import threading
+import time
+from concurrent import futures
+from humod import defaults
+from humod.scheduler import BACKGROUND
+
+# Weight of the last scan in the running estimate of scan duration.
+DURATION_ALPHA = .5
+
+
+class NetworkScanner(object):
+    """Run network scans in the background and cache their results."""
+
+    def __init__(self, modem, ttl=defaults.NETWORK_SCAN_TTL, scheduler=None):
+        """Constructor for NetworkScanner class.
+
+        Arguments:
+            modem -- Modem instance to scan with,
+            ttl -- seconds a cached operator list stays fresh,
+            scheduler -- optional CommandScheduler to run scans on.
+        """
+        self.modem = modem
+        self.ttl = ttl
+        self.scheduler = scheduler
+        self.expected_duration = defaults.NETWORK_SCAN_DURATION
+        self._cache = {}
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def scan(self, location=None):
+        """Start a scan for location unless one is running.
+
+        Arguments:
+            location -- any hashable key of the caller's choice, e.g. a
+                        cell ID; results are cached per location.
+        Returns:
+            Future resolving to the operator list.
+        """
+        with self._lock:
+            running = self._scans.get(location)
+            if running and not running[1].done():
+                return running[1]
+            if self.scheduler:
+                future = self.scheduler.submit(self._scan, location,
+                                               priority=BACKGROUND,
+                                               caller=self)
+            else:
+                future = futures.Future()
+                thread = threading.Thread(target=self._run,
+                                          args=(future, location))
+                thread.daemon = True
+                thread.start()
+            self._scans[location] = [None, future]
+            return future
+
+    def _run(self, future, location):
+        """Run a scan in a thread of its own."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self._scan(location))
+        except Exception as error:
+            future.set_exception(error)
+
+    def _scan(self, location):
+        """Scan, update the duration estimate and cache the result."""
+        started = time.time()
+        with self._lock:
+            self._scans[location][0] = started
+        networks = self.modem.get_networks() or []
+        finished = time.time()
+        with self._lock:
+            self.expected_duration += DURATION_ALPHA * (
+                finished - started - self.expected_duration)
+            self._cache[location] = (finished, networks)
+        return networks
+
+    def networks(self, location=None, refresh=True):
+        """Return the cached operator list of a location.
+
+        A missing or stale list is refreshed in the background if refresh
+        is set. A stale list is still returned; None means the location
+        has never been scanned.
+        """
+        entry = self._cache.get(location)
+        if refresh and (not entry or time.time() - entry[0] >= self.ttl):
+            self.scan(location)
+        return entry[1] if entry else None
+
+    def age(self, location=None):
+        """Return the age of the cached list in seconds, or None."""
+        entry = self._cache.get(location)
+        return time.time() - entry[0] if entry else None
+
+    def progress(self, location=None):
+        """Return the estimated progress of a scan between 0 and 1.
+
+        Returns None if no scan of the location was ever started.
+        """
+        running = self._scans.get(location)
+        if not running:
+            return None
+        started, future = running
+        if future.done():
+            return 1.0
+        if not started:
+            return 0.0
+        return min((time.time() - started) / self.expected_duration, .99)
+
+    def invalidate(self, location=None):
+        """Drop the cached list of a location."""
+        with self._lock:
+            self._cache.pop(location, None)
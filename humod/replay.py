@@ -0,0 +1,219 @@
+"""Serial traffic recording and replay.
+
+A RecordingPort wraps a ModemPort and logs every chunk written to or read
+from it, with monotonic timestamps, to a capture file. A ReplayPort plays
+such a capture back to Modem, Prober or siminfo code, either at the
+recorded pace or as fast as possible, so parsing and locking can be
+profiled against real traffic without hardware.
+
+Capture files start with MAGIC, followed by records made of a RECORD
+header (direction, seconds since the start of the capture, length) and
+the data itself.
+
+Usage:
+    humod.replay.record(modem, 'ctrl.cap')
+    ...
+    modem = humod.replay.replay_modem('ctrl.cap')
+"""
+
+import collections
+import struct
+import threading
+import time
+from humod import defaults
+from humod import errors
+from humod.humodem import BaseModemPort, Modem
+
+MAGIC = b'HUMODCAP\x01'
+RECORD = struct.Struct('<cdI')
+WRITE = b'W'
+READ = b'R'
+
+
+def read_capture(path):
+    """Yield (direction, timestamp, data) records of a capture file."""
+    with open(path, 'rb') as capture:
+        if capture.read(len(MAGIC)) != MAGIC:
+            raise errors.ReplayError('Not a capture file: %s.' % path)
+        while True:
+            header = capture.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            direction, stamp, length = RECORD.unpack(header)
+            yield direction, stamp, capture.read(length)
+
+
+class RecordingPort(BaseModemPort):
+    """ModemPort wrapper logging all traffic to a capture file."""
+
+    def __init__(self, port, path):
+        self.wrapped = port
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+    def _record(self, direction, data):
+        """Append a record to the capture file."""
+        if data:
+            with self._lock:
+                self._file.write(RECORD.pack(
+                    direction, time.monotonic() - self._start, len(data)))
+                self._file.write(data)
+
+    def write(self, data):
+        """Write to the wrapped port and record the data."""
+        self._record(WRITE, data)
+        return self.wrapped.write(data)
+
+    def read(self, size=1):
+        """Read from the wrapped port and record the data."""
+        data = self.wrapped.read(size)
+        self._record(READ, data)
+        return data
+
+    def readline(self):
+        """Read a line from the wrapped port and record it."""
+        data = self.wrapped.readline()
+        self._record(READ, data)
+        return data
+
+    def inWaiting(self):
+        """Return the number of bytes waiting in the wrapped port."""
+        return self.wrapped.inWaiting()
+
+    def close(self):
+        """Close the capture file and the wrapped port."""
+        with self._lock:
+            self._file.close()
+        self.wrapped.close()
+
+
+class ReplayPort(BaseModemPort):
+    """Port playing a capture file back.
+
+    Data the device sent between two writes of the host is released once
+    the host has made the first of these writes. Writes are compared with
+    the capture and counted in mismatches, but don't alter the replay.
+    """
+
+    def __init__(self, path=None, realtime=False,
+                 timeout=defaults.PROBER_TIMEOUT):
+        """Constructor for ReplayPort class.
+
+        Arguments:
+            path -- capture file, None replays an empty capture,
+            realtime -- reproduce the recorded delays of the device,
+            timeout -- kept for compatibility with serial ports.
+        """
+        records = read_capture(path) if path else []
+        self._records = collections.deque(records)
+        self.port = path
+        self.realtime = realtime
+        self.timeout = timeout
+        self.mismatches = 0
+        self._buffer = bytearray()
+        # Capture time of the last replayed record, and the offset of
+        # the capture clock from the monotonic clock in realtime mode.
+        self._now = 0.0
+        self._offset = time.monotonic()
+
+    def _clock(self):
+        """Return the current position in capture time."""
+        if self.realtime:
+            return time.monotonic() - self._offset
+        return self._now
+
+    def _release(self):
+        """Move the next device record into the buffer.
+
+        Returns:
+            False if the host has to write before the device sends more.
+        """
+        if not self._records or self._records[0][0] != READ:
+            return False
+        _, stamp, data = self._records.popleft()
+        if self.realtime:
+            delay = stamp - self._clock()
+            if delay > 0:
+                time.sleep(delay)
+        self._now = max(self._now, stamp)
+        self._buffer.extend(data)
+        return True
+
+    def _check_exhausted(self):
+        """Raise ReplayError once the capture has been played back."""
+        if not self._records and not self._buffer:
+            raise errors.ReplayError('Capture exhausted.')
+
+    def write(self, data):
+        """Replay the host write, releasing the device's answer."""
+        while self._release():
+            pass
+        if self._records:
+            _, stamp, expected = self._records.popleft()
+            self._now = stamp
+            if self.realtime:
+                self._offset = max(self._offset, time.monotonic() - stamp)
+            if expected != data:
+                self.mismatches += 1
+        else:
+            self.mismatches += 1
+        return len(data)
+
+    def read(self, size=1):
+        """Read up to size bytes of replayed device data."""
+        self._check_exhausted()
+        while len(self._buffer) < size and self._release():
+            pass
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self):
+        """Read a line of replayed device data."""
+        self._check_exhausted()
+        while b'\n' not in self._buffer and self._release():
+            pass
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return data
+
+    def inWaiting(self):
+        """Return the number of bytes the device has sent by now."""
+        waiting = len(self._buffer)
+        now = self._clock()
+        for direction, stamp, data in self._records:
+            if direction != READ or stamp > now:
+                break
+            waiting += len(data)
+        return waiting
+
+    def isOpen(self):
+        """Replay ports are always open."""
+        return True
+
+    def open(self):
+        """Nothing to open."""
+        pass
+
+    def close(self):
+        """Nothing to close."""
+        pass
+
+
+def record(modem, ctrl_path, data_path=None):
+    """Start recording modem traffic, before starting the prober."""
+    modem.ctrl_port = RecordingPort(modem.ctrl_port, ctrl_path)
+    if data_path:
+        modem.data_port = RecordingPort(modem.data_port, data_path)
+
+
+def replay_modem(ctrl_path, data_path=None, realtime=False):
+    """Return a Modem replaying captured traffic."""
+    return Modem(ReplayPort(data_path, realtime),
+                 ReplayPort(ctrl_path, realtime))
@@ -0,0 +1,123 @@
+"""Background signal quality sampler.
+
+The sampler polls RSSI and ^SYSINFO at an adaptive rate: the polling
+interval is reset to its minimum whenever a sampled value changes and
+doubles, up to its maximum, while values stay the same. Polling of a value
+is suspended while the modem reports it on its own (^RSSI and ^MODE
+unsolicited reports). All samples go into a bounded time series.
+"""
+
+import collections
+import threading
+import time
+from humod import actions
+from humod import errors
+from humod import siminfo
+from humod.at_commands import safe_int
+
+RSSI = 'rssi'
+SYSINFO = 'sysinfo'
+MODE = 'mode'
+
+# Unsolicited report kinds and the polled value they stand in for.
+URC_SUPPLIES = {RSSI: RSSI, MODE: SYSINFO}
+
+
+class SignalSampler(threading.Thread):
+    """Sampler thread collecting RSSI, ^SYSINFO and mode samples."""
+
+    # pylint: disable-msg=R0913
+    def __init__(self, modem, min_interval=1.0, max_interval=60.0,
+                 urc_window=30.0, maxlen=10000):
+        """Constructor for SignalSampler class.
+
+        Arguments:
+            modem -- Modem instance to sample,
+            min_interval -- polling interval while values are changing,
+            max_interval -- polling interval while values are stable,
+            urc_window -- seconds an unsolicited report keeps polling of
+                          the value it supplies suspended,
+            maxlen -- number of samples kept in the series.
+        """
+        self.active = True
+        self.modem = modem
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.urc_window = urc_window
+        self.series = collections.deque(maxlen=maxlen)
+        self._last_value = {}
+        self._interval = {RSSI: min_interval, SYSINFO: min_interval}
+        self._next_poll = {RSSI: 0, SYSINFO: 0}
+        self._wakeup = threading.Event()
+        self._pollers = {RSSI: modem.get_rssi,
+                         SYSINFO: lambda: siminfo.system_info(modem)}
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def record(self, kind, value, now=None):
+        """Append a sample and adapt the polling interval of its kind."""
+        if now is None:
+            now = time.time()
+        self.series.append((now, kind, value))
+        if kind not in self._interval:
+            return
+        if self._last_value.get(kind) != value:
+            self._interval[kind] = self.min_interval
+        else:
+            self._interval[kind] = min(self._interval[kind] * 2,
+                                       self.max_interval)
+        self._last_value[kind] = value
+        self._next_poll[kind] = now + self._interval[kind]
+
+    def samples(self, kind=None, since=0):
+        """Return a list of (timestamp, kind, value) samples."""
+        return [sample for sample in list(self.series)
+                if sample[0] >= since and kind in (None, sample[1])]
+
+    def _urc(self, kind):
+        """Note an unsolicited report supplying a polled value."""
+        self._next_poll[URC_SUPPLIES[kind]] = time.time() + self.urc_window
+
+    def rssi_update(self, modem, message):
+        """Handle ^RSSI, recording the reported level."""
+        if not isinstance(safe_int(message[6:].strip()), int):
+            return
+        actions.rssi_update(modem, message)
+        self.record(RSSI, modem.status.rssi)
+        self._urc(RSSI)
+
+    def mode_update(self, modem, message):
+        """Handle ^MODE, recording the reported mode."""
+        actions.mode_update(modem, message)
+        self.record(MODE, modem.status.mode)
+        self._urc(MODE)
+
+    def patterns(self, base=None):
+        """Return a pattern-action list feeding reports to the sampler."""
+        hooks = {actions.PATTERN['rssi update']: self.rssi_update,
+                 actions.PATTERN['mode update']: self.mode_update}
+        if not base:
+            base = actions.STANDARD_ACTIONS
+        return [(pattern, hooks.get(pattern, action))
+                for pattern, action in base]
+
+    def run(self):
+        """Poll values that are due until stopped."""
+        while self.active:
+            now = time.time()
+            for kind, poll in self._pollers.items():
+                if now < self._next_poll[kind]:
+                    continue
+                try:
+                    value = poll()
+                except (errors.Error, IOError, ValueError, KeyError):
+                    self._next_poll[kind] = now + self._interval[kind]
+                    continue
+                self.record(kind, value)
+            delay = min(self._next_poll.values()) - time.time()
+            self._wakeup.wait(max(delay, 0))
+
+    def stop(self):
+        """Stop the sampler thread."""
+        self.active = False
+        self._wakeup.set()
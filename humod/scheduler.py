@@ -0,0 +1,141 @@
+"""Priority command scheduler for the control channel.
+
+Commands submitted to a CommandScheduler are run one at a time by a
+worker thread. Higher priority classes always go first; within a class
+callers take turns, so one caller queueing many commands can't starve
+the others. Queued commands can be cancelled through their future, and
+an urgent command waits at most for the one command already running.
+
+Usage:
+    scheduler = CommandScheduler(modem)
+    scheduler.start()
+    future = scheduler.submit('get_networks', priority=BACKGROUND)
+    scheduler.call(modem.hangup, priority=URGENT)
+"""
+
+import collections
+import threading
+from concurrent import futures
+from humod import errors
+from humod.health import OPEN
+
+URGENT = 0
+NORMAL = 1
+BACKGROUND = 2
+PRIORITIES = (URGENT, NORMAL, BACKGROUND)
+
+
+class CommandScheduler(threading.Thread):
+    """Scheduler thread running modem commands by priority."""
+
+    def __init__(self, modem, breaker=None):
+        """Constructor for CommandScheduler class.
+
+        Arguments:
+            modem -- Modem instance the commands are run on,
+            breaker -- optional humod.health.CircuitBreaker; while it's
+                       open commands fail at once with CircuitOpenError.
+        """
+        self.active = True
+        self.modem = modem
+        self.breaker = breaker
+        # One round robin of per-caller FIFO queues per priority class.
+        self._queues = dict((priority, collections.OrderedDict())
+                            for priority in PRIORITIES)
+        self._cond = threading.Condition()
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) and return a Future for its result.
+
+        func is a callable or the name of a method of the modem. Keyword
+        arguments priority (NORMAL by default) and caller (the submitting
+        thread by default) are consumed by the scheduler.
+        """
+        priority = kwargs.pop('priority', NORMAL)
+        caller = kwargs.pop('caller', None)
+        if caller is None:
+            caller = threading.current_thread().ident
+        if priority not in self._queues:
+            raise errors.HumodUsageError('Unknown priority: %r.' % priority)
+        if isinstance(func, str):
+            func = getattr(self.modem, func)
+        future = futures.Future()
+        if self.breaker and self.breaker.state == OPEN:
+            future.set_exception(errors.CircuitOpenError('Modem unavailable.'))
+            return future
+        with self._cond:
+            if not self.active:
+                raise errors.HumodUsageError('Scheduler stopped.')
+            callers = self._queues[priority]
+            callers.setdefault(caller, collections.deque()).append(
+                (future, func, args, kwargs))
+            self._cond.notify()
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Submit func and wait for its result."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def pending(self, priority=None):
+        """Return the number of queued commands."""
+        with self._cond:
+            return sum(len(queue)
+                       for prio, callers in self._queues.items()
+                       if priority in (None, prio)
+                       for queue in callers.values())
+
+    def _next(self):
+        """Pop the next command, or return None if nothing is queued."""
+        for priority in PRIORITIES:
+            callers = self._queues[priority]
+            while callers:
+                # Serve the caller at the head, then move it to the back.
+                caller, queue = callers.popitem(last=False)
+                job = queue.popleft()
+                if queue:
+                    callers[caller] = queue
+                if job[0].set_running_or_notify_cancel():
+                    return job
+        return None
+
+    def run(self):
+        """Run queued commands until stopped."""
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None and self.active:
+                    self._cond.wait()
+                    job = self._next()
+                if job is None:
+                    return
+            future, func, args, kwargs = job
+            if self.breaker and not self.breaker.allow():
+                # The modem died while the command was queued, or another
+                # command is on trial.
+                future.set_exception(
+                    errors.CircuitOpenError('Modem unavailable.'))
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                if self.breaker:
+                    self.breaker.record_outcome(error)
+                future.set_exception(error)
+            else:
+                if self.breaker:
+                    self.breaker.record_outcome()
+                future.set_result(result)
+
+    def stop(self, cancel=True):
+        """Stop the scheduler, cancelling queued commands by default."""
+        with self._cond:
+            self.active = False
+            if cancel:
+                for callers in self._queues.values():
+                    for queue in callers.values():
+                        for job in queue:
+                            job[0].cancel()
+                    callers.clear()
+            self._cond.notify()
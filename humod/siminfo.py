@@ -1,10 +1,12 @@
 from humod import at_commands as atc
 from humod.GSM0338 import gsm0338_mapping
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 seq = lambda p, s=2: [p[i*s:(i+1)*s] for i in range(int((len(p)+1)/s))]
 digits_only = lambda s: ''.join([x for x in s if x.isdigit()])
 
+@lru_cache(maxsize=1024)
 def format_no(no):
     n = digits_only(str(no))
     if n:
@@ -30,14 +32,7 @@ def show_operator(modem):
     except IndexError:
         return ''
 
-def system_info(modem):
-    """
-    Voice (CS, circuit switched): equivalent to dialup data,
-        dial a number and the data flows like in a voice call
-    Packet (PS, packet switched): packets of data transmitted
-        by GPRS or 3G
-    """
-    key = [
+SYSINFO = [
     ('Service', {
         0: 'No service',
         1: 'Restricted service',
@@ -74,13 +69,19 @@ def system_info(modem):
         255: 'SIM card is not existent'
         })
     ]
-    
+
+def system_info(modem):
+    """
+    Voice (CS, circuit switched): equivalent to dialup data,
+        dial a number and the data flows like in a voice call
+    Packet (PS, packet switched): packets of data transmitted
+        by GPRS or 3G
+    """
     info = atc._common_run(modem, '^SYSINFO', prefixed=False)[0]
     info = info.replace('^SYSINFO:','').split(',')
-    keys = [x for x, y in key]
     out = {}
-    for k,v in zip(keys, info):
-        out[k] = dict(key)[k][int(v)]
+    for (k, names), v in zip(SYSINFO, info):
+        out[k] = names[int(v)]
     return out
 
 def is_gsm_encoded(message):
@@ -96,8 +97,36 @@ def decode_gsm(message):
     done = ''.join([key.get(x, '') for x in seq(message)])
     return done.replace('@', '')
 
+@lru_cache(maxsize=None)
+def _zone(quarters):
+    return timezone(timedelta(minutes=15 * quarters))
+
+def parse_dtime(d):
+    """Parse a 'yy/MM/dd,hh:mm:ss+zz' timestamp into an aware datetime.
+
+    The zone is given in quarters of an hour; timestamps without one are
+    taken as UTC, so all results compare with each other.
+    """
+    zone = d[17:]
+    return datetime(2000 + int(d[0:2]), int(d[3:5]), int(d[6:8]),
+                    int(d[9:11]), int(d[12:14]), int(d[15:17]),
+                    tzinfo=_zone(int(zone)) if zone else timezone.utc)
+
 def convert_dtime(d):
-    return datetime.strptime(d.split('+')[0], '%y/%m/%d,%H:%M:%S')
+    return parse_dtime(d).replace(tzinfo=None)
+
+def sms_header(l):
+    """Return (id, type, number, timestamp) of a +CMGL header.
+
+    Headers of concatenated messages carry extra fields, which are
+    skipped: each part is listed as a message of its own, and parts are
+    not reassembled from their concatenation info.
+    """
+    if len(l) == 5:
+        return l[0], l[1], l[2], l[4]
+    if len(l) == 9:
+        return l[0], l[1], l[4], l[6]
+    raise ValueError('Unexpected message header: %r' % (l,))
 
 BOXES = {
     'inbox': 'ALL',
@@ -110,15 +139,12 @@ def full_sms_list(modem, box):
     ls = []
     if modem: ls = modem.sms_list(box)
     texts = {}
+    msg = None
     for l in ls:
-        try: id, typ, no, empty, at = l
-        # TODO: interpret the SMS concatenation headers n1-4
-        except ValueError: id, typ, n1, n2, no, n3, at, at1, n4 = l
+        id, typ, no, at = sms_header(l)
         txt = modem.sms_read(id)
         gsm_encoded = is_gsm_encoded(txt)
-        multipart = False
-        try: multipart = msg['no'] == format_no(no)
-        except NameError: pass
+        multipart = msg is not None and msg['no'] == format_no(no)
         if gsm_encoded or multipart:
             txt = decode_gsm(txt) if gsm_encoded else txt
             if multipart:
@@ -130,7 +156,7 @@ def full_sms_list(modem, box):
             'typ': typ.replace('STO ','').replace('REC ', '').lower(),
             'no': format_no(no),
             'txt': txt,
-            'at': convert_dtime(at)
+            'at': parse_dtime(at)
         }
     if texts:
         texts = sorted(texts.items(), key=lambda m: m[1]['at'], reverse=True)
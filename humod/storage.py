@@ -0,0 +1,156 @@
+"""Message storage selection and capacity management.
+
+SIM storage is small and slow to read, device memory is larger and
+faster. The StorageManager selects the fastest storage the modem
+supports, follows its fill level through +CMTI notifications and clears
+read and sent messages, optionally archiving them first, before new
+messages get rejected for lack of room.
+
+Unread messages are kept by default, so room is only made as far as read
+and sent messages allow. With keep_unread=False the oldest unread
+messages are cleared too, archived first like the others, until the fill
+level is below the high-water mark.
+
+Usage:
+    manager = StorageManager(modem, archive=save_to_db)
+    manager.select_fastest()
+    modem.subscriptions.start()
+"""
+
+import math
+import threading
+from humod import errors
+from humod import siminfo
+
+# Storages in order of preference: device memory before the SIM.
+PREFERENCE = ('ME', 'MT', 'SM')
+
+# +CMGD delete flag removing read and sent messages.
+DELETE_READ_AND_SENT = 2
+
+
+def _age(header):
+    """Sort key of a message header, oldest first.
+
+    Slots are reused, so the index only breaks ties. Messages with an
+    unreadable timestamp come last.
+    """
+    try:
+        stamp = siminfo.parse_dtime(siminfo.sms_header(header)[3])
+    except ValueError:
+        return 1, None, header[0]
+    return 0, stamp, header[0]
+
+
+class StorageManager(object):
+    """Keep the message storage of a modem from filling up."""
+
+    def __init__(self, modem, high_water=.8, archive=None,
+                 keep_unread=True):
+        """Constructor for StorageManager class.
+
+        Subscribes to new message notifications.
+
+        Arguments:
+            modem -- Modem instance to manage,
+            high_water -- fill level (0 to 1) triggering a clean-up,
+            archive -- optional function called with the header and body
+                       of each message before it is deleted,
+            keep_unread -- never delete unread messages.
+        """
+        self.modem = modem
+        self.high_water = high_water
+        self.archive = archive
+        self.keep_unread = keep_unread
+        self.storage = None
+        self.used = 0
+        self.total = 0
+        self.archived = 0
+        self._lock = threading.Lock()
+        self._cleaning = False
+        modem.subscriptions.subscribe('new sms', self.new_message)
+
+    def select_fastest(self):
+        """Select the fastest storage supported for all uses.
+
+        Returns:
+            Name of the selected storage.
+        """
+        options = self.modem.get_message_storage_options()
+        for storage in PREFERENCE:
+            if all(storage in supported for supported in options):
+                break
+        else:
+            raise errors.HumodUsageError('No known message storage.')
+        usage = self.modem.set_message_storage(storage, storage, storage)
+        self.storage = storage
+        self.used, self.total = usage[-1]
+        return storage
+
+    def refresh(self):
+        """Read the usage of the receiving storage from the modem."""
+        self.storage, self.used, self.total = \
+            self.modem.get_message_storage()[-1]
+
+    def fill(self):
+        """Return the fill level of the receiving storage, 0 to 1."""
+        if not self.total:
+            return 0.0
+        return float(self.used) / self.total
+
+    def new_message(self, modem, message):
+        """Handle +CMTI, cleaning up in the background when nearly full."""
+        self.used += 1
+        with self._lock:
+            if self._cleaning or self.fill() < self.high_water:
+                return
+            self._cleaning = True
+        thread = threading.Thread(target=self._clean_up)
+        thread.daemon = True
+        thread.start()
+
+    def _clean_up(self):
+        """Run maintain() from a background thread."""
+        try:
+            self.maintain()
+        except errors.Error:
+            pass
+        finally:
+            self._cleaning = False
+
+    def maintain(self, force=False):
+        """Clear messages if the storage is nearly full.
+
+        With an archive function, read and sent messages are archived and
+        deleted one by one. Otherwise they are all deleted with one
+        command. Unread messages follow, oldest first, only if keep_unread
+        is off and the storage is still nearly full.
+
+        Returns:
+            True if the storage was cleared.
+        """
+        self.refresh()
+        if not force and self.fill() < self.high_water:
+            return False
+        if self.archive:
+            for box in ('REC READ', 'STO SENT'):
+                self._delete(self.modem.sms_list(box))
+        else:
+            self.modem.sms_del(0, DELETE_READ_AND_SENT)
+        self.refresh()
+        if not self.keep_unread and self.fill() >= self.high_water:
+            unread = sorted(self.modem.sms_list('REC UNREAD'), key=_age)
+            excess = self.used - int(math.ceil(self.high_water *
+                                               self.total)) + 1
+            self._delete(unread[:excess])
+            self.refresh()
+        return True
+
+    def _delete(self, headers):
+        """Archive, if archiving, and delete listed messages."""
+        for header in headers:
+            index = header[0]
+            if self.archive:
+                self.archive(header, self.modem.sms_read(index))
+                self.archived += 1
+            self.modem.sms_del(index)
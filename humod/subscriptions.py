@@ -0,0 +1,137 @@
+"""Subscriptions to unsolicited messages.
+
+Each Modem instance has a SubscriptionManager at modem.subscriptions.
+Handlers subscribe to named patterns (the keys of actions.PATTERN) and
+the manager keeps the prober's pattern-action list in line with them.
+Unsolicited messages that have no subscriber are switched off on the
+device, so an idle modem stays quiet on the control channel.
+"""
+
+import threading
+from humod import actions
+from humod import errors
+
+# Modem methods switching unsolicited messages on and off, and the
+# patterns of the messages each of them controls. Messages without an
+# entry here (RING, +CUSD...) can't be switched off.
+URC_SOURCES = {
+    'enable_curc': ('rssi update', 'flow report', 'mode update',
+                    'boot update'),
+    'enable_nmi': ('new sms', 'status report', 'stored status report'),
+    'enable_clip': ('caller id',),
+}
+
+# Cheap matches for blank lines, tried before any subscribed pattern.
+BLANK_ACTIONS = [(actions.PATTERN['new line'], actions.null_action),
+                 (actions.PATTERN['empty line'], actions.null_action)]
+
+
+class SubscriptionManager(object):
+    """Dispatch unsolicited messages to subscribed handlers."""
+
+    def __init__(self, modem):
+        self.modem = modem
+        self.patterns = list(BLANK_ACTIONS)
+        self._handlers = {}
+        self._custom = {}
+        self._enabled = {}
+        self._lock = threading.RLock()
+
+    def subscribe(self, name, action, pattern=None):
+        """Call action(modem, message) for messages matching a pattern.
+
+        Once the manager is started, the matching unsolicited messages are
+        switched on on the device.
+
+        Arguments:
+            name -- key of actions.PATTERN, or any name if pattern is given,
+            action -- action function,
+            pattern -- compiled regex for names not in actions.PATTERN.
+        """
+        with self._lock:
+            if pattern is not None:
+                self._custom[name] = pattern
+            elif name not in actions.PATTERN and name not in self._custom:
+                raise errors.HumodUsageError('Unknown pattern: %s.' % name)
+            self._handlers.setdefault(name, []).append(action)
+            self._update()
+        self._sync_started()
+
+    def unsubscribe(self, name, action):
+        """Stop calling action for messages matching a pattern."""
+        with self._lock:
+            handlers = self._handlers.get(name, [])
+            if action not in handlers:
+                raise errors.HumodUsageError('Not subscribed.')
+            handlers.remove(action)
+            if not handlers:
+                del self._handlers[name]
+            self._update()
+        self._sync_started()
+
+    def subscribed(self, name):
+        """Check if a pattern has any subscribers."""
+        return name in self._handlers
+
+    def start(self):
+        """Sync unsolicited messages with the device and start the prober."""
+        self.sync(force=True)
+        self.modem.prober.start(self.patterns)
+
+    def stop(self):
+        """Stop the prober."""
+        self.modem.prober.stop()
+
+    def sync(self, force=False):
+        """Switch unsolicited messages on or off to match subscriptions.
+
+        Only messages whose subscription state changed since the last sync
+        are switched, unless force is set. The commands are sent without
+        holding the lock, so a slow modem doesn't block other subscribers
+        or the interpreter thread.
+        """
+        with self._lock:
+            changed = []
+            for method, names in URC_SOURCES.items():
+                wanted = any(name in self._handlers for name in names)
+                if force or self._enabled.get(method) != wanted:
+                    self._enabled[method] = wanted
+                    changed.append(method)
+        for method in changed:
+            while True:
+                with self._lock:
+                    wanted = self._enabled[method]
+                getattr(self.modem, method)(wanted)
+                with self._lock:
+                    # Another sync changed it meanwhile, its command may
+                    # have gone out before this one.
+                    if self._enabled[method] == wanted:
+                        break
+
+    def _sync_started(self):
+        """Sync the device if the manager was started."""
+        if self._enabled:
+            self.sync()
+
+    def _pattern(self, name):
+        """Return the compiled pattern of a name."""
+        return self._custom.get(name) or actions.PATTERN[name]
+
+    def _dispatcher(self, handlers):
+        """Return an action calling all handlers."""
+        if len(handlers) == 1:
+            return handlers[0]
+        def dispatch(modem, message):
+            """Call every subscribed handler."""
+            for handler in handlers:
+                handler(modem, message)
+        return dispatch
+
+    def _update(self):
+        """Rebuild the pattern-action list."""
+        patterns = list(BLANK_ACTIONS)
+        for name, handlers in self._handlers.items():
+            patterns.append((self._pattern(name),
+                             self._dispatcher(list(handlers))))
+        self.patterns = patterns
+        self.modem.prober.set_patterns(patterns)
@@ -0,0 +1,208 @@
+"""Connection supervisor keeping the pppd link up.
+
+The supervisor dials out on the data port, runs pppd as a subprocess and
+watches it with a child-exit watcher. Link state is tracked from the
+^DSFLOWRPT and ^MODE reports picked up by the prober, and the link is
+redialed with exponential backoff whenever pppd dies, the network is lost
+or flow reports stop arriving.
+"""
+
+import os
+import select
+import subprocess
+import threading
+import time
+from humod import actions
+from humod import defaults
+from humod import errors
+
+DOWN = 'down'
+DIALING = 'dialing'
+UP = 'up'
+NO_SERVICE = 'no service'
+BACKOFF = 'backoff'
+
+
+class ConnectionSupervisor(object):
+    """Keep a modem connected, redialing with exponential backoff."""
+
+    # pylint: disable-msg=R0913
+    def __init__(self, modem, dialtone_check=True,
+                 backoff=defaults.RECONNECT_BACKOFF,
+                 backoff_max=defaults.RECONNECT_BACKOFF_MAX,
+                 flow_timeout=defaults.FLOW_REPORT_TIMEOUT,
+                 stable_time=defaults.RECONNECT_STABLE):
+        """Constructor for ConnectionSupervisor class.
+
+        Arguments:
+            modem -- Modem instance to keep connected,
+            dialtone_check -- passed on to Modem._dial(),
+            backoff -- first redial delay in seconds,
+            backoff_max -- upper bound of the redial delay,
+            flow_timeout -- seconds without a ^DSFLOWRPT report after
+                            which a running link is considered dead,
+            stable_time -- seconds a link has to stay up for the redial
+                           delay to start over from backoff.
+        """
+        self.modem = modem
+        self.dialtone_check = dialtone_check
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.flow_timeout = flow_timeout
+        self.stable_time = stable_time
+        self.state = DOWN
+        self.reconnects = 0
+        self.last_flow_report = None
+        self._failures = 0
+        self._process = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._link_lost = threading.Event()
+
+    def patterns(self, base=None):
+        """Return a pattern-action list with link tracking hooked in.
+
+        Flow report and mode update actions of base (STANDARD_ACTIONS by
+        default) are replaced by the supervisor's own, which update the
+        modem status as before. Pass the result to modem.prober.start().
+        """
+        hooks = {actions.PATTERN['flow report']: self.flow_report,
+                 actions.PATTERN['mode update']: self.mode_update}
+        if not base:
+            base = actions.STANDARD_ACTIONS
+        return [(pattern, hooks.get(pattern, action))
+                for pattern, action in base]
+
+    def flow_report(self, modem, message):
+        """Handle ^DSFLOWRPT, proving the link is alive."""
+        actions.flow_report_update(modem, message)
+        self.last_flow_report = time.time()
+        if self.state == UP:
+            self._failures = 0
+
+    def mode_update(self, modem, message):
+        """Handle ^MODE, dropping the link when service is lost."""
+        actions.mode_update(modem, message)
+        mode = message[6:].strip().split(',', 1)[0]
+        if mode != '0':
+            return
+        with self._lock:
+            if self.state == UP:
+                self.state = NO_SERVICE
+                self._link_lost.set()
+
+    def start(self):
+        """Start supervising the connection."""
+        if self._thread:
+            raise errors.HumodUsageError('Supervisor already started.')
+        self._stopping.clear()
+        self._link_lost.clear()
+        self._failures = 0
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        self._thread = thread
+        # Started last, once everything it reads is set up.
+        thread.start()
+
+    def stop(self):
+        """Stop supervising and tear the connection down."""
+        if not self._thread:
+            raise errors.HumodUsageError('Supervisor not started.')
+        self._stopping.set()
+        self._link_lost.set()
+        self._thread.join()
+        self._thread = None
+
+    def _next_delay(self):
+        """Return the next redial delay and bump the failure counter."""
+        delay = min(self.backoff * 2 ** self._failures, self.backoff_max)
+        self._failures += 1
+        return delay
+
+    def _run(self):
+        """Dial, supervise and redial until stopped."""
+        connected_before = False
+        while not self._stopping.is_set():
+            with self._lock:
+                self.state = DIALING
+            if connected_before:
+                self.reconnects += 1
+            try:
+                connected = self.modem._dial(self.dialtone_check)
+            except (errors.Error, IOError, OSError):
+                connected = False
+            if connected and self._launch():
+                connected_before = True
+                launched = time.time()
+                self._supervise()
+                self._terminate()
+                if time.time() - launched >= self.stable_time:
+                    # The link held, without flow reports too.
+                    self._failures = 0
+            if self._stopping.is_set():
+                break
+            with self._lock:
+                self.state = BACKOFF
+            self._stopping.wait(self._next_delay())
+        with self._lock:
+            self.state = DOWN
+
+    def _launch(self):
+        """Start pppd and its exit watcher. Return True on success."""
+        self.last_flow_report = None
+        try:
+            process = subprocess.Popen(self.modem._pppd_args())
+        except OSError:
+            return False
+        with self._lock:
+            self._process = process
+            self._link_lost.clear()
+            self.state = UP
+        # Started last, a pppd dying at once must find the link up.
+        watcher = threading.Thread(target=self._watch, args=(process,))
+        watcher.daemon = True
+        watcher.start()
+        return True
+
+    def _watch(self, process):
+        """Block until pppd exits, then flag the link as lost."""
+        pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                pidfd = os.pidfd_open(process.pid)
+            except OSError:
+                pass
+        if pidfd is not None:
+            # The pidfd becomes readable when the process terminates.
+            try:
+                poller = select.poll()
+                poller.register(pidfd, select.POLLIN)
+                poller.poll()
+            finally:
+                os.close(pidfd)
+        process.wait()
+        with self._lock:
+            # A watcher of an earlier pppd mustn't drop the current link.
+            if process is self._process:
+                self._link_lost.set()
+
+    def _supervise(self):
+        """Wait until the link is lost or flow reports go stale."""
+        while not self._stopping.is_set():
+            if self._link_lost.wait(self.flow_timeout):
+                return
+            # Only enforce the watchdog once reports have been seen, the
+            # prober may not be running with the supervisor's patterns.
+            last = self.last_flow_report
+            if last and time.time() - last > self.flow_timeout:
+                return
+
+    def _terminate(self):
+        """Terminate pppd if it is still running."""
+        with self._lock:
+            process = self._process
+            self._process = None
+        if process.poll() is None:
+            process.terminate()
+        process.wait()
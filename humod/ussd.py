@@ -0,0 +1,235 @@
+"""Asynchronous USSD requests.
+
+The network answers a USSD request with a +CUSD unsolicited message,
+seconds after the AT+CUSD command itself has returned. A UssdClient sends
+requests without holding the control lock while waiting and resolves a
+Future when the answer arrives through the prober. Menus spanning several
+steps are handled by UssdSession objects.
+
+A modem carries one USSD dialogue at a time, so requests are queued per
+client and sent in order, and while a menu waits for an answer only its
+own session may continue.
+
+Usage:
+    client = UssdClient(modem)
+    modem.subscriptions.start()
+    response = client.request('*100#').result()
+    if response.session_open:
+        response = response.session.send('1').result()
+"""
+
+import collections
+import threading
+from concurrent import futures
+from humod import at_commands as atc
+from humod import defaults
+from humod import errors
+
+# +CUSD result codes.
+NO_ACTION = 0
+ACTION_REQUIRED = 1
+TERMINATED = 2
+OTHER_CLIENT = 3
+NOT_SUPPORTED = 4
+NETWORK_TIMEOUT = 5
+
+# Data coding scheme of UCS2 encoded replies.
+DCS_UCS2 = 72
+
+
+def decode_ussd(text, dcs):
+    """Decode text of a +CUSD message."""
+    if dcs == DCS_UCS2:
+        try:
+            return bytearray.fromhex(text).decode('utf-16-be')
+        except ValueError:
+            pass
+    return text
+
+
+class UssdResponse(object):
+    """Answer of the network to a USSD request."""
+
+    def __init__(self, session, status, text, dcs):
+        self.session = session
+        self.status = status
+        self.text = text
+        self.dcs = dcs
+
+    @property
+    def session_open(self):
+        """True if the network waits for the next step of a menu."""
+        return self.status == ACTION_REQUIRED
+
+    def __repr__(self):
+        return '<UssdResponse %d %r>' % (self.status, self.text)
+
+
+class UssdSession(object):
+    """USSD dialogue, possibly spanning several menu steps."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def send(self, text, timeout=None):
+        """Send a USSD string, return a Future of the UssdResponse."""
+        return self.client._submit(self, text, timeout)
+
+    def close(self):
+        """End the dialogue and drop its queued requests."""
+        self.client._close(self)
+
+
+class UssdClient(object):
+    """Send USSD requests and match them with +CUSD answers."""
+
+    def __init__(self, modem, timeout=defaults.USSD_TIMEOUT):
+        """Constructor for UssdClient class.
+
+        Subscribes to +CUSD messages, the prober has to be running (see
+        modem.subscriptions.start()) for requests to complete.
+
+        Arguments:
+            modem -- Modem instance to send requests with,
+            timeout -- default seconds to wait for an answer, and for the
+                       next step of an open menu.
+        """
+        self.modem = modem
+        self.timeout = timeout
+        self.malformed = 0
+        self._jobs = collections.deque()
+        self._current = None
+        self._owner = None
+        self._timer = None
+        self._lock = threading.RLock()
+        modem.subscriptions.subscribe('ussd', self.cusd_update)
+
+    def request(self, code, timeout=None):
+        """Send a USSD code in a new session, return a Future."""
+        return UssdSession(self).send(code, timeout)
+
+    def cusd_update(self, modem, message):
+        """Handle the +CUSD message."""
+        self._handle(message.strip()[6:])
+
+    def _submit(self, session, text, timeout):
+        """Queue a request of a session."""
+        future = futures.Future()
+        with self._lock:
+            self._jobs.append((session, text, future,
+                               timeout or self.timeout))
+            self._dispatch()
+        return future
+
+    def _start_timer(self, timeout, callback, *args):
+        """Replace the running timer."""
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(timeout, callback, args)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _spawn(self, target, *args):
+        """Run an AT command outside of the caller's thread."""
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _dispatch(self):
+        """Send the next request unless one is in flight."""
+        while self._current is None:
+            for job in self._jobs:
+                if self._owner is None or job[0] is self._owner:
+                    break
+            else:
+                return
+            self._jobs.remove(job)
+            if not job[2].set_running_or_notify_cancel():
+                continue
+            self._current = job
+            self._start_timer(job[3], self._expire, job)
+            self._spawn(self._send, job)
+
+    def _send(self, job):
+        """Send AT+CUSD for a request."""
+        session, text, future, _ = job
+        try:
+            data = atc._common_set(self.modem, '+CUSD', '1,"%s",15' % text)
+        except errors.Error as error:
+            with self._lock:
+                if self._current is job:
+                    self._finish()
+                    future.set_exception(error)
+                    self._dispatch()
+            return
+        # The answer may have been read as a part of the command output.
+        for line in data:
+            self._handle(line)
+
+    def _handle(self, payload):
+        """Resolve the request in flight with a +CUSD payload."""
+        items = atc.csv_ls(payload.strip())
+        status = atc.safe_int(items[0]) if items else None
+        dcs = atc.safe_int(items[2]) if len(items) > 2 and items[2] else None
+        if not isinstance(status, int) or \
+                (dcs is not None and not isinstance(dcs, int)):
+            # Runs on the interpreter thread, drop the report and go on.
+            self.malformed += 1
+            return
+        text = decode_ussd(items[1], dcs) if len(items) > 1 else None
+        with self._lock:
+            job = self._current
+            if job is None:
+                return
+            session, _, future, timeout = job
+            self._finish()
+            if status == ACTION_REQUIRED:
+                self._owner = session
+                self._start_timer(timeout, self._close, session)
+            if status in (NOT_SUPPORTED, NETWORK_TIMEOUT):
+                future.set_exception(errors.UssdError(
+                    'USSD request failed with status %d.' % status))
+            else:
+                future.set_result(UssdResponse(session, status, text, dcs))
+            self._dispatch()
+
+    def _finish(self):
+        """Clear the request in flight and the session it holds."""
+        self._current = None
+        self._owner = None
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expire(self, job):
+        """Fail a request the network didn't answer in time."""
+        with self._lock:
+            if self._current is not job:
+                return
+            self._finish()
+            job[2].set_exception(errors.UssdError('USSD request timed out.'))
+            self._spawn(self._cancel)
+            self._dispatch()
+
+    def _close(self, session):
+        """End a session, cancelling the dialogue on the network."""
+        with self._lock:
+            for job in [job for job in self._jobs if job[0] is session]:
+                self._jobs.remove(job)
+                job[2].cancel()
+            current = self._current
+            if current and current[0] is session:
+                self._finish()
+                current[2].set_exception(errors.UssdError('Session closed.'))
+                self._spawn(self._cancel)
+            elif self._owner is session:
+                self._finish()
+                self._spawn(self._cancel)
+            self._dispatch()
+
+    def _cancel(self):
+        """Send AT+CUSD=2 to end the dialogue on the network."""
+        try:
+            atc._common_set(self.modem, '+CUSD', '2')
+        except errors.Error:
+            pass
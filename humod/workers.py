@@ -0,0 +1,310 @@
+"""Process-per-modem worker mode.
+
+With many modems in one process, their prober and command threads all
+compete for one interpreter lock. A WorkerPool runs each Modem in a
+worker process of its own instead. Commands go to the worker over a pipe
+and come back with their result, while the worker publishes the fields
+of its ConnectionStatus to a shared memory table, which the coordinator
+reads without asking the workers.
+
+Each table slot is written by one worker only and guarded by a sequence
+counter (a seqlock): the writer makes the counter odd while it updates
+the slot, readers retry until they read the same even counter before and
+after copying the slot.
+
+Usage:
+    pool = WorkerPool({'usb0': ('/dev/ttyUSB0', '/dev/ttyUSB1'),
+                       'usb1': ('/dev/ttyUSB3', '/dev/ttyUSB4')})
+    pool.start()
+    pool['usb0'].sms_send('+353861234567', 'Hello')
+    pool.status('usb1')['rssi']
+    pool.stop()
+"""
+
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from humod import errors
+from humod.humodem import ConnectionStatus
+
+# Slot layout: sequence counter, then the published ConnectionStatus
+# fields with the mode as a fixed width string. Longer modes are refused,
+# those set by actions.mode_update() all fit.
+MODE_SIZE = 24
+SLOT = struct.Struct('<IiIIQQI%ds' % MODE_SIZE)
+FIELDS = ('rssi', 'uplink', 'downlink', 'bytes_tx', 'bytes_rx',
+          'link_uptime', 'mode')
+SEQ = struct.Struct('<I')
+
+# Failed reads retried at once before readers start sleeping between
+# retries, and the sleep.
+READ_SPINS = 100
+READ_BACKOFF = .0001
+
+
+class StatusTable(object):
+    """Table of ConnectionStatus fields in shared memory."""
+
+    def __init__(self, slots, name=None):
+        """Create a table of slots, or attach to the named one."""
+        if name is None:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=max(slots, 1) * SLOT.size)
+            self.memory.buf[:] = bytes(len(self.memory.buf))
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+        self.name = self.memory.name
+        self.slots = slots
+
+    def write(self, slot, status):
+        """Publish the fields of a ConnectionStatus, from one writer."""
+        offset = slot * SLOT.size
+        buf = self.memory.buf
+        seq = SEQ.unpack_from(buf, offset)[0]
+        SEQ.pack_into(buf, offset, seq + 1)
+        mode = _encode_mode(status.mode)
+        SLOT.pack_into(buf, offset, seq + 1, status.rssi, status.uplink,
+                       status.downlink, status.bytes_tx, status.bytes_rx,
+                       status.link_uptime, mode)
+        SEQ.pack_into(buf, offset, seq + 2)
+
+    def read(self, slot):
+        """Return the fields of a slot as a dict."""
+        offset = slot * SLOT.size
+        buf = self.memory.buf
+        retries = 0
+        while True:
+            seq = SEQ.unpack_from(buf, offset)[0]
+            if not seq % 2:
+                values = SLOT.unpack_from(buf, offset)
+                if SEQ.unpack_from(buf, offset)[0] == seq:
+                    break
+            retries += 1
+            # Let the writer run, then back off.
+            time.sleep(0 if retries < READ_SPINS else READ_BACKOFF)
+        record = dict(zip(FIELDS, values[1:]))
+        record['mode'] = record['mode'].rstrip(b'\0').decode('utf-8') or None
+        return record
+
+    def close(self):
+        """Detach from the table."""
+        self.memory.close()
+
+    def unlink(self):
+        """Free the table, after all processes closed it."""
+        self.memory.unlink()
+
+
+def _encode_mode(mode):
+    """Return a mode as stored in a slot, refusing too long ones."""
+    data = (mode or '').encode('utf-8')
+    if len(data) > MODE_SIZE:
+        raise errors.HumodUsageError('Mode longer than %d bytes: %r.' %
+                                     (MODE_SIZE, mode))
+    return data
+
+
+class SharedConnectionStatus(ConnectionStatus):
+    """ConnectionStatus publishing each change to a StatusTable slot."""
+
+    def __init__(self, table, slot):
+        object.__setattr__(self, '_table', None)
+        ConnectionStatus.__init__(self)
+        object.__setattr__(self, '_slot', slot)
+        object.__setattr__(self, '_table', table)
+        table.write(slot, self)
+
+    def __setattr__(self, name, value):
+        if name == 'mode':
+            # Refuse a mode the table can't hold before it's set.
+            _encode_mode(value)
+        object.__setattr__(self, name, value)
+        if self._table is not None and name in FIELDS:
+            self._table.write(self._slot, self)
+
+    def update(self, **fields):
+        """Set several fields, publishing them together."""
+        if 'mode' in fields:
+            _encode_mode(fields['mode'])
+        table = self._table
+        object.__setattr__(self, '_table', None)
+        try:
+            ConnectionStatus.update(self, **fields)
+        finally:
+            object.__setattr__(self, '_table', table)
+        if table is not None:
+            table.write(self._slot, self)
+
+
+def _worker_main(factory, ports, table_name, slots, slot, conn, probe):
+    """Run a modem in a worker process, serving commands from conn."""
+    table = StatusTable(slots, table_name)
+    modem = None
+    try:
+        try:
+            modem = factory(*ports)
+            modem.status = SharedConnectionStatus(table, slot)
+            if probe:
+                modem.prober.start()
+        except Exception as error:
+            conn.send(('error', _portable(error)))
+            return
+        conn.send(('ok', None))
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args, kwargs = request
+            try:
+                if callable(method):
+                    result = method(modem, *args, **kwargs)
+                else:
+                    result = getattr(modem, method)(*args, **kwargs)
+            except Exception as error:
+                conn.send(('error', _portable(error)))
+            else:
+                conn.send(('ok', result))
+    finally:
+        if probe and modem is not None:
+            try:
+                modem.prober.stop()
+            except errors.Error:
+                pass
+        modem = None
+        table.close()
+
+
+def _portable(error):
+    """Return error, or a stand-in if it can't be sent over a pipe."""
+    try:
+        multiprocessing.reduction.ForkingPickler.dumps(error)
+    except Exception:
+        return errors.Error('%s: %s' % (error.__class__.__name__, error))
+    return error
+
+
+class RemoteModem(object):
+    """Proxy running Modem methods in a worker process."""
+
+    def __init__(self, name, process, conn):
+        self.name = name
+        self.process = process
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    def call(self, method, *args, **kwargs):
+        """Run a Modem method, given by name, in the worker.
+
+        method may also be a module level function taking the modem as
+        its first argument, e.g. humod.siminfo.system_info.
+        """
+        with self._lock:
+            self._conn.send((method, args, kwargs))
+            outcome, value = self._receive()
+        if outcome == 'error':
+            raise value
+        return value
+
+    def _receive(self):
+        """Read a reply, failing if the worker died."""
+        try:
+            return self._conn.recv()
+        except EOFError:
+            raise errors.WorkerError('Worker %s died.' % self.name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+
+class WorkerPool(object):
+    """Run modems in worker processes, one each."""
+
+    def __init__(self, modems, probe=True, factory=None, context='spawn'):
+        """Constructor for WorkerPool class.
+
+        Arguments:
+            modems -- dict mapping names to (data, ctrl) port tuples,
+            probe -- start the prober of each modem, so unsolicited
+                     reports update the status table,
+            factory -- picklable callable opening a modem from its
+                       ports, Modem by default,
+            context -- multiprocessing start method.
+        """
+        if factory is None:
+            from humod.humodem import Modem as factory
+        self.modems = modems
+        self.probe = probe
+        self.factory = factory
+        self.workers = {}
+        self.table = None
+        self._slots = dict((name, slot)
+                           for slot, name in enumerate(sorted(modems)))
+        self._context = multiprocessing.get_context(context)
+
+    def start(self):
+        """Start the workers and wait until their modems are open.
+
+        Returns:
+            dict mapping names of modems that failed to open to errors.
+        """
+        self.table = StatusTable(len(self._slots))
+        failed = {}
+        for name, slot in sorted(self._slots.items()):
+            conn, child_conn = self._context.Pipe()
+            process = self._context.Process(
+                target=_worker_main, name='humod-%s' % name,
+                args=(self.factory, self.modems[name], self.table.name,
+                      len(self._slots), slot, child_conn, self.probe))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self.workers[name] = RemoteModem(name, process, conn)
+        for name, worker in sorted(self.workers.items()):
+            try:
+                outcome, value = worker._receive()
+            except errors.Error as error:
+                outcome, value = 'error', error
+            if outcome == 'error':
+                failed[name] = value
+                self._stop_worker(name)
+        return failed
+
+    def __getitem__(self, name):
+        return self.workers[name]
+
+    def status(self, name):
+        """Return the published status of a modem, without IPC."""
+        return self.table.read(self._slots[name])
+
+    def statuses(self):
+        """Return the published status of all modems."""
+        return dict((name, self.table.read(slot))
+                    for name, slot in self._slots.items())
+
+    def _stop_worker(self, name):
+        """Stop one worker process."""
+        worker = self.workers.pop(name)
+        try:
+            worker._conn.send(None)
+        except (EOFError, OSError):
+            pass
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker._conn.close()
+
+    def stop(self):
+        """Stop all workers and free the status table."""
+        for name in list(self.workers):
+            self._stop_worker(name)
+        if self.table:
+            self.table.close()
+            self.table.unlink()
+            self.table = None
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+from humod.accounting import TrafficAccountant
+
+DAY = 86400
+NOON = 1700000000 // DAY * DAY + 43200
+
+
+class TestAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'usage.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_deltas(self):
+        accountant = TrafficAccountant()
+        self.assertEqual((100, 200), accountant.update(10, 100, 200, NOON))
+        self.assertEqual((50, 0), accountant.update(12, 150, 200, NOON + 2))
+        self.assertEqual((150, 200), accountant.usage('day', NOON))
+        self.assertEqual((150, 200), accountant.usage('session'))
+
+    def test_counter_reset_starts_new_session(self):
+        accountant = TrafficAccountant()
+        accountant.update(100, 1000, 1000, NOON)
+        self.assertEqual((10, 20), accountant.update(2, 10, 20, NOON + 60))
+        self.assertEqual((1010, 1020), accountant.usage('day', NOON))
+        self.assertEqual((10, 20), accountant.usage('session'))
+
+    def test_restart_mid_session(self):
+        accountant = TrafficAccountant(self.path, 'sim1')
+        accountant.update(10, 100, 100, NOON)
+        accountant.close()
+        accountant = TrafficAccountant(self.path, 'sim1')
+        self.assertEqual((5, 5), accountant.update(20, 105, 105, NOON + 10))
+        self.assertEqual((105, 105), accountant.usage('hour', NOON))
+        other = TrafficAccountant(self.path, 'sim2')
+        self.assertEqual((0, 0), other.usage('hour', NOON))
+
+    def test_throughput(self):
+        accountant = TrafficAccountant()
+        accountant.update(10, 0, 0, NOON)
+        accountant.update(12, 2000, 4000, NOON + 2)
+        tx_rate, rx_rate = accountant.throughput()
+        self.assertTrue(0 < tx_rate < rx_rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+from humod import bridge
+from humod import errors
+from humod.humodem import Modem
+
+
+class FakeSerial(object):
+    """Serial port of a modem answering every command with OK."""
+
+    def __init__(self):
+        self.written = bytearray()
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+
+    def feed(self, data):
+        with self._cond:
+            self._buffer.extend(data)
+            self._cond.notify_all()
+
+    def write(self, data):
+        self.written.extend(data)
+        if data.endswith(b'\r'):
+            command = data.decode().strip()
+            reply = 'Huawei\r\n' if command in ('AT+CGMI', 'AT+GMI') else ''
+            self.feed(('%s\r\n%sOK\r\n' % (command, reply)).encode())
+        return len(data)
+
+    def read(self, size=1):
+        with self._cond:
+            if len(self._buffer) < size:
+                self._cond.wait(.1)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def inWaiting(self):
+        return len(self._buffer)
+
+
+class TestBridge(unittest.TestCase):
+
+    def setUp(self):
+        self.ports = {'ctrl': FakeSerial(), 'data': FakeSerial()}
+        self.bridge = bridge.Bridge(self.ports, port=0)
+        self.bridge.start()
+        self.host, self.port = self.bridge.address
+
+    def tearDown(self):
+        self.bridge.stop()
+
+    def connect(self, name='ctrl'):
+        port = bridge.TcpPort(self.host, self.port, name, timeout=1)
+        self.addCleanup(port.close)
+        return port
+
+    def test_send_at(self):
+        port = self.connect()
+        self.assertEqual(['Huawei'], port.send_at('+CGMI', '', False))
+        self.assertEqual(b'AT+CGMI\r', bytes(self.ports['ctrl'].written))
+
+    def test_bulk_forwarding(self):
+        port = self.connect('data')
+        payload = bytes(range(256)) * 1000
+        self.ports['data'].feed(payload)
+        data = b''
+        while len(data) < len(payload):
+            chunk = port.read(len(payload) - len(data))
+            self.assertTrue(chunk)
+            data += chunk
+        self.assertEqual(payload, data)
+
+    def test_one_client_per_port(self):
+        port = self.connect()
+        self.assertRaises(errors.BridgeError, self.connect)
+        self.assertRaises(errors.BridgeError, self.connect, 'missing')
+        port.close()
+        deadline = time.time() + 5
+        while self.bridge._clients and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(['Huawei'], self.connect().send_at('+CGMI', '', False))
+
+    def test_bridge_stop(self):
+        port = self.connect()
+        self.bridge.stop()
+        self.assertRaises(errors.BridgeError, port.read, 1)
+        self.assertFalse(port.isOpen())
+
+    def test_modem_from_url(self):
+        url = 'tcp://%s:%d/' % (self.host, self.port)
+        modem = Modem(url + 'data', url + 'ctrl')
+        self.addCleanup(modem.ctrl_port.close)
+        self.addCleanup(modem.data_port.close)
+        self.assertIsInstance(modem.ctrl_port, bridge.TcpPort)
+        self.assertEqual(['Huawei'], modem.ctrl_port.send_at('+CGMI', '', False))
+
+    def test_port_objects_in_modem(self):
+        modem = Modem(self.connect('data'), self.connect('ctrl'))
+        url = 'tcp://%s:%d/' % (self.host, self.port)
+        self.assertEqual(url + 'ctrl', modem.ctrl_port.port)
+        self.assertEqual(url + 'data', modem.data_port.port)
+        self.assertEqual('Huawei', modem.show_manufacturer())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+from humod import calls
+from humod.scheduler import CommandScheduler
+from humod.subscriptions import SubscriptionManager
+
+CLIP = '+CLIP: "%s",145,,,,0\r\n'
+
+
+class FakeProber(object):
+
+    def set_patterns(self, patterns):
+        pass
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+        self.subscriptions = SubscriptionManager(self)
+        self.hangups = threading.Semaphore(0)
+        self.hung_up = 0
+
+    def hangup(self):
+        self.hung_up += 1
+        self.hangups.release()
+
+
+class TestCalls(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+
+    def test_parse_clip(self):
+        self.assertEqual(('+353861234567', 145, 0),
+                         calls.parse_clip(CLIP % '+353861234567'))
+        self.assertEqual((None, 128, 1),
+                         calls.parse_clip('+CLIP: "",128,,,,1\r\n'))
+
+    def test_malformed_clip(self):
+        self.assertIsNone(calls.parse_clip('+CLIP: "+353861234567",145,,,,x'))
+        self.assertIsNone(calls.parse_clip('+CLIP: "+353861234567",int'))
+        screener = calls.CallScreener(self.modem, deny=['+353861234567'])
+        screener.clip_update(self.modem, '+CLIP: "+353861234567",145,,,,x')
+        self.assertEqual(1, screener.malformed)
+        self.assertEqual([], list(screener.history))
+        # The next valid message is still screened as a new call.
+        screener.clip_update(self.modem, CLIP % '+353861234567')
+        self.assertTrue(self.modem.hangups.acquire(timeout=5))
+        self.assertEqual(1, screener.rejected)
+
+    def test_deny(self):
+        screener = calls.CallScreener(self.modem, deny=['00353861234567'])
+        self.assertTrue(self.modem.subscriptions.subscribed('caller id'))
+        screener.clip_update(self.modem, CLIP % '+353861234567')
+        self.assertTrue(self.modem.hangups.acquire(timeout=5))
+        self.assertEqual(1, screener.rejected)
+        screener.clip_update(self.modem, CLIP % '+353869999999')
+        # Further rings of the same call are not screened again.
+        screener.clip_update(self.modem, CLIP % '+353869999999')
+        self.assertEqual(1, screener.accepted)
+        self.assertEqual(1, self.modem.hung_up)
+
+    def test_allow_and_withheld(self):
+        screener = calls.CallScreener(self.modem, allow=['+353861234567'],
+                                      reject_withheld=True)
+        self.assertTrue(screener.accepts('00353861234567'))
+        self.assertFalse(screener.accepts('+353869999999'))
+        self.assertFalse(screener.accepts(None))
+
+    def test_callback_through_scheduler(self):
+        scheduler = CommandScheduler(self.modem)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        screener = calls.CallScreener(
+            self.modem, decide=lambda number: number.endswith('7'),
+            scheduler=scheduler)
+        screener.clip_update(self.modem, CLIP % '+353861234568')
+        self.assertTrue(self.modem.hangups.acquire(timeout=5))
+        # A hang up ends the call, the next +CLIP is a new call.
+        deadline = time.time() + 5
+        while screener._last_clip and time.time() < deadline:
+            time.sleep(.01)
+        screener.clip_update(self.modem, CLIP % '+353861234567')
+        self.assertEqual([False, True],
+                         [call[2] for call in screener.history])
+
+
+if __name__ == '__main__':
+    unittest.main()
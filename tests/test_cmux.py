@@ -0,0 +1,83 @@
+import threading
+import unittest
+from humod import cmux
+
+
+class FakePhysicalPort(object):
+    """Single serial port of a modem answering in multiplexer mode."""
+
+    def __init__(self):
+        self.decoder = cmux.FrameDecoder()
+        self.inbound = bytearray()
+        self.cond = threading.Condition()
+
+    def respond(self, raw):
+        with self.cond:
+            self.inbound.extend(raw)
+            self.cond.notify_all()
+
+    def write(self, raw):
+        for dlci, control, info in self.decoder.feed(raw):
+            if control == cmux.SABM | cmux.PF:
+                self.respond(cmux.encode_frame(dlci, cmux.UA | cmux.PF))
+            elif control == cmux.UIH and dlci == cmux.AT_DLCI:
+                reply = b'E270\r\nOK\r\n' if info == b'AT+GMM\r' else b''
+                self.respond(cmux.encode_frame(dlci, cmux.UIH,
+                                               info + b'\r\n' + reply))
+
+    def inWaiting(self):
+        return len(self.inbound)
+
+    def read(self, size=1):
+        with self.cond:
+            if not self.inbound:
+                self.cond.wait(.05)
+            data = bytes(self.inbound[:size])
+            del self.inbound[:size]
+        return data
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_sabm_frame(self):
+        frame = cmux.encode_frame(0, cmux.SABM | cmux.PF)
+        self.assertEqual(b'\xf9\x03\x3f\x01\x1c\xf9', frame)
+
+    def test_ua_frame(self):
+        frame = cmux.encode_frame(0, cmux.UA | cmux.PF)
+        self.assertEqual(b'\xf9\x03\x73\x01\xd7\xf9', frame)
+
+    def test_decode_split_and_long_frames(self):
+        payload = b'x' * 300
+        raw = (b'garbage' + cmux.encode_frame(2, cmux.UIH, b'AT\r') +
+               cmux.encode_frame(1, cmux.UIH, payload))
+        decoder = cmux.FrameDecoder()
+        frames = []
+        for i in range(0, len(raw), 7):
+            frames.extend(decoder.feed(raw[i:i + 7]))
+        self.assertEqual([(2, cmux.UIH, b'AT\r'), (1, cmux.UIH, payload)],
+                         frames)
+
+    def test_corrupt_frame_is_skipped(self):
+        bad = bytearray(cmux.encode_frame(2, cmux.UIH, b'AT\r'))
+        bad[-2] ^= 0xFF
+        good = cmux.encode_frame(3, cmux.UIH, b'RING\r\n')
+        frames = cmux.FrameDecoder().feed(bytes(bad) + good)
+        self.assertEqual([(3, cmux.UIH, b'RING\r\n')], frames)
+
+
+class TestMultiplexer(unittest.TestCase):
+
+    def test_at_command_over_virtual_channel(self):
+        mux = cmux.Multiplexer(FakePhysicalPort())
+        mux.start(dlcis=(cmux.AT_DLCI,), mode_command=False)
+        try:
+            port = mux.channel(cmux.AT_DLCI)
+            self.assertEqual(['E270'], port.send_at('+GMM', '',
+                                                    prefixed=False))
+        finally:
+            mux.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
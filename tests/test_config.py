@@ -0,0 +1,109 @@
+import threading
+import unittest
+from humod import at_commands as atc
+from humod import config
+from humod import errors
+
+STATE = ['+CGDCONT: 1,"IP","internet","0.0.0.0",0,0',
+         '+CSCA: "+353868002000",145',
+         '+CNMI: 2,1,0,2,1',
+         '+CLIP: 0,1',
+         '+CMGF: 1',
+         '^CURC: 0',
+         '+CSMP: 17,71,0,8']
+
+
+class FakePort(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def read_waiting(self):
+        return b''
+
+    def send_at(self, cmd, suffix, prefixed=True):
+        self.sent.append(cmd + suffix)
+        if (cmd, suffix) == ('+CSMP', '?'):
+            # A single read, with the prefix stripped.
+            return [STATE[-1][7:]]
+        return STATE if cmd.endswith('?') else []
+
+
+class FakeModem(atc.EnterCommands):
+
+    def __init__(self):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.sent = self.modem.ctrl_port.sent
+
+    def test_read_state(self):
+        state = config.read_state(self.modem)
+        self.assertEqual(['+CMGF?;+CSCA?;+CGDCONT?;+CNMI?;+CLIP?;^CURC?;+CSMP?'],
+                         self.sent)
+        self.assertEqual({'textmode': True,
+                          'service_center': ('+353868002000', 145),
+                          'pdp_context': {
+                              1: ['IP', 'internet', '0.0.0.0', '0', '0']},
+                          'nmi': True, 'clip': False, 'curc': False,
+                          'status_reports': False,
+                          'sms_parameters': ['17', '71', '0', '8']},
+                         state)
+
+    def test_apply_nothing(self):
+        changed = config.apply(self.modem, {
+            'textmode': True, 'nmi': True, 'clip': False,
+            'service_center': '+353868002000',
+            'pdp_context': [(1, 'IP', 'internet', '')]})
+        self.assertEqual([], changed)
+        self.assertEqual(1, len(self.sent))
+
+    def test_apply_changes(self):
+        changed = config.apply(self.modem, {
+            'textmode': True, 'clip': True,
+            'service_center': ('+353868002001', 145),
+            'pdp_context': [(1, 'IP', 'internet'),
+                            (2, 'IP', 'mms', '', 0, 0)]})
+        self.assertEqual(['service_center', 'pdp_context', 'clip'], changed)
+        self.assertEqual(['+CMGF?;+CSCA?;+CGDCONT?;+CLIP?',
+                          '+CSCA="+353868002001",145;'
+                          '+CGDCONT=2,"IP","mms","",0,0;+CLIP=1'], self.sent)
+
+    def test_status_reports_keep_sms_parameters(self):
+        changed = config.apply(self.modem, {'status_reports': True})
+        self.assertEqual(['status_reports'], changed)
+        self.assertEqual(['+CSMP?', '+CSMP=49,71,0,8'], self.sent)
+        del self.sent[:]
+        self.assertFalse(self.modem.enable_status_reports())
+        self.modem.enable_status_reports(True)
+        self.modem.enable_status_reports(False)
+        self.assertEqual(['+CSMP?', '+CSMP?', '+CSMP=49,71,0,8', '+CSMP?',
+                          '+CSMP=17,71,0,8'], self.sent)
+
+    def test_status_reports_without_reply(self):
+        self.assertRaises(errors.AtCommandError, config.diff,
+                          {'status_reports': False}, {'status_reports': True})
+        self.modem.ctrl_port.send_at = lambda cmd, suffix, prefixed=True: []
+        self.assertRaises(errors.AtCommandError, config.apply, self.modem,
+                          {'status_reports': True})
+
+    def test_long_batches_are_split(self):
+        contexts = [(cid, 'IP', 'apn%d.example.com' % cid)
+                    for cid in range(2, 12)]
+        config.apply(self.modem, {'pdp_context': contexts})
+        self.assertTrue(len(self.sent) > 2)
+        self.assertTrue(all(len(line) <= config.COMMAND_LINE_MAX
+                            for line in self.sent))
+
+    def test_unknown_setting(self):
+        self.assertRaises(errors.HumodUsageError, config.apply,
+                          self.modem, {'colour': 'blue'})
+
+
+if __name__ == '__main__':
+    unittest.main()
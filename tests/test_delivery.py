@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+from humod import delivery
+from humod.subscriptions import SubscriptionManager
+
+
+class FakePort(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def read_waiting(self):
+        return b''
+
+    def send_at(self, cmd, suffix, prefixed=True):
+        self.sent.append(cmd + suffix)
+        if cmd == '+CMGR':
+            return ['"REC UNREAD",6,8,"+353861234567",145,'
+                    '"20/01/02,10:00:00+04","20/01/02,10:00:05+04",0']
+        return []
+
+
+class FakeProber(object):
+
+    def set_patterns(self, patterns):
+        pass
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+        self.subscriptions = SubscriptionManager(self)
+        self.reference = 0
+        self.reports_enabled = None
+        self.deleted = []
+
+    def enable_status_reports(self, status=None):
+        self.reports_enabled = status
+
+    def sms_send(self, number, contents):
+        self.reference += 1
+        return self.reference
+
+    def sms_del(self, index):
+        self.deleted.append(index)
+
+
+class TestDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.reports = []
+        self.tracker = delivery.DeliveryTracker(
+            maxlen=3, on_report=self.reports.append)
+        self.tracker.track(self.modem)
+
+    def test_track(self):
+        self.assertTrue(self.modem.reports_enabled)
+        self.assertTrue(self.modem.subscriptions.subscribed('status report'))
+
+    def test_direct_reports(self):
+        first = self.tracker.send(self.modem, '+353861234567', 'Hi')
+        second = self.tracker.send(self.modem, '+353861234568', 'Hi')
+        self.tracker.cds_update(self.modem, '+CDS: 6,1,"+353861234567",145,'
+                                '"20/01/02,10:00:00+04",'
+                                '"20/01/02,10:00:05+04",0\r\n')
+        # Temporary errors keep the job pending.
+        self.tracker.cds_update(self.modem, '+CDS: 6,2,"+353861234568",145,'
+                                '"20/01/02,10:00:00+04",'
+                                '"20/01/02,10:00:05+04",48\r\n')
+        self.assertEqual(delivery.DELIVERED, first.status)
+        self.assertEqual(delivery.PENDING, second.status)
+        self.assertEqual([first], self.reports)
+        self.tracker.report(self.modem, 2, 70)
+        self.assertEqual(delivery.FAILED, second.status)
+        stats = self.tracker.stats()
+        self.assertEqual(1, stats['delivered'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(0, stats['pending'])
+        self.assertTrue(stats['latency_max'] >= 0)
+
+    def test_stored_reports(self):
+        for _ in range(8):
+            job = self.tracker.send(self.modem, '+353861234567', 'Hi')
+        self.tracker.cdsi_update(self.modem, '+CDSI: "SM",4\r\n')
+        deadline = time.time() + 5
+        while not self.reports and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(8, self.reports[0].reference)
+        self.assertIs(job, self.reports[0])
+        self.assertEqual(['+CMGR=4'], self.modem.ctrl_port.sent)
+        self.assertEqual([4], self.modem.deleted)
+
+    def test_malformed_reports_are_dropped(self):
+        job = self.tracker.send(self.modem, '+353861234567', 'Hi')
+        self.tracker.cds_update(self.modem, '+CDS: 6,x,"+353861234567",145,'
+                                '"20/01/02,10:00:00+04",'
+                                '"20/01/02,10:00:05+04",0\r\n')
+        self.tracker.cds_update(self.modem, '+CDS: 6\r\n')
+        self.tracker.cdsi_update(self.modem, '+CDSI: "SM",\r\n')
+        self.tracker.cdsi_update(self.modem, '+CDSI\r\n')
+        self.assertEqual(4, self.tracker.stats()['malformed'])
+        self.assertEqual(delivery.PENDING, job.status)
+        self.assertEqual([], self.modem.ctrl_port.sent)
+
+    def test_bounded_index(self):
+        for _ in range(5):
+            self.tracker.send(self.modem, '+353861234567', 'Hi')
+        self.assertEqual(3, self.tracker.pending())
+        self.assertEqual(2, self.tracker.stats()['dropped'])
+        self.assertIsNone(self.tracker.report(self.modem, 1, 0))
+        self.assertEqual(1, self.tracker.stats()['unmatched'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from humod import errors
+
+
+class TestErrors(unittest.TestCase):
+
+    def test_data_lines_pass(self):
+        for line in ('Your ERROR report is ready\r\n', 'OK\r\n', '',
+                     '+CMGL: 0,"REC READ","ERROR",,"12/05/10,10:05:41+08"'):
+            errors.check_for_errors(line)
+
+    def test_plain_error(self):
+        with self.assertRaises(errors.AtCommandError) as ctx:
+            errors.check_for_errors('ERROR\r\n')
+        self.assertFalse(ctx.exception.retryable)
+        self.assertTrue(errors.classify('BUSY').retryable)
+
+    def test_cme_error(self):
+        with self.assertRaises(errors.CmeError) as ctx:
+            errors.check_for_errors('+CME ERROR: 14\r\n')
+        self.assertEqual(14, ctx.exception.code)
+        self.assertTrue(ctx.exception.retryable)
+        self.assertFalse(errors.classify('+CME ERROR: 11').retryable)
+
+    def test_cms_error(self):
+        error = errors.classify('+CMS ERROR: 322')
+        self.assertIsInstance(error, errors.CmsError)
+        self.assertEqual('memory full', error.description)
+        self.assertFalse(error.retryable)
+
+    def test_verbose_error(self):
+        error = errors.classify('+CME ERROR: SIM busy')
+        self.assertEqual(14, error.code)
+        self.assertTrue(error.retryable)
+        error = errors.classify('+CME ERROR: vendor specific')
+        self.assertIsNone(error.code)
+        self.assertFalse(error.retryable)
+
+
+if __name__ == "__main__":
+    unittest.main()
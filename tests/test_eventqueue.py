@@ -0,0 +1,40 @@
+import unittest
+from humod.eventqueue import EventQueue
+
+
+class TestEventQueue(unittest.TestCase):
+
+    def drain(self, events):
+        lines = []
+        while not events.empty():
+            lines.append(events.get())
+        return lines
+
+    def test_superseded_reports_are_merged(self):
+        events = EventQueue()
+        for line in (b'^RSSI:10\r\n', b'+CMTI: "SM",1\r\n', b'^RSSI:12\r\n',
+                     b'^RSSI:14\r\n'):
+            events.put(line)
+        self.assertEqual([b'^RSSI:14\r\n', b'+CMTI: "SM",1\r\n'],
+                         self.drain(events))
+        self.assertEqual(2, events.merged)
+
+    def test_bounded_without_dropping_critical(self):
+        events = EventQueue(maxsize=3)
+        events.put(b'RING\r\n')
+        for i in range(5):
+            events.put(b'^BOOT:%d\r\n' % i)
+        events.put(b'+CMTI: "SM",2\r\n')
+        events.put(b'+CMTI: "SM",3\r\n')
+        self.assertEqual(3, events.qsize())
+        self.assertEqual([b'RING\r\n', b'+CMTI: "SM",2\r\n',
+                          b'+CMTI: "SM",3\r\n'], self.drain(events))
+        self.assertEqual(5, events.dropped)
+        self.assertEqual(5, events.overflows)
+
+    def test_get_timeout(self):
+        self.assertIsNone(EventQueue().get(timeout=.01))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from humod import at_commands as atc
+from humod import export
+from humod.humodem import BaseModemPort
+
+REPLIES = {
+    'AT+CMGL="ALL"': ['+CMGL: 1,"REC READ","+353861234567",,'
+                      '"20/01/02,10:00:00+04"', 'Hello',
+                      '+CMGL: 2,"REC UNREAD","+353861234568",,'
+                      '"20/01/03,11:00:00-22"', 'Two', 'lines', '', 'OK'],
+    'AT+CPBR=?': ['+CPBR: (1-60),40,14', 'OK'],
+    'AT+CPBR=1,50': ['+CPBR: 1,"+353861234567",145,"Alice"', 'OK'],
+    'AT+CPBR=51,60': ['+CME ERROR: 22'],
+    'AT+GSN': ['123456789012345', 'OK'],
+    'AT+GMI': ['huawei', 'OK'],
+    'AT+GMM': ['E173', 'OK'],
+    'AT+GMR': ['11.126', 'OK'],
+    'AT+CIMI': ['272011234567890', 'OK'],
+}
+
+
+class ScriptPort(BaseModemPort):
+    """Control port answering commands from REPLIES."""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        command = data.decode().strip()
+        self.lines.append(command)
+        self.lines.extend(REPLIES.get(command, ['OK']))
+
+    def readline(self):
+        return (self.lines.pop(0) + '\r\n').encode() if self.lines else b''
+
+    def read(self, size=1):
+        return b''
+
+    def inWaiting(self):
+        return len(self.lines)
+
+
+class FakeModem(atc.InteractiveCommands, atc.ShowCommands):
+
+    def __init__(self):
+        self.ctrl_port = ScriptPort()
+        self.ctrl_lock = threading.Lock()
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sms_iter(self):
+        messages = list(self.modem.sms_iter())
+        self.assertEqual([([1, 'REC READ', '+353861234567', '',
+                            '20/01/02,10:00:00+04'], 'Hello'),
+                          ([2, 'REC UNREAD', '+353861234568', '',
+                            '20/01/03,11:00:00-22'], 'Two\nlines')],
+                         messages)
+        self.assertFalse(self.modem.ctrl_lock.locked())
+
+    def test_sms_iter_result_bodies(self):
+        REPLIES['AT+CMGL="REC READ"'] = [
+            '+CMGL: 0,"REC READ","+353861234567",,"20/01/02,10:00:00+04"',
+            'OK', '+CMGL: 1,"REC READ","+353861234567",,'
+            '"20/01/02,10:01:00+04"', 'ERROR', '', 'OK']
+        try:
+            messages = list(self.modem.sms_iter('REC READ'))
+        finally:
+            del REPLIES['AT+CMGL="REC READ"']
+        self.assertEqual(['OK', 'ERROR'], [text for _, text in messages])
+        self.assertEqual([], self.modem.ctrl_port.lines)
+
+    def test_sms_iter_closed_early(self):
+        iterator = self.modem.sms_iter()
+        next(iterator)
+        iterator.close()
+        self.assertFalse(self.modem.ctrl_lock.locked())
+        self.assertEqual([], self.modem.ctrl_port.lines)
+
+    def test_iso_time(self):
+        self.assertEqual('2020-01-02T10:00:00+01:00',
+                         export.iso_time('20/01/02,10:00:00+04'))
+        self.assertEqual('2020-01-03T11:00:00-05:30',
+                         export.iso_time('20/01/03,11:00:00-22'))
+        self.assertEqual('2020-01-03T11:00:00+00:00',
+                         export.iso_time('20/01/03,11:00:00'))
+        self.assertEqual('garbage', export.iso_time('garbage'))
+
+    def test_jsonl(self):
+        out = io.StringIO()
+        counts = export.export(self.modem, export.JsonlWriter(out))
+        self.assertEqual({'device': 1, 'messages': 2, 'phonebook': 1},
+                         counts)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual('E173', records[0]['model'])
+        self.assertEqual('272011234567890', records[1]['sim'])
+        self.assertEqual('Two\nlines', records[2]['text'])
+        self.assertEqual('Alice', records[3]['name'])
+
+    def test_csv(self):
+        out = io.StringIO()
+        export.export(self.modem, export.CsvWriter(out), ['messages'])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(','.join(export.CSV_FIELDS), lines[0])
+        self.assertTrue(lines[1].startswith('message,272011234567890,1,'))
+
+    def test_checkpoint(self):
+        path = os.path.join(self.dir, 'state')
+        counts = export.export(self.modem, export.JsonlWriter(io.StringIO()),
+                               checkpoint=export.Checkpoint(path))
+        self.assertEqual(2, counts['messages'])
+        listing = REPLIES['AT+CMGL="ALL"']
+        # Listing the unread message marked it read.
+        REPLIES['AT+CMGL="ALL"'] = [
+            line.replace('REC UNREAD', 'REC READ') for line in listing]
+        REPLIES['AT+CMGL="ALL"'].insert(-1, '+CMGL: 3,"REC UNREAD",'
+                                        '"+353861234569",,'
+                                        '"20/01/04,12:00:00+04"')
+        REPLIES['AT+CMGL="ALL"'].insert(-1, 'New')
+        try:
+            counts = export.export(self.modem,
+                                   export.JsonlWriter(io.StringIO()),
+                                   checkpoint=export.Checkpoint(path))
+        finally:
+            REPLIES['AT+CMGL="ALL"'] = listing
+        self.assertEqual({'device': 0, 'messages': 1, 'phonebook': 0},
+                         counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
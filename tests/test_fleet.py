@@ -0,0 +1,92 @@
+import time
+import unittest
+from humod import errors
+from humod import fleet
+
+SYSINFO = {'Service': 'Valid service', 'SIM card state': 'Valid'}
+CLOSED = []
+
+
+class FakePort(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def close(self):
+        CLOSED.append(self.name)
+
+
+class FakeModem(object):
+    """Modem identified by its control port, with a PIN of 1234."""
+
+    delay = .2
+
+    def __init__(self, data, ctrl):
+        if ctrl == 'missing':
+            raise IOError('No such device.')
+        time.sleep(self.delay)
+        self.data_port = FakePort(data)
+        self.ctrl_port = FakePort(ctrl)
+        self.imei = 'imei-%s' % ctrl
+        self.locked = ctrl.startswith('locked')
+        self.entered = []
+
+    def show_imei(self):
+        return self.imei
+
+    def get_pin_status(self):
+        return 'PIN required' if self.locked else 'Sim card ready to use'
+
+    def enter_pin(self, pin):
+        self.entered.append(pin)
+        if pin != 1234:
+            raise errors.AtCommandError('+CME ERROR: 16')
+        self.locked = False
+
+
+class TestFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.system_info = fleet.siminfo.system_info
+        del CLOSED[:]
+        fleet.siminfo.system_info = lambda modem: dict(SYSINFO)
+
+    def tearDown(self):
+        fleet.siminfo.system_info = self.system_info
+
+    def test_concurrent_bring_up(self):
+        pairs = [('data', 'ctrl%d' % i) for i in range(8)]
+        started = time.time()
+        reports = fleet.bring_up(pairs, modem_class=FakeModem)
+        self.assertTrue(time.time() - started < FakeModem.delay * 4)
+        self.assertEqual(set('imei-ctrl%d' % i for i in range(8)),
+                         set(reports))
+        self.assertTrue(all(report.ready for report in reports.values()))
+
+    def test_failures(self):
+        reports = fleet.bring_up(
+            [('data', 'locked0'), ('data', 'locked1'), ('data', 'missing')],
+            pins={'imei-locked0': 1234, 'imei-locked1': 1111},
+            modem_class=FakeModem)
+        self.assertTrue(reports['imei-locked0'].ready)
+        self.assertEqual([1234], reports['imei-locked0'].modem.entered)
+        self.assertFalse(reports['imei-locked1'].ready)
+        self.assertIn('+CME ERROR', reports['imei-locked1'].error)
+        self.assertIsNone(reports['imei-locked1'].modem)
+        self.assertEqual(['data', 'locked1'], CLOSED)
+        self.assertFalse(reports['missing'].ready)
+        self.assertIsNone(reports['missing'].imei)
+
+    def test_timeout(self):
+        reports = fleet.bring_up([('data', 'ctrl0')], timeout=.01,
+                                 modem_class=FakeModem)
+        self.assertEqual('Timed out.', reports['ctrl0'].error)
+        self.assertEqual([], CLOSED)
+        deadline = time.time() + 5
+        while len(CLOSED) < 2 and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(['data', 'ctrl0'], CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
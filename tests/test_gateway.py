@@ -0,0 +1,309 @@
+import asyncio
+import http.client
+import json
+import os
+import pty
+import socket
+import threading
+import time
+import unittest
+import serial.serialposix
+from humod import errors
+from humod import gateway
+from humod import humodem
+from humod.humodem import ConnectionStatus
+from humod.subscriptions import SubscriptionManager
+
+
+class FakePort(object):
+
+    def read_waiting(self):
+        return b''
+
+    def send_at(self, cmd, suffix, prefixed=True):
+        return ['+CMGR: "REC UNREAD","+353123",,"20/01/02,10:00:00+04"',
+                'Hello']
+
+
+class FakeProber(object):
+
+    def set_patterns(self, patterns):
+        pass
+
+
+class FakeModem(object):
+
+    def __init__(self, fail=False):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+        self.subscriptions = SubscriptionManager(self)
+        self.status = ConnectionStatus()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = fail
+        self.sent = []
+
+    def sms_send(self, number, contents):
+        self.release.wait(5)
+        if self.fail:
+            raise errors.AtCommandError('ERROR')
+        self.sent.append((number, contents))
+        return len(self.sent)
+
+
+class TestGateway(unittest.TestCase):
+
+    def setUp(self):
+        self.modems = {'a': FakeModem(), 'b': FakeModem(fail=True)}
+        self.gateway = gateway.Gateway(self.modems, max_pending=2)
+        self.loop = asyncio.new_event_loop()
+        server = self.loop.run_until_complete(
+            self.gateway.start('127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.http = http.client.HTTPConnection('127.0.0.1', self.port,
+                                               timeout=5)
+
+    def tearDown(self):
+        self.http.close()
+        self.gateway.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+            self.loop.run_until_complete(asyncio.wait([task]))
+        self.loop.close()
+
+    def request(self, method, path, body=None):
+        if body is not None:
+            body = json.dumps(body)
+        self.http.request(method, path, body)
+        response = self.http.getresponse()
+        return response, response.read()
+
+    def test_send_and_keep_alive(self):
+        response, body = self.request(
+            'POST', '/send', {'number': '+353123', 'text': 'Hi', 'modem': 'a'})
+        self.assertEqual(200, response.status)
+        self.assertEqual({'modem': 'a', 'reference': 1}, json.loads(body))
+        response, body = self.request('POST', '/send', [
+            {'number': '1', 'text': 'x', 'modem': 'a'},
+            {'number': '2', 'text': 'y', 'modem': 'b'}])
+        results = json.loads(body)
+        self.assertEqual(2, results[0]['reference'])
+        self.assertIn('error', results[1])
+        response, body = self.request('GET', '/status')
+        status = json.loads(body)
+        self.assertEqual([2, 0], [s['sent'] for s in status])
+        self.assertEqual([0, 1], [s['failed'] for s in status])
+
+    def test_errors(self):
+        response, _ = self.request('POST', '/send', {'text': 'x'})
+        self.assertEqual(400, response.status)
+        response, _ = self.request(
+            'POST', '/send', {'number': '1', 'text': 'x', 'modem': 'b'})
+        self.assertEqual(502, response.status)
+        response, _ = self.request('GET', '/send')
+        self.assertEqual(405, response.status)
+        response, _ = self.request('GET', '/nowhere')
+        self.assertEqual(404, response.status)
+
+    def test_invalid_requests(self):
+        response, _ = self.request('POST', '/send',
+                                   {'number': 353123, 'text': 'x'})
+        self.assertEqual(400, response.status)
+        response, _ = self.request('POST', '/send', [
+            {'number': '1', 'text': ['x']}])
+        self.assertEqual(400, response.status)
+        response, _ = self.request('POST', '/send', {
+            'number': '1', 'text': 'x', 'modem': ['a']})
+        self.assertEqual(400, response.status)
+        self.assertEqual([], self.modems['a'].sent)
+        client = socket.create_connection(('127.0.0.1', self.port), 5)
+        client.sendall(b'POST /send HTTP/1.1\r\nContent-Length: ten\r\n\r\n')
+        data = b''
+        while b'\r\n\r\n' not in data:
+            data += client.recv(1024)
+        client.close()
+        self.assertTrue(data.startswith(b'HTTP/1.1 400 '))
+
+    def test_backpressure(self):
+        self.modems['a'].release.clear()
+        batch = [{'number': '1', 'text': 'x', 'modem': 'a'}] * 2
+        pending = http.client.HTTPConnection('127.0.0.1', self.port,
+                                             timeout=5)
+        pending.request('POST', '/send', json.dumps(batch))
+        time.sleep(.2)
+        response, _ = self.request(
+            'POST', '/send', {'number': '1', 'text': 'x', 'modem': 'a'})
+        self.assertEqual(503, response.status)
+        self.assertEqual('1', response.getheader('Retry-After'))
+        self.modems['a'].release.set()
+        self.assertEqual(200, pending.getresponse().status)
+        pending.close()
+
+    def test_refused_batch_is_released(self):
+        batch = [{'number': '1', 'text': 'x', 'modem': 'a'}] * 3
+        response, _ = self.request('POST', '/send', batch)
+        self.assertEqual(503, response.status)
+        self.assertEqual(0, self.gateway.handles['a'].pending)
+        response, _ = self.request(
+            'POST', '/send', {'number': '1', 'text': 'x', 'modem': 'a'})
+        self.assertEqual(200, response.status)
+
+    def test_metrics(self):
+        response, body = self.request('GET', '/metrics')
+        self.assertEqual(200, response.status)
+        self.assertIn(b'humod_sms_sent_total{modem="a"} 0', body)
+
+    def test_events(self):
+        client = socket.create_connection(('127.0.0.1', self.port), 5)
+        client.sendall(b'GET /events HTTP/1.1\r\nHost: x\r\n\r\n')
+        data = b''
+        while b'\r\n\r\n' not in data:
+            data += client.recv(1024)
+        while not self.gateway._clients:
+            time.sleep(.01)
+        action = self.modems['a'].subscriptions._handlers['new sms'][0]
+        action(self.modems['a'], '+CMTI: "SM",3\r\n')
+        while b'\n\n' not in data.split(b'\r\n\r\n', 1)[1]:
+            data += client.recv(1024)
+        client.close()
+        event = json.loads(data.split(b'data: ')[1].split(b'\n')[0])
+        self.assertEqual(3, event['index'])
+        self.assertEqual('Hello', event['text'])
+        self.assertEqual('+353123', event['number'])
+
+    def test_malformed_new_message_report(self):
+        action = self.modems['a'].subscriptions._handlers['new sms'][0]
+        action(self.modems['a'], '+CMTI: "SM",x\r\n')
+        action(self.modems['a'], '+CMTI\r\n')
+        self.assertEqual(0, self.gateway.handles['a'].received)
+
+
+class PtyPort(humodem.BaseModemPort, serial.serialposix.Serial):
+    """Real serial port on the slave end of a pty."""
+
+
+class ScriptedModem(threading.Thread):
+    """Answer AT commands on the master end of a pty."""
+
+    def __init__(self, master, replies):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.master = master
+        self.replies = replies
+        self.commands = []
+        self.sent = []
+
+    def answer(self, lines):
+        os.write(self.master, ('\r\n' + ''.join(
+            line + '\r\n' for line in lines) + '\r\nOK\r\n').encode())
+
+    def run(self):
+        data, text_mode = b'', False
+        while True:
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                return
+            if not chunk:
+                return
+            data += chunk
+            while True:
+                if text_mode:
+                    end = data.find(b'\x1a')
+                    if end < 0:
+                        break
+                    self.sent.append(data[:end].decode().lstrip('\n'))
+                    data, text_mode = data[end + 1:], False
+                    self.answer(['+CMGS: %d' % len(self.sent)])
+                    continue
+                end = data.find(b'\r')
+                if end < 0:
+                    break
+                line = data[:end].strip().decode()
+                data = data[end + 1:]
+                if not line:
+                    continue
+                self.commands.append(line)
+                if line.startswith('AT+CMGS='):
+                    text_mode = True
+                else:
+                    self.answer(self.replies.get(line[2:], []))
+
+
+class TestGatewayPty(unittest.TestCase):
+    """Gateway driving a real Modem over a pty."""
+
+    def setUp(self):
+        self.fds = []
+        ports = []
+        for _ in range(2):
+            master, slave = pty.openpty()
+            self.fds.extend((master, slave))
+            ports.append(PtyPort(os.ttyname(slave), 9600, timeout=.5))
+        self.modem = humodem.Modem(*ports)
+        self.script = ScriptedModem(self.fds[2], {
+            '+CMGL="ALL"': [
+                '+CMGL: 1,"REC READ","+353861234567",,"24/03/05,14:30:15+04"',
+                'Hello'],
+            '+CMGR=1': [
+                '+CMGR: "REC READ","+353861234567",,"24/03/05,14:30:15+04"',
+                'Hello']})
+        self.script.start()
+        self.gateway = gateway.Gateway({'usb0': self.modem})
+        self.loop = asyncio.new_event_loop()
+        server = self.loop.run_until_complete(
+            self.gateway.start('127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.http = http.client.HTTPConnection('127.0.0.1', self.port,
+                                               timeout=10)
+
+    def tearDown(self):
+        self.http.close()
+        self.gateway.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+            self.loop.run_until_complete(asyncio.wait([task]))
+        self.loop.close()
+        self.modem.data_port.close()
+        self.modem.ctrl_port.close()
+        for fd in self.fds:
+            os.close(fd)
+
+    def request(self, method, path, body=None):
+        if body is not None:
+            body = json.dumps(body)
+        self.http.request(method, path, body)
+        response = self.http.getresponse()
+        return response, json.loads(response.read())
+
+    def test_send(self):
+        response, result = self.request(
+            'POST', '/send', [{'number': '+353861234567', 'text': 'Hi'},
+                              {'number': '+353861234568', 'text': 'Yo'}])
+        self.assertEqual(200, response.status)
+        self.assertEqual([1, 2], [r['reference'] for r in result])
+        self.assertEqual(['AT+CMGS="+353861234567"', 'AT+CMGS="+353861234568"'],
+                         self.script.commands)
+        self.assertEqual(['Hi', 'Yo'], self.script.sent)
+
+    def test_inbox(self):
+        response, messages = self.request('GET', '/inbox?modem=usb0')
+        self.assertEqual(200, response.status)
+        self.assertEqual('Hello', messages[0]['txt'])
+        self.assertEqual('353861 234 567', messages[0]['no'])
+        self.assertEqual('2024-03-05 14:30:15+01:00', messages[0]['at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
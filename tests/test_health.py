@@ -0,0 +1,159 @@
+import threading
+import time
+import unittest
+from humod import errors
+from humod import health
+from humod.scheduler import CommandScheduler
+
+
+class FakePort(object):
+    """Control port answering AT with OK unless the modem is dead."""
+
+    def __init__(self):
+        self.dead = False
+        self.lines = []
+
+    def read_waiting(self):
+        return b''
+
+    def write(self, data):
+        if not self.dead:
+            self.lines.extend([data.strip() + b'\r\n', b'OK\r\n'])
+
+    def readline(self):
+        if self.lines:
+            return self.lines.pop(0)
+        time.sleep(.05)
+        return b''
+
+
+class FakeProber(object):
+    last_activity = None
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_transitions(self):
+        breaker = health.CircuitBreaker(failure_threshold=2,
+                                        reset_timeout=.1)
+        breaker.record_failure()
+        self.assertEqual(health.CLOSED, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(health.OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+        time.sleep(.15)
+        self.assertEqual(health.HALF_OPEN, breaker.state)
+        # One failure while half-open opens the breaker again.
+        breaker.record_failure()
+        self.assertEqual(health.OPEN, breaker.state)
+        time.sleep(.15)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(health.CLOSED, breaker.state)
+        self.assertEqual(0, breaker.failures)
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.heartbeat = health.Heartbeat(
+            self.modem, health.CircuitBreaker(failure_threshold=2),
+            interval=10, timeout=.2)
+
+    def test_ping(self):
+        self.assertTrue(health.ping(self.modem, .2))
+        self.modem.ctrl_port.dead = True
+        self.assertFalse(health.ping(self.modem, .2))
+
+    def test_ping_with_held_lock(self):
+        self.modem.ctrl_lock.acquire()
+        started = time.time()
+        self.assertFalse(health.ping(self.modem, .1))
+        self.assertTrue(time.time() - started < 1)
+
+    def test_dead_modem_opens_breaker(self):
+        self.modem.ctrl_port.dead = True
+        self.assertFalse(self.heartbeat.check())
+        self.assertFalse(self.heartbeat.check())
+        self.assertEqual(health.OPEN, self.heartbeat.breaker.state)
+
+    def test_passive_liveness(self):
+        self.modem.ctrl_port.dead = True
+        self.modem.prober.last_activity = time.time()
+        self.assertTrue(self.heartbeat.check())
+        self.assertEqual(0, self.heartbeat.pings)
+
+    def test_scheduler_skips_open_breaker(self):
+        breaker = health.CircuitBreaker(failure_threshold=1)
+        scheduler = CommandScheduler(self.modem, breaker)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        self.assertEqual(1, scheduler.call(lambda: 1))
+        breaker.record_failure()
+        future = scheduler.submit(lambda: 1)
+        self.assertRaises(errors.CircuitOpenError, future.result, 0)
+
+    def test_half_open_admits_one_trial(self):
+        breaker = health.CircuitBreaker(failure_threshold=1,
+                                        reset_timeout=.05)
+        breaker.record_failure()
+        time.sleep(.06)
+        admitted = []
+        start = threading.Event()
+
+        def caller():
+            start.wait(5)
+            admitted.append(breaker.allow())
+
+        threads = [threading.Thread(target=caller) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(1, admitted.count(True))
+        breaker.record_outcome(IOError('Port gone.'))
+        self.assertEqual(health.OPEN, breaker.state)
+        time.sleep(.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        # An error result is an answer, it closes the breaker.
+        breaker.record_outcome(errors.AtCommandError('ERROR'))
+        self.assertEqual(health.CLOSED, breaker.state)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_scheduler_records_outcomes(self):
+        breaker = health.CircuitBreaker(failure_threshold=1,
+                                        reset_timeout=.05)
+        scheduler = CommandScheduler(self.modem, breaker)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+
+        def fail():
+            raise IOError('Port gone.')
+
+        self.assertRaises(IOError, scheduler.call, fail)
+        self.assertEqual(health.OPEN, breaker.state)
+        time.sleep(.06)
+        release = threading.Event()
+        trial = scheduler.submit(release.wait, 5)
+        queued = scheduler.submit(lambda: 1)
+        time.sleep(.05)
+        release.set()
+        self.assertTrue(trial.result(5))
+        self.assertEqual(health.CLOSED, breaker.state)
+        self.assertEqual(1, queued.result(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
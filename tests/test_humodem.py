@@ -50,6 +50,58 @@ class TestHumod(unittest.TestCase):
         texts = self.modem.sms_list()
         self.assertEqual(3, len(texts))
 
+    def test_error_text_in_body(self):
+        self.set_payload([
+            u'AT+CMGR=1\r\n',
+            u'+CMGR: "REC READ","999222",,"12/05/10,10:05:41+08"\r\n',
+            u'BUSY\r\n',
+            u'NO CARRIER\r\n',
+            u'\r\n',
+            u'OK\r\n',
+        ])
+        self.assertEqual('BUSY\nNO CARRIER', self.modem.sms_read(1))
+
+    def test_final_error(self):
+        self.set_payload([
+            u'AT+CMGR=9\r\n',
+            u'+CMS ERROR: 321\r\n',
+        ])
+        self.assertRaises(humod.errors.CmsError, self.modem.sms_read, 9)
+
+    def test_error_followed_by_report(self):
+        self.set_payload([
+            u'AT+CMGR=9\r\n',
+            u'+CMS ERROR: 321\r\n',
+            u'^RSSI:17\r\n',
+        ])
+        self.assertRaises(humod.errors.CmsError, self.modem.sms_read, 9)
+        self.set_payload([
+            u'AT+CPMS?\r\n',
+            u'+CPMS: "SM",3,30,"SM",3,30,"ME",1,100\r\n',
+            u'OK\r\n',
+            u'^RSSI:17\r\n',
+        ])
+        self.assertEqual([['SM', 3, 30], ['SM', 3, 30], ['ME', 1, 100]],
+                         self.modem.get_message_storage())
+
+    def test_message_storage(self):
+        self.set_payload([
+            u'AT+CPMS?\r\n',
+            u'+CPMS: "SM",3,30,"SM",3,30,"ME",1,100\r\n',
+            u'OK\r\n',
+        ])
+        self.assertEqual([['SM', 3, 30], ['SM', 3, 30], ['ME', 1, 100]],
+                         self.modem.get_message_storage())
+
+    def test_set_message_storage(self):
+        self.set_payload([
+            u'AT+CPMS="ME","ME","ME"\r\n',
+            u'+CPMS: 1,100,1,100,1,100\r\n',
+            u'OK\r\n',
+        ])
+        self.assertEqual([[1, 100], [1, 100], [1, 100]],
+                         self.modem.set_message_storage('ME', 'ME', 'ME'))
+
     def set_payload(self, payload):
         self.modem.ctrl_port.payload = payload
 
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from humod import errors
+from humod import journal
+
+
+class FakeModem(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = []
+
+    def sms_send(self, number, contents):
+        if self.error:
+            raise self.error
+        self.sent.append((number, contents))
+        return len(self.sent)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'outbox.journal')
+        self.queue = journal.OutboundQueue(self.path, chunk_size=4096)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.dir)
+
+    def reopen(self):
+        self.queue.close()
+        self.queue = journal.OutboundQueue(self.path, chunk_size=4096)
+        return self.queue
+
+    def test_recovery(self):
+        for i in range(3):
+            self.queue.put('+35386123456%d' % i, 'Hi %d' % i, {'n': i})
+        modem = FakeModem()
+        self.queue.send(modem, self.queue.get(), 'usb0')
+        queue = self.reopen()
+        self.assertEqual(2, queue.pending())
+        job = queue.get()
+        self.assertEqual((2, '+353861234561', 'Hi 1', {'n': 1}),
+                         (job.id, job.number, job.text, job.data))
+        # IDs go on where they stopped.
+        self.assertEqual(4, queue.put('+353861234567', 'Later'))
+
+    def test_in_doubt(self):
+        self.queue.put('+353861234567', 'Hi')
+        job = self.queue.get()
+        self.queue.sending(job, 'usb0')
+        # The process dies before +CMGS returns.
+        queue = self.reopen()
+        self.assertEqual(0, queue.pending())
+        self.assertEqual([1], list(queue.in_doubt))
+        self.assertEqual('usb0', queue.in_doubt[1].modem)
+        queue.resolve(1, False)
+        queue = self.reopen()
+        self.assertEqual(1, queue.pending())
+        job = queue.get()
+        queue.send(FakeModem(), job)
+        self.assertEqual(1, job.reference)
+        self.assertEqual(0, self.reopen().pending())
+
+    def test_refused_messages(self):
+        self.queue.put('+353861234567', 'Hi')
+        error = errors.AtCommandError('+CMS ERROR: 500', retryable=False)
+        self.assertRaises(errors.AtCommandError, self.queue.send,
+                          FakeModem(error), self.queue.get())
+        self.assertEqual(0, self.reopen().pending())
+
+    def test_torn_record(self):
+        self.queue.put('+353861234567', 'Hi')
+        self.queue.put('+353861234568', 'Hi')
+        size = self.queue.journal._written
+        self.queue.close()
+        with open(self.path, 'r+b') as f:
+            f.seek(size - 3)
+            f.write(b'xyz')
+        queue = self.reopen()
+        self.assertEqual(1, queue.pending())
+        # The torn message was never acknowledged, its ID is reused.
+        self.assertEqual(2, queue.put('+353861234569', 'Hi'))
+
+    def test_group_commit_and_growth(self):
+        def producer():
+            for i in range(250):
+                self.queue.put('+353861234567', 'Message %d' % i)
+        threads = [threading.Thread(target=producer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(self.queue.journal.commits < 2000)
+        self.assertTrue(os.path.getsize(self.path) > 4096)
+        self.queue.drain(FakeModem())
+        self.assertEqual(0, self.reopen().pending())
+        self.assertEqual(4096, os.path.getsize(self.path))
+
+    def test_put_during_compaction(self):
+        queue = journal.OutboundQueue(os.path.join(self.dir, 'compacted'),
+                                      chunk_size=4096, compact_every=5)
+        stop = threading.Event()
+        modem = FakeModem()
+
+        def producer():
+            for i in range(250):
+                queue.put('+353861234567', 'Message %d' % i)
+        threads = [threading.Thread(target=producer) for _ in range(4)]
+        consumer = threading.Thread(target=queue.drain,
+                                    args=(modem, 'usb0', stop, .01))
+        for thread in threads + [consumer]:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        stop.set()
+        consumer.join(10)
+        self.assertFalse(consumer.is_alive())
+        queue.drain(modem)
+        queue.close()
+        self.assertEqual(1000, len(modem.sent))
+
+    def test_not_a_journal(self):
+        path = os.path.join(self.dir, 'other')
+        with open(path, 'wb') as f:
+            f.write(b'something else')
+        self.assertRaises(errors.JournalError, journal.OutboundQueue, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
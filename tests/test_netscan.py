@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+from humod import netscan
+
+NETWORKS = [(2, 'Vodafone IE', 'voda IE', '27201', 2)]
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.scans = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_networks(self):
+        self.scans += 1
+        self.release.wait(5)
+        return list(NETWORKS)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(.01)
+
+
+class TestNetworkScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.scanner = netscan.NetworkScanner(self.modem, ttl=60)
+
+    def tearDown(self):
+        self.modem.release.set()
+
+    def test_cached_within_ttl(self):
+        self.assertEqual(None, self.scanner.networks('cell-1'))
+        self.assertEqual(NETWORKS, self.scanner.scan('cell-1').result(5))
+        self.assertEqual(NETWORKS, self.scanner.networks('cell-1'))
+        self.assertEqual(NETWORKS, self.scanner.networks('cell-1'))
+        self.assertEqual(1, self.modem.scans)
+        self.assertEqual(None, self.scanner.networks('cell-2',
+                                                     refresh=False))
+
+    def test_ttl_expiry(self):
+        self.scanner.ttl = .05
+        self.scanner.scan('cell-1').result(5)
+        time.sleep(.1)
+        # The stale list is returned while a new scan runs.
+        self.assertEqual(NETWORKS, self.scanner.networks('cell-1'))
+        self.scanner.scan('cell-1').result(5)
+        self.assertEqual(2, self.modem.scans)
+        self.assertTrue(self.scanner.age('cell-1') < .05)
+        self.scanner.invalidate('cell-1')
+        self.assertEqual(None, self.scanner.networks('cell-1',
+                                                     refresh=False))
+
+    def test_concurrent_scans_are_shared(self):
+        self.modem.release.clear()
+        first = self.scanner.scan('cell-1')
+        second = self.scanner.scan('cell-1')
+        self.scanner.networks('cell-1')
+        self.assertTrue(first is second)
+        other = self.scanner.scan('cell-2')
+        self.assertFalse(first is other)
+        self.modem.release.set()
+        first.result(5)
+        other.result(5)
+        self.assertEqual(2, self.modem.scans)
+
+    def test_progress(self):
+        self.assertEqual(None, self.scanner.progress('cell-1'))
+        self.modem.release.clear()
+        self.scanner.expected_duration = .2
+        future = self.scanner.scan('cell-1')
+        wait_for(lambda: self.modem.scans)
+        wait_for(lambda: self.scanner.progress('cell-1') > .5)
+        # A scan taking longer than expected stays below 1.
+        wait_for(lambda: self.scanner.progress('cell-1') == .99)
+        self.modem.release.set()
+        future.result(5)
+        self.assertEqual(1.0, self.scanner.progress('cell-1'))
+        # The estimate moves towards the measured duration.
+        self.assertTrue(self.scanner.expected_duration > .2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from humod import errors
+from humod import replay
+from humod.humodem import BaseModemPort
+
+CMGL_REPLY = (b'AT+CMGL="ALL"\r\r\n'
+              b'+CMGL: 0,"REC READ","999222",,"12/05/10,10:05:41+08"\r\n'
+              b'Hello\r\n'
+              b'+CMGL: 1,"REC UNREAD","123456",,"12/05/10,09:50:51+08"\r\n'
+              b'World\r\n'
+              b'\r\nOK\r\n')
+
+
+class ScriptedPort(BaseModemPort):
+    """Port answering every write with the next scripted reply."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.buffer = b''
+
+    def write(self, data):
+        self.buffer += self.replies.pop(0)
+
+    def read(self, size=1):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self):
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def inWaiting(self):
+        return len(self.buffer)
+
+    def close(self):
+        pass
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'ctrl.cap')
+        port = replay.RecordingPort(ScriptedPort([CMGL_REPLY]), self.path)
+        self.expected = port.send_at('+CMGL', '="ALL"')
+        port.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_capture_records(self):
+        records = list(replay.read_capture(self.path))
+        self.assertEqual(replay.WRITE, records[0][0])
+        self.assertEqual(b'AT+CMGL="ALL"\r', records[0][2])
+        self.assertEqual(CMGL_REPLY, b''.join(data for direction, _, data
+                                              in records[1:]))
+
+    def test_replay_through_modem(self):
+        modem = replay.replay_modem(self.path)
+        self.assertEqual(2, len(modem.sms_list()))
+        self.assertEqual(0, modem.ctrl_port.mismatches)
+        self.assertRaises(errors.ReplayError, modem.ctrl_port.readline)
+
+    def test_realtime_replay(self):
+        port = replay.ReplayPort(self.path, realtime=True)
+        self.assertEqual(self.expected, port.send_at('+CMGL', '="ALL"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from humod import actions
+from humod import sampler
+from humod import siminfo
+from humod.humodem import ConnectionStatus
+
+
+class FakePort(object):
+
+    def read_waiting(self):
+        return b''
+
+    def send_at(self, cmd, suffix, prefixed=True):
+        return {'^SYSINFO': ['^SYSINFO:2,3,0,5,1']}[cmd]
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+        self.status = ConnectionStatus()
+        self.rssi_polls = 0
+
+    def get_rssi(self):
+        self.rssi_polls += 1
+        return 20
+
+
+class TestActions(unittest.TestCase):
+
+    def test_rssi_update(self):
+        modem = FakeModem()
+        actions.rssi_update(modem, '^RSSI:17\r\n')
+        self.assertEqual(17, modem.status.rssi)
+        actions.rssi_update(modem, '^RSSI:\r\n')
+        actions.rssi_update(modem, '^RSSI:x7\r\n')
+        self.assertEqual(17, modem.status.rssi)
+
+    def test_system_info(self):
+        self.assertEqual({'Service': 'Valid service',
+                          'Type': 'Packet+Voice service',
+                          'Roaming': 'Not now', 'Mode': 'WCDMA',
+                          'SIM card state': 'Valid'},
+                         siminfo.system_info(FakeModem()))
+
+
+class TestSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.sampler = sampler.SignalSampler(
+            self.modem, min_interval=1, max_interval=8, urc_window=30,
+            maxlen=5)
+
+    def tearDown(self):
+        if self.sampler.is_alive():
+            self.sampler.stop()
+            self.sampler.join(5)
+
+    def test_interval_backs_off_and_recovers(self):
+        intervals = []
+        for now, value in enumerate([10, 10, 10, 10, 10, 10, 12]):
+            self.sampler.record(sampler.RSSI, value, now)
+            intervals.append(self.sampler._interval[sampler.RSSI])
+        self.assertEqual([1, 2, 4, 8, 8, 8, 1], intervals)
+        self.assertEqual(7, self.sampler._next_poll[sampler.RSSI])
+
+    def test_bounded_series(self):
+        for value in range(8):
+            self.sampler.record(sampler.MODE, value, value)
+        self.assertEqual([3, 4, 5, 6, 7],
+                         [value for _, _, value in self.sampler.samples()])
+        self.assertEqual([(6, sampler.MODE, 6), (7, sampler.MODE, 7)],
+                         self.sampler.samples(since=6))
+
+    def test_urc_suspends_polling(self):
+        self.sampler.rssi_update(self.modem, '^RSSI:17\r\n')
+        self.sampler.start()
+        deadline = time.time() + 5
+        while not self.sampler.samples(sampler.SYSINFO):
+            self.assertTrue(time.time() < deadline)
+            time.sleep(.01)
+        self.assertEqual(0, self.modem.rssi_polls)
+        self.assertEqual([17], [value for _, _, value in
+                                self.sampler.samples(sampler.RSSI)])
+
+    def test_malformed_urc(self):
+        self.sampler.rssi_update(self.modem, '^RSSI:??\r\n')
+        self.assertEqual([], self.sampler.samples())
+        self.assertEqual(0, self.sampler._next_poll[sampler.RSSI])
+
+    def test_patterns(self):
+        hooks = dict(self.sampler.patterns())
+        self.assertEqual(self.sampler.rssi_update,
+                         hooks[actions.PATTERN['rssi update']])
+        self.assertEqual(self.sampler.mode_update,
+                         hooks[actions.PATTERN['mode update']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import unittest
+from humod import scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.CommandScheduler(None)
+        self.order = []
+        self.gate = threading.Event()
+        self.scheduler.start()
+        # Keep the worker busy while the test queues commands.
+        self.blocker = self.scheduler.submit(self.gate.wait)
+
+    def tearDown(self):
+        self.gate.set()
+        self.scheduler.stop()
+        self.scheduler.join()
+
+    def run_queued(self):
+        self.gate.set()
+        self.scheduler.submit(lambda: None, priority=scheduler.BACKGROUND,
+                              caller='last').result(5)
+
+    def test_priority_and_fairness(self):
+        submit = self.scheduler.submit
+        for i in range(3):
+            submit(self.order.append, 'scan%d' % i,
+                   priority=scheduler.BACKGROUND, caller='scanner')
+        for i in range(2):
+            submit(self.order.append, 'a%d' % i, caller='a')
+        submit(self.order.append, 'b0', caller='b')
+        submit(self.order.append, 'hangup', priority=scheduler.URGENT)
+        self.run_queued()
+        self.assertEqual(['hangup', 'a0', 'b0', 'a1', 'scan0', 'scan1',
+                          'scan2'], self.order)
+
+    def test_method_names(self):
+        class Modem(object):
+            def get_rssi(self):
+                return 17
+        self.scheduler.modem = Modem()
+        future = self.scheduler.submit('get_rssi')
+        self.gate.set()
+        self.assertEqual(17, future.result(5))
+        self.assertRaises(AttributeError, self.scheduler.submit, 'missing')
+
+    def test_cancel_queued(self):
+        future = self.scheduler.submit(self.order.append, 'scan',
+                                       priority=scheduler.BACKGROUND)
+        self.assertTrue(future.cancel())
+        self.run_queued()
+        self.assertEqual([], self.order)
+
+    def test_exception_is_returned(self):
+        future = self.scheduler.submit(int, 'x')
+        self.gate.set()
+        self.assertRaises(ValueError, future.result, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from humod import siminfo
+
+
+class FakeModem(object):
+
+    def __init__(self, headers, texts):
+        self.headers = headers
+        self.texts = texts
+
+    def sms_list(self, message_type='ALL'):
+        return self.headers
+
+    def sms_read(self, index):
+        return self.texts[index]
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_zones(self):
+        stamp = siminfo.parse_dtime('24/03/05,14:30:15+08')
+        self.assertEqual(stamp, datetime(2024, 3, 5, 14, 30, 15,
+                                         tzinfo=timezone(timedelta(hours=2))))
+        stamp = siminfo.parse_dtime('24/03/05,14:30:15-22')
+        self.assertEqual(stamp.utcoffset(), timedelta(hours=-5, minutes=-30))
+        stamp = siminfo.parse_dtime('24/03/05,14:30:15')
+        self.assertEqual(stamp.tzinfo, timezone.utc)
+
+    def test_cached_zone(self):
+        first = siminfo.parse_dtime('24/03/05,14:30:15+04')
+        second = siminfo.parse_dtime('23/12/31,23:59:59+04')
+        self.assertTrue(first.tzinfo is second.tzinfo)
+
+    def test_convert_dtime(self):
+        self.assertEqual(siminfo.convert_dtime('24/03/05,14:30:15-04'),
+                         datetime(2024, 3, 5, 14, 30, 15))
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, siminfo.parse_dtime, 'yesterday')
+
+
+class TestHeaders(unittest.TestCase):
+
+    def test_shapes(self):
+        self.assertEqual(siminfo.sms_header(
+            [1, 'REC READ', '+353861234567', '', '24/03/05,14:30:15+04']),
+            (1, 'REC READ', '+353861234567', '24/03/05,14:30:15+04'))
+        self.assertEqual(siminfo.sms_header(
+            [2, 'REC READ', 0, 145, '+353861234567', 0,
+             '24/03/05,14:30:15+04', 0, 160]),
+            (2, 'REC READ', '+353861234567', '24/03/05,14:30:15+04'))
+        self.assertRaises(ValueError, siminfo.sms_header, [1, 'REC READ'])
+
+    def test_format_no(self):
+        self.assertEqual(siminfo.format_no('+353861234567'), '353861 234 567')
+        self.assertEqual(siminfo.format_no('Voicemail'), 'Voicemail')
+
+    def test_full_sms_list(self):
+        modem = FakeModem(
+            [[1, 'REC READ', '+353861234567', '', '24/03/05,14:30:15+04'],
+             [2, 'REC READ', '+353861234567', '', '24/03/05,14:30:16+04'],
+             [3, 'REC UNREAD', 0, 145, '+44123456', 0,
+              '24/03/05,13:30:00-04', 0, 160]],
+            {1: 'Hello ', 2: 'world', 3: 'Hi'})
+        texts = siminfo.full_sms_list(modem, 'inbox')
+        self.assertEqual([(m['id'], m['typ'], m['txt']) for m in texts],
+                         [(3, 'unread', 'Hi'), (1, 'read', 'Hello world')])
+        self.assertEqual(texts[1]['no'], '353861 234 567')
+
+
+if __name__ == '__main__':
+    unittest.main()
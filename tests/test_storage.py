@@ -0,0 +1,124 @@
+import threading
+import time
+import unittest
+from humod import storage
+from humod.subscriptions import SubscriptionManager
+
+
+class FakeProber(object):
+
+    def set_patterns(self, patterns):
+        pass
+
+
+class FakeModem(object):
+    """Modem with an in-memory message storage of 10 slots."""
+
+    def __init__(self, statuses):
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+        self.subscriptions = SubscriptionManager(self)
+        self.messages = dict((index, status)
+                             for index, status in enumerate(statuses))
+        self.stamps = {}
+        self.log = []
+
+    def get_message_storage_options(self):
+        return [['SM', 'ME'], ['SM', 'ME'], ['SM', 'ME']]
+
+    def set_message_storage(self, *storages):
+        return [[len(self.messages), 10]] * 3
+
+    def get_message_storage(self):
+        return [['ME', len(self.messages), 10]] * 3
+
+    def sms_list(self, message_type='ALL'):
+        return [[index, status, '+353861234567', '',
+                 self.stamps.get(index, '24/03/05,14:30:15+04')]
+                for index, status in sorted(self.messages.items())
+                if message_type in ('ALL', status)]
+
+    def sms_read(self, index):
+        self.log.append(('read', index))
+        if self.messages[index] == 'REC UNREAD':
+            self.messages[index] = 'REC READ'
+        return 'Text %d' % index
+
+    def sms_del(self, index, delflag=None):
+        self.log.append(('del', index, delflag))
+        if delflag == storage.DELETE_READ_AND_SENT:
+            for index, status in list(self.messages.items()):
+                if status in ('REC READ', 'STO SENT'):
+                    del self.messages[index]
+        else:
+            del self.messages[index]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(.01)
+
+
+class TestStorageManager(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem(['REC READ'] * 4 + ['STO SENT'] * 2 +
+                               ['REC UNREAD'] * 2)
+        self.archived = []
+        self.manager = storage.StorageManager(
+            self.modem, archive=lambda header, text:
+            self.archived.append((header[0], header[1], text)))
+
+    def test_select_fastest(self):
+        self.assertEqual('ME', self.manager.select_fastest())
+        self.assertEqual(.8, self.manager.fill())
+
+    def test_threshold_triggers_clean_up(self):
+        self.manager.refresh()
+        self.manager.used = 6
+        self.manager.new_message(self.modem, '+CMTI: "ME",8\r\n')
+        self.assertEqual(0, self.manager.archived)
+        self.manager.new_message(self.modem, '+CMTI: "ME",9\r\n')
+        wait_for(lambda: not self.manager._cleaning)
+        self.assertEqual(6, self.manager.archived)
+        self.assertEqual([6, 7], sorted(self.modem.messages))
+        self.assertEqual(.2, self.manager.fill())
+
+    def test_archive_then_delete(self):
+        self.assertTrue(self.manager.maintain())
+        self.assertEqual([(0, 'REC READ', 'Text 0'), (1, 'REC READ', 'Text 1'),
+                          (2, 'REC READ', 'Text 2'), (3, 'REC READ', 'Text 3'),
+                          (4, 'STO SENT', 'Text 4'), (5, 'STO SENT', 'Text 5')],
+                         self.archived)
+        self.assertEqual([('read', 0), ('del', 0, None)], self.modem.log[:2])
+        self.assertFalse(self.manager.maintain())
+
+    def test_bulk_delete_without_archive(self):
+        self.manager.archive = None
+        self.assertTrue(self.manager.maintain())
+        self.assertEqual([('del', 0, storage.DELETE_READ_AND_SENT)],
+                         self.modem.log)
+        self.assertEqual({6: 'REC UNREAD', 7: 'REC UNREAD'},
+                         self.modem.messages)
+
+    def test_unread_messages(self):
+        self.modem.messages = dict((index, 'REC UNREAD')
+                                   for index in range(9))
+        # Reused slots: 5 and 7 hold the oldest messages.
+        self.modem.stamps = {5: '24/03/01,09:00:00+04',
+                             7: '24/03/02,09:00:00+04',
+                             3: 'garbled'}
+        self.assertTrue(self.manager.maintain())
+        self.assertEqual(9, len(self.modem.messages))
+        self.manager.keep_unread = False
+        self.assertTrue(self.manager.maintain())
+        self.assertEqual([0, 1, 2, 3, 4, 6, 8], sorted(self.modem.messages))
+        self.assertEqual([5, 7], [index for index, _, _ in self.archived])
+        self.assertTrue(self.manager.fill() < self.manager.high_water)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import unittest
+from humod import actions
+from humod.subscriptions import SubscriptionManager
+
+
+class FakeProber(object):
+    patterns = None
+
+    def set_patterns(self, patterns):
+        self.patterns = patterns
+
+    def start(self, patterns):
+        self.patterns = patterns
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.prober = FakeProber()
+        self.calls = []
+        self.curc_release = threading.Event()
+        self.curc_release.set()
+
+    def enable_curc(self, status):
+        self.curc_release.wait(5)
+        self.calls.append(('curc', status))
+
+    def enable_nmi(self, status):
+        self.calls.append(('nmi', status))
+
+    def enable_clip(self, status):
+        self.calls.append(('clip', status))
+
+
+class TestSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.manager = SubscriptionManager(self.modem)
+
+    def test_idle_modem_is_silenced(self):
+        self.manager.start()
+        self.assertEqual([('clip', False), ('curc', False), ('nmi', False)],
+                         sorted(self.modem.calls))
+
+    def test_subscribe_switches_source_once(self):
+        self.manager.start()
+        del self.modem.calls[:]
+        received = []
+        handler = lambda modem, message: received.append(message)
+        self.manager.subscribe('rssi update', handler)
+        self.manager.subscribe('mode update', handler)
+        self.assertEqual([('curc', True)], self.modem.calls)
+        self.manager.unsubscribe('rssi update', handler)
+        self.assertEqual([('curc', True)], self.modem.calls)
+        self.manager.unsubscribe('mode update', handler)
+        self.assertEqual([('curc', True), ('curc', False)], self.modem.calls)
+
+    def test_commands_are_sent_unlocked(self):
+        self.manager.start()
+        del self.modem.calls[:]
+        self.modem.curc_release.clear()
+        handler = lambda modem, message: None
+        slow = threading.Thread(target=self.manager.subscribe,
+                                args=('rssi update', handler))
+        slow.start()
+        # The curc command hangs, other subscribers go on.
+        self.manager.subscribe('caller id', handler)
+        self.manager.subscribe('ussd', handler)
+        self.assertEqual([('clip', True)], self.modem.calls)
+        # Unsubscribing while the command hangs switches it off again.
+        undo = threading.Thread(target=self.manager.unsubscribe,
+                                args=('rssi update', handler))
+        undo.start()
+        self.modem.curc_release.set()
+        slow.join(5)
+        undo.join(5)
+        self.assertEqual(('curc', False), self.modem.calls[-1])
+
+    def test_dispatch_to_all_handlers(self):
+        received = []
+        self.manager.subscribe('new sms', lambda m, msg: received.append(1))
+        self.manager.subscribe('new sms', lambda m, msg: received.append(2))
+        for pattern, action in self.modem.prober.patterns:
+            if pattern is actions.PATTERN['new sms']:
+                action(self.modem, '+CMTI: "SM",1')
+        self.assertEqual([1, 2], received)
+
+
+if __name__ == "__main__":
+    unittest.main()
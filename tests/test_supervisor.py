@@ -0,0 +1,106 @@
+import subprocess
+import sys
+import time
+import unittest
+import humod.supervisor as supervisor
+from humod.humodem import ConnectionStatus
+
+
+class FakeModem(object):
+    """Modem stand-in dialing instantly and running a dummy pppd."""
+
+    def __init__(self):
+        self.status = ConnectionStatus()
+        self.dials = 0
+
+    def _dial(self, dialtone_check=True):
+        self.dials += 1
+        return True
+
+    def _pppd_args(self):
+        return [sys.executable, '-c', 'import time; time.sleep(30)']
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(.01)
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.supervisor = supervisor.ConnectionSupervisor(
+            self.modem, backoff=.01, backoff_max=.05)
+
+    def tearDown(self):
+        if self.supervisor._thread:
+            self.supervisor.stop()
+
+    def test_redial_when_pppd_dies(self):
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor._process is not None)
+        self.supervisor._process.kill()
+        wait_for(lambda: self.supervisor.reconnects == 1)
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        self.assertEqual(2, self.modem.dials)
+
+    def test_redial_on_lost_service(self):
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        self.supervisor.mode_update(self.modem, '^MODE:0,0\r\n')
+        wait_for(lambda: self.supervisor.reconnects == 1)
+
+    def test_watcher_sees_the_link_up(self):
+        seen = []
+
+        def watch(process):
+            seen.append((self.supervisor.state,
+                         self.supervisor._process is process))
+        self.supervisor._watch = watch
+        self.supervisor.start()
+        wait_for(lambda: seen)
+        self.assertEqual((supervisor.UP, True), seen[0])
+
+    def test_pppd_dying_at_once(self):
+        self.modem._pppd_args = lambda: [sys.executable, '-c', 'pass']
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor.reconnects >= 2)
+        self.assertTrue(self.modem.dials >= 3)
+
+    def test_backoff_starts_over_after_a_stable_link(self):
+        self.supervisor.stable_time = 0
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        self.supervisor._failures = 3
+        self.supervisor._process.kill()
+        wait_for(lambda: self.supervisor.reconnects == 1)
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        self.assertEqual(1, self.supervisor._failures)
+
+    def test_stale_watcher(self):
+        old = subprocess.Popen([sys.executable, '-c', 'pass'])
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        self.supervisor._watch(old)
+        self.assertFalse(self.supervisor._link_lost.is_set())
+        self.assertEqual(0, self.supervisor.reconnects)
+
+    def test_backoff_is_bounded(self):
+        delays = [self.supervisor._next_delay() for _ in range(5)]
+        self.assertEqual([.01, .02, .04, .05, .05], delays)
+
+    def test_stop(self):
+        self.supervisor.start()
+        wait_for(lambda: self.supervisor.state == supervisor.UP)
+        process = self.supervisor._process
+        self.supervisor.stop()
+        self.assertEqual(supervisor.DOWN, self.supervisor.state)
+        self.assertIsNotNone(process.poll())
+
+
+if __name__ == "__main__":
+    unittest.main()
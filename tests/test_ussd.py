@@ -0,0 +1,97 @@
+import threading
+import time
+import unittest
+from humod import errors
+from humod import ussd
+from humod.subscriptions import SubscriptionManager
+
+
+class FakePort(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def read_waiting(self):
+        return b''
+
+    def send_at(self, cmd, suffix, prefixed=True):
+        self.sent.append(cmd + suffix)
+        return []
+
+
+class FakeProber(object):
+
+    def set_patterns(self, patterns):
+        pass
+
+
+class FakeModem(object):
+
+    def __init__(self):
+        self.ctrl_port = FakePort()
+        self.ctrl_lock = threading.Lock()
+        self.prober = FakeProber()
+        self.subscriptions = SubscriptionManager(self)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out.')
+        time.sleep(.01)
+
+
+class TestUssd(unittest.TestCase):
+
+    def setUp(self):
+        self.modem = FakeModem()
+        self.client = ussd.UssdClient(self.modem, timeout=2)
+        self.sent = self.modem.ctrl_port.sent
+
+    def test_malformed_reports_are_dropped(self):
+        future = self.client.request('*100#')
+        wait_for(lambda: self.sent)
+        self.client.cusd_update(self.modem, '+CUSD: x,"Balance 5",15\r\n')
+        self.client.cusd_update(self.modem, '+CUSD: 0,"Balance 5",1y\r\n')
+        self.client.cusd_update(self.modem, '+CUSD:\r\n')
+        self.assertEqual(3, self.client.malformed)
+        self.assertFalse(future.done())
+        self.client.cusd_update(self.modem, '+CUSD: 0,"Balance 5",15\r\n')
+        self.assertEqual('Balance 5', future.result(1).text)
+
+    def test_requests_are_queued(self):
+        first = self.client.request('*100#')
+        second = self.client.request('*101#')
+        wait_for(lambda: self.sent)
+        self.client.cusd_update(self.modem, '+CUSD: 0,"Balance 5",15\r\n')
+        self.assertEqual('Balance 5', first.result(1).text)
+        wait_for(lambda: len(self.sent) == 2)
+        self.assertEqual(['+CUSD=1,"*100#",15', '+CUSD=1,"*101#",15'],
+                         self.sent)
+        self.assertFalse(second.done())
+
+    def test_menu_session(self):
+        response = self.client.request('*123#')
+        other = self.client.request('*100#')
+        wait_for(lambda: self.sent)
+        self.client.cusd_update(self.modem, '+CUSD: 1,"1. Top up",15\r\n')
+        menu = response.result(1)
+        self.assertTrue(menu.session_open)
+        step = menu.session.send('1')
+        wait_for(lambda: len(self.sent) == 2)
+        self.assertEqual('+CUSD=1,"1",15', self.sent[1])
+        self.client.cusd_update(self.modem, '+CUSD: 0,"00440061",72\r\n')
+        self.assertEqual('Da', step.result(1).text)
+        wait_for(lambda: len(self.sent) == 3)
+        self.assertFalse(other.done())
+
+    def test_timeout(self):
+        self.client.timeout = .05
+        future = self.client.request('*100#')
+        self.assertRaises(errors.UssdError, future.result, 1)
+        wait_for(lambda: '+CUSD=2' in self.sent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import threading
+import unittest
+from humod import actions
+from humod import errors
+from humod.humodem import ConnectionStatus
+from humod.workers import SharedConnectionStatus, StatusTable, WorkerPool
+
+
+class FakeModem(object):
+    """Modem stand-in, opened in the worker process."""
+
+    def __init__(self, data, ctrl):
+        if ctrl == 'missing':
+            raise errors.HumodUsageError('No such port.')
+        self.data, self.ctrl = data, ctrl
+        self.status = ConnectionStatus()
+
+    def show_model(self):
+        return 'E%s' % self.ctrl
+
+    def signal(self, rssi):
+        actions.rssi_update(self, '^RSSI:%d' % rssi)
+        actions.mode_update(self, '^MODE:5,5')
+
+    def fail(self):
+        raise errors.CmeError('+CME ERROR: 10')
+
+
+def ports(modem):
+    return modem.data, modem.ctrl
+
+
+class TestStatusTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StatusTable(2)
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_write_through(self):
+        status = SharedConnectionStatus(self.table, 1)
+        self.assertEqual(self.table.read(1)['mode'], None)
+        status.rssi = 21
+        status.bytes_rx, status.bytes_tx = 1 << 40, 7
+        status.mode = 'WCDMA/HSDPA'
+        record = self.table.read(1)
+        self.assertEqual(record['rssi'], 21)
+        self.assertEqual(record['bytes_rx'], 1 << 40)
+        self.assertEqual(record['bytes_tx'], 7)
+        self.assertEqual(record['mode'], 'WCDMA/HSDPA')
+        self.assertEqual(self.table.read(0)['rssi'], 0)
+
+    def test_long_mode_is_refused(self):
+        status = SharedConnectionStatus(self.table, 0)
+        status.mode = 'x' * 24
+        self.assertRaises(errors.HumodUsageError, setattr, status, 'mode',
+                          'x' * 25)
+        self.assertRaises(errors.HumodUsageError, status.update,
+                          mode='\u00e9' * 13)
+        self.assertEqual('x' * 24, status.mode)
+        self.assertEqual('x' * 24, self.table.read(0)['mode'])
+
+    def test_flow_report(self):
+        modem = FakeModem('d0', '1')
+        modem.status = SharedConnectionStatus(self.table, 0)
+        actions.flow_report_update(
+            modem, '^DSFLOWRPT:0000003C,00000100,00000200,00000400,'
+                   '00000800,0,0\r\n')
+        record = self.table.read(0)
+        self.assertEqual((record['link_uptime'], record['uplink'],
+                          record['downlink'], record['bytes_tx'],
+                          record['bytes_rx']), (60, 256, 512, 1024, 2048))
+
+    def test_attach(self):
+        SharedConnectionStatus(self.table, 0).rssi = 9
+        other = StatusTable(2, self.table.name)
+        try:
+            self.assertEqual(other.read(0)['rssi'], 9)
+        finally:
+            other.close()
+
+    def test_consistent_reads(self):
+        status = SharedConnectionStatus(self.table, 0)
+        done = []
+
+        def writer():
+            for value in range(20000):
+                status.uplink = status.downlink = value
+            done.append(True)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        while not done:
+            record = self.table.read(0)
+            self.assertTrue(record['downlink'] <= record['uplink'])
+            self.assertTrue(record['uplink'] - record['downlink'] <= 1)
+        thread.join()
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool({'a': ('d0', '1'), 'b': ('d1', '2')},
+                               probe=False, factory=FakeModem)
+        self.assertEqual(self.pool.start(), {})
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_call(self):
+        self.assertEqual(self.pool['a'].show_model(), 'E1')
+        self.assertEqual(self.pool['b'].call('show_model'), 'E2')
+        self.assertEqual(self.pool['b'].call(ports), ('d1', '2'))
+
+    def test_errors(self):
+        self.assertRaises(errors.CmeError, self.pool['a'].fail)
+        self.assertRaises(AttributeError, self.pool['a'].missing)
+        self.assertEqual(self.pool['a'].show_model(), 'E1')
+
+    def test_status(self):
+        self.pool['b'].signal(17)
+        self.assertEqual(self.pool.status('b')['rssi'], 17)
+        self.assertEqual(self.pool.status('b')['mode'], 'WCDMA/HSDPA')
+        self.assertEqual(self.pool.statuses()['a']['rssi'], 0)
+
+    def test_failed_start(self):
+        pool = WorkerPool({'c': ('d2', 'missing')}, probe=False,
+                          factory=FakeModem)
+        try:
+            failed = pool.start()
+        finally:
+            pool.stop()
+        self.assertTrue(isinstance(failed['c'], errors.HumodUsageError))
+        self.assertEqual(pool.workers, {})
+
+
+if __name__ == '__main__':
+    unittest.main()